@@ -0,0 +1,17 @@
+from app.schemas import SubmitRequest
+
+def batch_key(request: SubmitRequest) -> tuple:
+    """Jobs can share a worker invocation only if the pipeline is called with
+    the same parameters for all of them. Deduplicated clips are packed
+    with their own kind, since the dedup threshold changes what is run."""
+    return (request.engine, request.scale, request.num_inference_steps, request.guidance_scale, request.dedup_threshold)
+
+def group_compatible(requests: list[tuple[str, SubmitRequest]], max_batch: int) -> list[list[tuple[str, SubmitRequest]]]:
+    groups: dict[tuple, list] = {}
+    for job_id, request in requests:
+        groups.setdefault(batch_key(request), []).append((job_id, request))
+    batches = []
+    for members in groups.values():
+        for i in range(0, len(members), max_batch):
+            batches.append(members[i:i + max_batch])
+    return batches
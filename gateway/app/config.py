@@ -2,7 +2,8 @@ import os
 from pydantic import BaseModel
 
 class Settings(BaseModel):
-    api_key: str | None = os.environ.get("GATEWAY_API_KEY", None)
+    # Comma-separated; each key is its own tenant for rate limits and fair dispatch.
+    api_keys: list[str] = [key for key in os.environ.get("GATEWAY_API_KEY", "").split(",") if key]
     cors_allow_origins: list[str] = (
         os.environ.get("GATEWAY_CORS_ALLOW_ORIGINS", "*").split(",")
     )
@@ -13,11 +14,46 @@ class Settings(BaseModel):
     moderation_enabled: bool = os.environ.get("MODERATION_ENABLED", "1") == "1"
     moderation_threshold: int = int(os.environ.get("MODERATION_THRESHOLD", "80"))
     moderation_timeout: int = int(os.environ.get("MODERATION_TIMEOUT", "600"))
+    moderation_cache_enabled: bool = os.environ.get("MODERATION_CACHE_ENABLED", "1") == "1"
+    moderation_cache_ttl_seconds: int = int(os.environ.get("MODERATION_CACHE_TTL_SECONDS", "2592000"))
+    moderation_poll_seconds: float = float(os.environ.get("MODERATION_POLL_SECONDS", "5"))
+    moderation_sns_topic_arn: str | None = os.environ.get("MODERATION_SNS_TOPIC_ARN", None)
+    moderation_sns_role_arn: str | None = os.environ.get("MODERATION_SNS_ROLE_ARN", None)
 
     runpod_endpoint_id: str = os.environ.get("RUNPOD_ENDPOINT_ID", "ep")
     runpod_api_key: str = os.environ.get("RUNPOD_API_KEY", "rk")
+    runpod_base_url: str = os.environ.get("RUNPOD_BASE_URL", "https://api.runpod.ai/v2")
+    runpod_timeout_seconds: float = float(os.environ.get("RUNPOD_TIMEOUT_SECONDS", "60"))
+    runpod_max_connections: int = int(os.environ.get("RUNPOD_MAX_CONNECTIONS", "100"))
+    runpod_retries: int = int(os.environ.get("RUNPOD_RETRIES", "3"))
+    runpod_backoff_seconds: float = float(os.environ.get("RUNPOD_BACKOFF_SECONDS", "0.5"))
+    runpod_breaker_threshold: int = int(os.environ.get("RUNPOD_BREAKER_THRESHOLD", "5"))
+    runpod_breaker_cooldown_seconds: float = float(os.environ.get("RUNPOD_BREAKER_COOLDOWN_SECONDS", "30"))
+
+    result_cache_enabled: bool = os.environ.get("RESULT_CACHE_ENABLED", "1") == "1"
+    result_cache_ttl_seconds: int = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", "604800"))
+    result_cache_prefix: str = os.environ.get("RESULT_CACHE_PREFIX", "cache/")
+    result_cache_probe_timeout_seconds: float = float(os.environ.get("RESULT_CACHE_PROBE_TIMEOUT_SECONDS", "5"))
+
+    batch_max_jobs: int = int(os.environ.get("BATCH_MAX_JOBS", "8"))
+    submit_batch_max_items: int = int(os.environ.get("SUBMIT_BATCH_MAX_ITEMS", "100"))
+
+    dispatch_max_in_flight: int = int(os.environ.get("DISPATCH_MAX_IN_FLIGHT", "32"))
+    dispatch_max_queued: int = int(os.environ.get("DISPATCH_MAX_QUEUED", "1000"))
+    dispatch_cost_seconds: float = float(os.environ.get("DISPATCH_COST_SECONDS", "0.1"))
+    dispatch_slot_timeout_seconds: float = float(os.environ.get("DISPATCH_SLOT_TIMEOUT_SECONDS", "3600"))
+    dispatch_pump_seconds: float = float(os.environ.get("DISPATCH_PUMP_SECONDS", "30"))
+    dispatch_input_url_expire_seconds: int = int(os.environ.get("DISPATCH_INPUT_URL_EXPIRE_SECONDS", "3600"))
+    rate_limit_per_minute: float = float(os.environ.get("RATE_LIMIT_PER_MINUTE", "0"))
+    rate_limit_burst: int = int(os.environ.get("RATE_LIMIT_BURST", "20"))
+
+    longpoll_recheck_seconds: float = float(os.environ.get("LONGPOLL_RECHECK_SECONDS", "10"))
 
     ddb_table: str | None = os.environ.get("DDB_TABLE", None)
+    ddb_status_index: str = os.environ.get("DDB_STATUS_INDEX", "status-created_at-index")
+    jobs_list_max_limit: int = int(os.environ.get("JOBS_LIST_MAX_LIMIT", "200"))
+    job_cache_size: int = int(os.environ.get("JOB_CACHE_SIZE", "4096"))
+    job_cache_ttl_seconds: float = float(os.environ.get("JOB_CACHE_TTL_SECONDS", "2"))
     job_ttl_seconds: int = int(os.environ.get("JOB_TTL_SECONDS", "3600"))
     webhook_base_url: str = os.environ.get("WEBHOOK_BASE_URL", "")
     hmac_secret: str = os.environ.get("HMAC_SECRET", "change-me")
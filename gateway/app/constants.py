@@ -5,11 +5,56 @@ BLOCKED_CATEGORIES = (
     "Drugs"
 )
 
+ENGINES = (
+    "stablevsr",
+    "classic"
+)
+
+# Relative GPU cost per output pixel and step, used to order the dispatch queue.
+ENGINE_COST_WEIGHTS = {
+    "stablevsr": 1.0,
+    "classic": 0.05
+}
+
 CONTENT_TYPE_MP4 = "video/mp4"
 
 JOB_STATUSES = (
+    "MODERATING",
+    "QUEUED",
+    "SUBMITTED",
     "RUNNING",
     "REJECTED",
     "SUCCEEDED",
     "FAILED"
-)
\ No newline at end of file
+)
+
+TERMINAL_STATUSES = (
+    "SUCCEEDED",
+    "FAILED",
+    "REJECTED"
+)
+
+ACTIVE_STATUSES = (
+    "MODERATING",
+    "QUEUED",
+    "SUBMITTED",
+    "RUNNING"
+)
+
+PROGRESS_FIELDS = (
+    "stage",
+    "frames_done",
+    "frames_total",
+    "fps",
+    "eta_s"
+)
+
+# Status a job may move to -> statuses it may move from.
+JOB_TRANSITIONS = {
+    "QUEUED": ("MODERATING",),
+    "SUBMITTED": ("QUEUED",),
+    "RUNNING": ("SUBMITTED", "RUNNING"),
+    "SUCCEEDED": ("QUEUED", "SUBMITTED", "RUNNING"),
+    "FAILED": ("MODERATING", "QUEUED", "SUBMITTED", "RUNNING"),
+    "REJECTED": ("MODERATING", "SUBMITTED")
+}
\ No newline at end of file
@@ -1,12 +1,18 @@
-import os
 import time
+import uuid
 import hmac
 import boto3
 import hashlib
+import threading
+from decimal import Decimal
+from bisect import bisect_left, insort
+from collections import OrderedDict
 from typing import Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from botocore.exceptions import ClientError
 from app.config import settings
+from app.constants import JOB_STATUSES, JOB_TRANSITIONS
+from app.metrics import timed, job_transitions
 
 @dataclass
 class JobRow:
@@ -14,86 +20,336 @@ class JobRow:
     status: str
     input_url: str
     output_url: Optional[str] = None
+    object_key: Optional[str] = None
     runpod_id: Optional[str] = None
     output: Optional[dict] = None
     metrics: Optional[dict] = None
     error: Optional[str] = None
-    created_at: float = time.time()
-    updated_at: float = time.time()
+    cache_key: Optional[str] = None
+    progress: Optional[dict] = None
+    request: Optional[dict] = None
+    moderation: Optional[dict] = None
+    queue: Optional[dict] = None
+    tenant: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
 
     def to_dict(self):
         return asdict(self)
+
+def _to_ddb(value):
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: _to_ddb(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_ddb(v) for v in value]
+    return value
+
+def _from_ddb(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {k: _from_ddb(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_from_ddb(v) for v in value]
+    return value
+
+def _row_from_item(item: dict) -> JobRow:
+    return JobRow(**{k: _from_ddb(item[k]) for k in JobRow.__annotations__.keys() if k in item})
+
+def allowed_from(status: str) -> tuple[str, ...]:
+    return JOB_TRANSITIONS.get(status, ())
     
 class Jobs:
     def __init__(self):
         self._mem: dict[str, JobRow] = {}
+        self._cache: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._index: dict[str, list[tuple[float, str]]] = {}
+        self._rows: OrderedDict[str, tuple[float, JobRow]] = OrderedDict()
         self._ddb_table = None
         if settings.ddb_table:
             self._ddb = boto3.resource("dynamodb", region_name=settings.aws_region)
             self._ddb_table = self._ddb.Table(settings.ddb_table)
 
+    def _cache_get(self, job_id: str) -> Optional[JobRow]:
+        with self._lock:
+            hit = self._rows.get(job_id)
+            if hit is None:
+                return None
+            expires, row = hit
+            if expires < time.monotonic():
+                del self._rows[job_id]
+                return None
+            self._rows.move_to_end(job_id)
+            return row
+
+    def _cache_put(self, row: JobRow):
+        if settings.job_cache_size <= 0:
+            return
+        with self._lock:
+            self._rows[row.job_id] = (time.monotonic() + settings.job_cache_ttl_seconds, row)
+            self._rows.move_to_end(row.job_id)
+            while len(self._rows) > settings.job_cache_size:
+                self._rows.popitem(last=False)
+
+    def invalidate(self, job_id: str):
+        with self._lock:
+            self._rows.pop(job_id, None)
+
     def _put_ddb(self, row: JobRow):
         ttl = int(time.time()) + settings.job_ttl_seconds
-        item = row.to_dict()
+        item = _to_ddb(row.to_dict())
         item["ttl"] = ttl
-        self._ddb_table.put_item(Item=item)
+        self._ddb_table.put_item(Item=item, ConditionExpression="attribute_not_exists(job_id)")
 
     def _get_ddb(self, job_id: str) -> Optional[JobRow]:
         try:
             response = self._ddb_table.get_item(Key={"job_id": job_id})
-            item = response["Item"]
-            if not item:
-                return None
-            return JobRow(**{k: item[k] for k in JobRow.__annotations__.keys() if k in item})
         except ClientError:
             return None
+        item = response.get("Item")
+        if not item:
+            return None
+        return _row_from_item(item)
         
-    def _update_ddb(self, job_id: str, **fields):
-        row = self.__get_ddb(job_id)
-        if not row:
-            return
-        for k, v in fields.items():
-            setattr(row, k, v)
-        row.updated_at = time.time()
-        self._put_ddb(row)
-
-    def create(self, input_url: str, output_url: Optional[str]) -> JobRow:
-        job_id = hex(int(time.time()*1000))[2:]
-        row = JobRow(job_id=job_id, status="SUBMITTED", input_url=input_url, output_url=output_url)
+    def _update_ddb(self, job_id: str, **fields) -> bool:
+        fields["updated_at"] = time.time()
+        names = {}
+        values = {}
+        assignments = []
+        for i, (k, v) in enumerate(fields.items()):
+            names[f"#f{i}"] = k
+            values[f":v{i}"] = _to_ddb(v)
+            assignments.append(f"#f{i} = :v{i}")
+        condition = "attribute_exists(job_id)"
+        if "status" in fields:
+            allowed = allowed_from(fields["status"])
+            names["#status"] = "status"
+            placeholders = []
+            for i, prev in enumerate(allowed):
+                values[f":s{i}"] = prev
+                placeholders.append(f":s{i}")
+            condition += f" AND #status IN ({', '.join(placeholders)})" if placeholders else " AND attribute_not_exists(job_id)"
+        try:
+            self._ddb_table.update_item(
+                Key={"job_id": job_id},
+                UpdateExpression="SET " + ", ".join(assignments),
+                ConditionExpression=condition,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    @timed("create")
+    def create(self, input_url: str, output_url: Optional[str], cache_key: Optional[str] = None, status: str = "SUBMITTED", request: Optional[dict] = None, tenant: Optional[str] = None, object_key: Optional[str] = None) -> JobRow:
+        job_id = uuid.uuid4().hex
+        row = JobRow(job_id=job_id, status=status, input_url=input_url, output_url=output_url, object_key=object_key, cache_key=cache_key, request=request, tenant=tenant)
         if self._ddb_table:
             self._put_ddb(row)
+            self._cache_put(row)
         else:
-            self._mem[job_id] = row
+            with self._lock:
+                self._mem[job_id] = row
+                insort(self._index.setdefault(row.status, []), (row.created_at, job_id))
         return row
     
-    def update(self, job_id: str, **fields):
+    @timed("update")
+    def update(self, job_id: str, **fields) -> bool:
+        """Apply `fields` in a single write. A status change only applies if
+        the current status may move to it (see JOB_TRANSITIONS); returns
+        False when the job is missing or the transition is refused."""
         if self._ddb_table:
-            self._update_ddb(job_id, **fields)
-            return
-        row = self._mem.get(job_id)
-        if not row:
-            return
-        for k, v in fields.items():
-            setattr(row, k, v)
-        self.updated_at = time.time()
+            updated = self._update_ddb(job_id, **fields)
+            self.invalidate(job_id)
+        else:
+            updated = self._update_mem(job_id, **fields)
+        if updated and "status" in fields:
+            job_transitions.labels(fields["status"]).inc()
+        return updated
+
+    def _update_mem(self, job_id: str, **fields) -> bool:
+        with self._lock:
+            row = self._mem.get(job_id)
+            if not row:
+                return False
+            if "status" in fields and row.status not in allowed_from(fields["status"]):
+                return False
+            if "status" in fields and fields["status"] != row.status:
+                entries = self._index.get(row.status, [])
+                i = bisect_left(entries, (row.created_at, job_id))
+                if i < len(entries) and entries[i] == (row.created_at, job_id):
+                    del entries[i]
+                insort(self._index.setdefault(fields["status"], []), (row.created_at, job_id))
+            for k, v in fields.items():
+                setattr(row, k, v)
+            row.updated_at = time.time()
+        return True
 
+    @timed("get")
     def get(self, job_id: str) -> Optional[JobRow]:
         if self._ddb_table:
-            return self._get_ddb(job_id)
+            row = self._cache_get(job_id)
+            if row is None:
+                row = self._get_ddb(job_id)
+                if row is not None:
+                    self._cache_put(row)
+            return row
         return self._mem.get(job_id)
+
+    @timed("get_many")
+    def get_many(self, job_ids: list[str]) -> dict[str, JobRow]:
+        if not self._ddb_table:
+            return {job_id: self._mem[job_id] for job_id in job_ids if job_id in self._mem}
+        rows = {}
+        missing = []
+        for job_id in dict.fromkeys(job_ids):
+            row = self._cache_get(job_id)
+            if row is None:
+                missing.append(job_id)
+            else:
+                rows[job_id] = row
+        for i in range(0, len(missing), 100):
+            request = {settings.ddb_table: {"Keys": [{"job_id": job_id} for job_id in missing[i:i + 100]]}}
+            while request:
+                response = self._ddb.batch_get_item(RequestItems=request)
+                for item in response.get("Responses", {}).get(settings.ddb_table, []):
+                    row = _row_from_item(item)
+                    rows[row.job_id] = row
+                    self._cache_put(row)
+                request = response.get("UnprocessedKeys") or None
+        return rows
     
-    def mark_running(self, job_id: str, runpod_id: str | None):
-        self.update(job_id, status="RUNNING", runpod_id=runpod_id)
+    @timed("query")
+    def query(self, status: str | None = None, since: float | None = None, limit: int = 50, cursor: tuple[float, str] | None = None) -> tuple[list[JobRow], tuple[float, str] | None]:
+        """Newest-first page of jobs, optionally filtered by status and
+        created_at >= since. `cursor` is the (created_at, job_id) of the last
+        row of the previous page; the second value returned is the cursor for
+        the next page, or None when there are no more rows."""
+        statuses = [status] if status else list(JOB_STATUSES)
+        keys = []
+        for st in statuses:
+            if self._ddb_table:
+                keys += self._query_status_ddb(st, since, limit + 1, cursor)
+            else:
+                keys += self._query_status_mem(st, since, limit + 1, cursor)
+        keys.sort(key=lambda k: k[:2], reverse=True)
+        page = keys[:limit]
+        if self._ddb_table:
+            rows = [row for row in (self._row_from_key(k) for k in page) if row is not None]
+        else:
+            rows = [self._mem[job_id] for _, job_id, _ in page]
+        next_cursor = page[-1][:2] if len(keys) > limit else None
+        return rows, next_cursor
+
+    def _query_status_mem(self, status: str, since: float | None, limit: int, cursor: tuple[float, str] | None) -> list[tuple]:
+        with self._lock:
+            entries = self._index.get(status, [])
+            end = bisect_left(entries, cursor) if cursor else len(entries)
+            start = bisect_left(entries, (since, "")) if since is not None else 0
+            start = max(start, end - limit)
+            return [(t, job_id, None) for t, job_id in entries[start:end]]
+
+    def _query_status_ddb(self, status: str, since: float | None, limit: int, cursor: tuple[float, str] | None) -> list[tuple]:
+        names = {"#status": "status"}
+        values = {":status": status}
+        condition = "#status = :status"
+        if since is not None or cursor:
+            names["#created_at"] = "created_at"
+        if since is not None and cursor:
+            condition += " AND #created_at BETWEEN :since AND :before"
+            values.update({":since": _to_ddb(float(since)), ":before": _to_ddb(float(cursor[0]))})
+        elif since is not None:
+            condition += " AND #created_at >= :since"
+            values[":since"] = _to_ddb(float(since))
+        elif cursor:
+            condition += " AND #created_at <= :before"
+            values[":before"] = _to_ddb(float(cursor[0]))
+        kwargs = {
+            "IndexName": settings.ddb_status_index,
+            "KeyConditionExpression": condition,
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": values,
+            "ScanIndexForward": False
+        }
+        keys = []
+        while len(keys) < limit:
+            response = self._ddb_table.query(Limit=limit, **kwargs)
+            for item in response.get("Items", []):
+                key = (_from_ddb(item["created_at"]), item["job_id"])
+                if cursor and key >= tuple(cursor):
+                    continue
+                keys.append((*key, item))
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return keys[:limit]
 
-    def mark_failed(self, job_id: str, error: str):
-        self.update(job_id, status="FAILED", error=error)
+    def _row_from_key(self, key: tuple) -> Optional[JobRow]:
+        _, job_id, item = key
+        if item is not None and "input_url" in item:
+            return _row_from_item(item)
+        return self.get(job_id)
 
-    def update_from_result(self, job_id: str, ok: bool,output: dict | None, metrics: dict | None, error: str | None):
-        status = {
-            ok == True: "SUCCEEDED",
-            ok == False: "FAILED"
+    @timed("count")
+    def count(self, status: str) -> int:
+        if not self._ddb_table:
+            with self._lock:
+                return len(self._index.get(status, ()))
+        kwargs = {
+            "IndexName": settings.ddb_status_index,
+            "KeyConditionExpression": "#status = :status",
+            "ExpressionAttributeNames": {"#status": "status"},
+            "ExpressionAttributeValues": {":status": status},
+            "Select": "COUNT"
         }
-        self.update(job_id, status=status[True], output=output, metrics=metrics, error=error)
+        total = 0
+        while True:
+            response = self._ddb_table.query(**kwargs)
+            total += response["Count"]
+            if "LastEvaluatedKey" not in response:
+                return total
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def mark_running(self, job_id: str, runpod_id: str | None) -> bool:
+        return self.update(job_id, status="RUNNING", runpod_id=runpod_id)
+
+    def mark_failed(self, job_id: str, error: str) -> bool:
+        return self.update(job_id, status="FAILED", error=error)
+
+    def update_from_result(self, job_id: str, ok: bool,output: dict | None, metrics: dict | None, error: str | None) -> bool:
+        status = "SUCCEEDED" if ok else "FAILED"
+        return self.update(job_id, status=status, output=output, metrics=metrics, error=error)
+
+    def get_cache_entry(self, cache_key: str) -> Optional[dict]:
+        if self._ddb_table:
+            try:
+                response = self._ddb_table.get_item(Key={"job_id": f"cache#{cache_key}"})
+            except ClientError:
+                return None
+            item = response.get("Item")
+            if not item:
+                return None
+            return {k: _from_ddb(v) for k, v in item.items() if k not in ("job_id", "ttl")}
+        return self._cache.get(cache_key)
+
+    def put_cache_entry(self, entry: dict):
+        if self._ddb_table:
+            item = _to_ddb(dict(entry, job_id=f"cache#{entry['cache_key']}", ttl=entry["expires_at"]))
+            self._ddb_table.put_item(Item=item)
+            return
+        self._cache[entry["cache_key"]] = entry
+
+    def delete_cache_entry(self, cache_key: str):
+        if self._ddb_table:
+            self._ddb_table.delete_item(Key={"job_id": f"cache#{cache_key}"})
+            return
+        self._cache.pop(cache_key, None)
 
 def sign_hmac(secret: str, msg: str) -> str:
     return hmac.new(secret.encode(), msg.encode(), hashlib.sha256).hexdigest()
\ No newline at end of file
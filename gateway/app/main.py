@@ -1,19 +1,56 @@
-import time 
-import hmac
-import hashlib
-from fastapi import FastAPI, HTTPException, Header, Request
+import json
+import time
+import httpx
+import base64
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Header, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from starlette.concurrency import run_in_threadpool
+from botocore.exceptions import ClientError
 from app.config import settings
+from app.constants import ENGINES, JOB_STATUSES, PROGRESS_FIELDS, TERMINAL_STATUSES
 from app.schemas import (
     SubmitRequest, SubmitResponse, VSRRequest, VSRResponse,
-    StatusResponse, PresignUploadOut, PresignDownloadOut
+    StatusResponse, PresignUploadOut, PresignDownloadOut,
+    MultipartCreateOut, MultipartPartsRequest, MultipartPartsOut, MultipartPartUrl,
+    MultipartUploadedOut, MultipartPart, MultipartCompleteRequest, MultipartCompleteOut,
+    MultipartAbortRequest,
+    SubmitBatchRequest, SubmitBatchResponse,
+    StatusBatchRequest, StatusBatchResponse,
+    JobSummary, JobListResponse
 )
-from app.presign import presign_get, presign_put
-from app.moderation import moderate_video
-from app.vsr_client import run_vsr, RunpodError
-from app.jobs import Jobs, sign_hmac
+from app.presign import (
+    presign_get, presign_put, create_multipart_upload, presign_upload_part,
+    list_uploaded_parts, complete_multipart_upload, abort_multipart_upload
+)
+from app.moderation import start_moderation, collect_moderation, ModerationCache
+from app.vsr_client import run_vsr, run_vsr_batch, runpod, RunpodError
+from app.jobs import Jobs, JobRow, sign_hmac
+from app.batching import group_compatible
+from app.notify import JobNotifier, LocalPubSub, wait_for
+from app.result_cache import ResultCache
+from app import metrics
+from app.scheduler import Scheduler, RateLimiter, QueueFullError, RateLimitedError, tenant_id, estimate_cost, retry_after_header
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(scheduler.recover)
+    # Pollers are in-process tasks, so jobs that were MODERATING when the
+    # gateway stopped need new ones; SNS notifications sent while we were
+    # down are not replayed either.
+    watchers = [asyncio.create_task(watch_moderation(job_id, moderation_id)) for job_id, moderation_id in await run_in_threadpool(recover_moderation)]
+    await scheduler.pump()
+    pumper = asyncio.create_task(scheduler.pump_every(settings.dispatch_pump_seconds))
+    yield
+    pumper.cancel()
+    for task in watchers:
+        task.cancel()
+    await runpod.aclose()
 
-app = FastAPI(title="Valence Gateway")
+app = FastAPI(title="Valence Gateway", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,9 +61,33 @@ app.add_middleware(
 )
 
 jobs = Jobs()
+result_cache = ResultCache(jobs)
+moderation_cache = ModerationCache(jobs)
+pubsub = LocalPubSub()
+# Drop our cached row before waking local waiters, so updates written by
+# another replica are visible as soon as they are announced.
+pubsub.subscribe(lambda channel, job_id: jobs.invalidate(job_id))
+notifier = JobNotifier(pubsub)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, to keep job ids out of the series.
+        route = request.scope.get("route")
+        metrics.request_seconds.labels(request.method, getattr(route, "path", "unmatched"), str(status)).observe(time.perf_counter() - t0)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 def auth(x_api_key: str):
-    if settings.api_key and x_api_key != settings.api_key:
+    if settings.api_keys and x_api_key not in settings.api_keys:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
 @app.get("/health")
@@ -45,70 +106,511 @@ def presign_download(object_key: str, x_api_key: str | None = Header(None)):
     url = presign_get(object_key)
     return PresignDownloadOut(download_url=url)
 
-@app.post("/submit", response_model=SubmitResponse)
-def submit(request: SubmitRequest, x_api_key: str | None = Header(None)):
+# Multipart uploads: create, presign a batch of part URLs, then complete or
+# abort. Clients resume a dropped upload by listing the parts S3 already
+# holds and uploading only the missing ones.
+def s3_error(e: ClientError) -> HTTPException:
+    code = e.response["Error"]["Code"]
+    status = 404 if code in ("NoSuchUpload", "NoSuchKey") else 400
+    return HTTPException(status_code=status, detail=code)
+
+@app.post("/presign/multipart/create", response_model=MultipartCreateOut)
+def presign_multipart_create(object_key: str, x_api_key: str | None = Header(None)):
     auth(x_api_key)
+    try:
+        upload_id = create_multipart_upload(object_key)
+    except ClientError as e:
+        raise s3_error(e)
+    return MultipartCreateOut(object_key=object_key, upload_id=upload_id)
+
+@app.post("/presign/multipart/parts", response_model=MultipartPartsOut)
+def presign_multipart_parts(request: MultipartPartsRequest, x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    if any(not 1 <= n <= 10000 for n in request.part_numbers):
+        raise HTTPException(status_code=400, detail="Part numbers must be between 1 and 10000")
+    return MultipartPartsOut(parts=[
+        MultipartPartUrl(part_number=n, upload_url=presign_upload_part(request.object_key, request.upload_id, n))
+        for n in request.part_numbers
+    ])
+
+@app.get("/presign/multipart/parts", response_model=MultipartUploadedOut)
+def presign_multipart_uploaded(object_key: str, upload_id: str, x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    try:
+        parts = list_uploaded_parts(object_key, upload_id)
+    except ClientError as e:
+        raise s3_error(e)
+    return MultipartUploadedOut(parts=[MultipartPart(**p) for p in parts])
+
+@app.post("/presign/multipart/complete", response_model=MultipartCompleteOut)
+def presign_multipart_complete(request: MultipartCompleteRequest, x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    try:
+        etag = complete_multipart_upload(request.object_key, request.upload_id, [p.model_dump() for p in request.parts])
+    except ClientError as e:
+        raise s3_error(e)
+    return MultipartCompleteOut(object_key=request.object_key, etag=etag)
+
+@app.post("/presign/multipart/abort")
+def presign_multipart_abort(request: MultipartAbortRequest, x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    try:
+        abort_multipart_upload(request.object_key, request.upload_id)
+    except ClientError as e:
+        raise s3_error(e)
+    return {"ok": True}
+
+def create_job(request: SubmitRequest, tenant: str = "anonymous") -> tuple[JobRow, str | None, bool]:
+    """Create the job row for `request`. Jobs ready to run come back QUEUED
+    for the scheduler; uploads that need moderation come back MODERATING
+    and are queued later by finish_moderation. Uploaded inputs are kept as
+    their object key and only presigned at dispatch (see input_url_for)."""
+    if request.engine not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown engine {request.engine!r}")
     if request.input_url:
         input_url = str(request.input_url)
     elif request.object_key:
-        if settings.moderation_enabled:
-            ok, hits = moderate_video(request.object_key)
-            if not ok:
-                raise HTTPException(status_code=415, detail={"message": "Content rejected", "hits": hits})
-        input_url = presign_get(request.object_key)
+        input_url = f"s3://{settings.bucket}/{request.object_key}"
     else:
         raise HTTPException(status_code=400, detail="Object key or input URL is required")
     
     output_url = str(request.output_url) if request.output_url else None
-    job = jobs.create(input_url=input_url, output_url=output_url)
+    moderate = bool(request.object_key and settings.moderation_enabled)
+    source = None
+    if settings.result_cache_enabled or (moderate and settings.moderation_cache_enabled):
+        source = ResultCache.source_id(request.object_key, str(request.input_url) if request.input_url else None)
+    cache_key = None
+    if settings.result_cache_enabled and source:
+        cache_key = ResultCache.make_key(source, request.scale, request.num_inference_steps, request.guidance_scale, engine=request.engine, dedup_threshold=request.dedup_threshold, fps=request.fps, metrics_mode=request.metrics_mode, reference_url=str(request.reference_url) if request.reference_url else None)
+
+    if moderate:
+        moderation = {}
+        verdict = None
+        if settings.moderation_cache_enabled and source:
+            moderation["cache_key"] = ModerationCache.make_key(source, settings.moderation_threshold)
+            verdict = moderation_cache.lookup(moderation["cache_key"])
+        if verdict is None or not verdict[0]:
+            job = jobs.create(input_url=input_url, output_url=output_url, cache_key=cache_key, status="MODERATING", request=request.model_dump(mode="json"), tenant=tenant, object_key=request.object_key)
+            if verdict is not None:
+                job.moderation = dict(moderation, hits=verdict[1], cache="hit")
+                jobs.update(job.job_id, status="REJECTED", error="Content rejected", moderation=job.moderation)
+                job.status = "REJECTED"
+                return job, cache_key, False
+            try:
+                moderation["id"] = start_moderation(request.object_key, job_tag=job.job_id)
+            except ClientError as e:
+                jobs.mark_failed(job_id=job.job_id, error=f"Moderation failed to start: {e}")
+                raise HTTPException(status_code=502, detail="Moderation failed to start")
+            jobs.update(job.job_id, moderation=moderation)
+            job.moderation = moderation
+            return job, cache_key, False
 
+    # A hit here can only hand back the cached object itself; a caller who
+    # named an output_url gets the worker's restore, which copies it there.
+    if cache_key and not output_url:
+        cached = result_cache.lookup(cache_key)
+        if cached:
+            output, cached_metrics = cached
+            job = jobs.create(input_url=input_url, output_url=output_url, cache_key=cache_key, tenant=tenant, object_key=request.object_key)
+            jobs.update_from_result(job.job_id, ok=True, output=output, metrics=cached_metrics, error=None)
+            return job, cache_key, True
+
+    job = jobs.create(input_url=input_url, output_url=output_url, cache_key=cache_key, status="QUEUED", request=request.model_dump(mode="json"), tenant=tenant, object_key=request.object_key)
+    return job, cache_key, False
+
+def input_url_for(job: JobRow) -> str:
+    """URL the worker downloads the input from. Uploads are presigned here,
+    right before dispatch: a URL minted at submit time would expire while
+    the job waits in moderation or the dispatch queue."""
+    if job.object_key:
+        return presign_get(job.object_key, expire=settings.dispatch_input_url_expire_seconds)
+    return job.input_url
+
+async def dispatch(job: JobRow, request: SubmitRequest, input_url: str, cache_key: str | None):
     sig = sign_hmac(settings.hmac_secret,job.job_id)
     webhook = f"{settings.webhook_base_url}/webhook/runpod?job_id={job.job_id}&sig={sig}"
+    progress = f"{settings.webhook_base_url}/webhook/progress?job_id={job.job_id}&sig={sig}"
 
     try:
-        vsr_job = run_vsr(
+        vsr_job = await run_vsr(
             input_url,
             webhook,
-            output_url,
+            job.output_url,
             request.scale,
             request.fps,
             request.num_inference_steps,
             request.metrics_mode,
-            request.reference_url
+            request.reference_url,
+            cache_url=result_cache.object_url(cache_key) if cache_key else None,
+            engine=request.engine,
+            progress_url=progress,
+            dedup_threshold=request.dedup_threshold,
+            guidance_scale=request.guidance_scale
         )
-        jobs.mark_running(job_id=job.job_id, runpod_id=vsr_job["id"])
     except RunpodError as e:
-        jobs.mark_failed(job_id=job.job_id, error=str(e))
+        await run_in_threadpool(jobs.mark_failed, job_id=job.job_id, error=str(e))
         raise HTTPException(status_code=502, detail=str(e))
-    
+    await run_in_threadpool(jobs.mark_running, job_id=job.job_id, runpod_id=vsr_job["id"])
+
+async def dispatch_batch(group: list[tuple[JobRow, SubmitRequest, str]]) -> bool:
+    job_ids = ",".join(job.job_id for job, _, _ in group)
+    sig = sign_hmac(settings.hmac_secret, job_ids)
+    webhook = f"{settings.webhook_base_url}/webhook/runpod/batch?job_ids={job_ids}&sig={sig}"
+    first = group[0][1]
+    items = []
+    for job, request, input_url in group:
+        job_sig = sign_hmac(settings.hmac_secret, job.job_id)
+        item = {
+            "job_id": job.job_id,
+            "video_url": input_url,
+            "output_url": job.output_url,
+            "fps": request.fps,
+            "progress_url": f"{settings.webhook_base_url}/webhook/progress?job_id={job.job_id}&sig={job_sig}"
+        }
+        if request.metrics_mode:
+            item["metrics_mode"] = request.metrics_mode
+        if request.reference_url:
+            item["reference_url"] = str(request.reference_url)
+        if request.dedup_threshold is not None:
+            item["dedup_threshold"] = request.dedup_threshold
+        if job.cache_key:
+            item["cache_url"] = result_cache.object_url(job.cache_key)
+        items.append(item)
+    try:
+        vsr_job = await run_vsr_batch(items, webhook, first.scale, first.fps, first.num_inference_steps, first.guidance_scale, first.engine)
+    except RunpodError as e:
+        await run_in_threadpool(mark_all, group, jobs.mark_failed, error=str(e))
+        return False
+    await run_in_threadpool(mark_all, group, jobs.mark_running, runpod_id=vsr_job["id"])
+    return True
+
+def mark_all(group: list[tuple[JobRow, SubmitRequest, str]], mark, **fields):
+    for job, _, _ in group:
+        mark(job_id=job.job_id, **fields)
+
+async def dispatch_jobs(job_ids: list[str], batch: bool) -> bool:
+    """Scheduler callback: send claimed jobs to RunPod as one RunPod job."""
+    rows = await run_in_threadpool(jobs.get_many, job_ids)
+    group = [(rows[job_id], SubmitRequest(**rows[job_id].request), input_url_for(rows[job_id])) for job_id in job_ids if job_id in rows]
+    if not batch and len(group) == 1:
+        job, request, input_url = group[0]
+        try:
+            await dispatch(job, request, input_url, job.cache_key)
+        except HTTPException:
+            return False
+        return True
+    return bool(group) and await dispatch_batch(group)
+
+scheduler = Scheduler(jobs, dispatch_jobs)
+rate_limiter = RateLimiter(settings.rate_limit_per_minute, settings.rate_limit_burst)
+metrics.collector.bind(jobs, scheduler, results=result_cache, moderation=moderation_cache)
+
+def admit(tenant: str, count: int):
+    """Per-API-key rate limit and queue capacity, checked before any job
+    row is written."""
+    try:
+        rate_limiter.acquire(tenant, count)
+    except RateLimitedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+    if not scheduler.has_room(count):
+        raise HTTPException(status_code=503, detail="Dispatch queue is full", headers={"Retry-After": "30"})
+
+def enqueue(job_ids: list[str], tenant: str, cost: float, batch: bool = False) -> bool:
+    try:
+        scheduler.enqueue(job_ids, tenant, cost, batch)
+    except QueueFullError as e:
+        for job_id in job_ids:
+            jobs.mark_failed(job_id=job_id, error=str(e))
+        return False
+    return True
+
+async def finish_moderation(job_id: str, ok: bool, hits: list[dict]):
+    """Apply a moderation verdict: reject the job, or move it on to the
+    result cache / dispatch queue exactly as /submit would have. The
+    MODERATING -> QUEUED transition is conditional, so a verdict delivered
+    twice (SNS retries, several replicas) only queues the job once."""
+    row = await run_in_threadpool(jobs.get, job_id)
+    if row is None or row.status != "MODERATING":
+        return
+    moderation = dict(row.moderation or {}, hits=hits)
+    if moderation.get("cache_key"):
+        await run_in_threadpool(moderation_cache.record, moderation["cache_key"], ok, hits)
+    if not ok:
+        await run_in_threadpool(jobs.update, job_id, status="REJECTED", error="Content rejected", moderation=moderation)
+        notifier.publish(job_id)
+        return
+    if not await run_in_threadpool(jobs.update, job_id, status="QUEUED", moderation=moderation):
+        return
+    cached = await run_in_threadpool(result_cache.lookup, row.cache_key) if row.cache_key and not row.output_url else None
+    if cached:
+        output, cached_metrics = cached
+        await run_in_threadpool(jobs.update_from_result, job_id, ok=True, output=output, metrics=cached_metrics, error=None)
+    elif await run_in_threadpool(enqueue, [job_id], row.tenant or "anonymous", estimate_cost(SubmitRequest(**row.request))):
+        await scheduler.pump()
+    notifier.publish(job_id)
+
+def recover_moderation() -> list[tuple[str, str]]:
+    """(job_id, moderation id) of every job still waiting on Rekognition."""
+    pending = []
+    cursor = None
+    while True:
+        rows, cursor = jobs.query(status="MODERATING", limit=100, cursor=cursor)
+        pending += [(row.job_id, row.moderation["id"]) for row in rows if (row.moderation or {}).get("id")]
+        if cursor is None:
+            return pending
+
+async def watch_moderation(job_id: str, moderation_id: str):
+    """Local stand-in for the SNS completion notification: poll Rekognition
+    from the event loop, holding no worker thread between polls."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.moderation_timeout
+    while True:
+        try:
+            verdict = await run_in_threadpool(collect_moderation, moderation_id, settings.moderation_threshold)
+        except ClientError as e:
+            verdict = False, [{"Name": e.response["Error"]["Code"], "Confidence": 100.0}]
+        if verdict is None and loop.time() >= deadline:
+            verdict = False, [{"Name": "TIMEOUT", "Confidence": 100.0}]
+        if verdict is not None:
+            await finish_moderation(job_id, *verdict)
+            return
+        await asyncio.sleep(settings.moderation_poll_seconds)
+
+def schedule_moderation(background_tasks: BackgroundTasks, job: JobRow):
+    if settings.moderation_sns_topic_arn and settings.moderation_sns_role_arn:
+        return
+    background_tasks.add_task(watch_moderation, job.job_id, job.moderation["id"])
+
+@app.post("/submit", response_model=SubmitResponse)
+async def submit(request: SubmitRequest, background_tasks: BackgroundTasks, x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    tenant = tenant_id(x_api_key)
+    admit(tenant, 1)
+    job, cache_key, cached = await run_in_threadpool(create_job, request, tenant)
+    if cached:
+        return SubmitResponse(job_id=job.job_id, status="SUCCEEDED")
+    if job.status == "REJECTED":
+        return SubmitResponse(job_id=job.job_id, status="REJECTED")
+    if job.status == "MODERATING":
+        schedule_moderation(background_tasks, job)
+        return SubmitResponse(job_id=job.job_id, status="MODERATING")
+    if not await run_in_threadpool(enqueue, [job.job_id], tenant, estimate_cost(request)):
+        raise HTTPException(status_code=503, detail="Dispatch queue is full", headers={"Retry-After": "30"})
+    await scheduler.pump()
+    if scheduler.is_queued(job.job_id):
+        return SubmitResponse(job_id=job.job_id, status="QUEUED")
+    row = await run_in_threadpool(jobs.get, job.job_id)
+    if row and row.status == "FAILED":
+        raise HTTPException(status_code=502, detail=row.error)
     return SubmitResponse(job_id=job.job_id)
 
+@app.post("/submit/batch", response_model=SubmitBatchResponse)
+async def submit_batch(request: SubmitBatchRequest, background_tasks: BackgroundTasks, x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    if len(request.items) > settings.submit_batch_max_items:
+        raise HTTPException(status_code=400, detail=f"At most {settings.submit_batch_max_items} jobs per batch")
+    tenant = tenant_id(x_api_key)
+    admit(tenant, len(request.items))
+    created = await asyncio.gather(*(run_in_threadpool(create_job, item, tenant) for item in request.items))
+    statuses = {}
+    pending = {}
+    for item, (job, _, cached) in zip(request.items, created):
+        statuses[job.job_id] = "SUCCEEDED" if cached else job.status
+        if job.status == "MODERATING":
+            # Approved items are queued one by one as their verdicts land.
+            schedule_moderation(background_tasks, job)
+        elif job.status == "QUEUED":
+            pending[job.job_id] = item
+    for group in group_compatible(list(pending.items()), settings.batch_max_jobs):
+        await run_in_threadpool(enqueue, [job_id for job_id, _ in group], tenant, sum(estimate_cost(item) for _, item in group), batch=True)
+    await scheduler.pump()
+    # Groups that did not fit in the queue, or whose dispatch failed, are
+    # already FAILED; everything else is either still queued or on RunPod.
+    rows = await run_in_threadpool(jobs.get_many, [job_id for job_id in pending if not scheduler.is_queued(job_id)])
+    for job_id in pending:
+        row = rows.get(job_id)
+        if row is None:
+            statuses[job_id] = "QUEUED"
+        else:
+            statuses[job_id] = row.status if row.status in TERMINAL_STATUSES else "SUBMITTED"
+    return SubmitBatchResponse(jobs=[SubmitResponse(job_id=job_id, status=status) for job_id, status in statuses.items()])
+
+@app.post("/status/batch", response_model=StatusBatchResponse)
+async def status_batch(request: StatusBatchRequest, x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    rows = await run_in_threadpool(jobs.get_many, request.job_ids)
+    return StatusBatchResponse(
+        jobs=[StatusResponse(**rows[job_id].to_dict()) for job_id in request.job_ids if job_id in rows],
+        missing=[job_id for job_id in request.job_ids if job_id not in rows]
+    )
+
+def encode_cursor(cursor: tuple[float, str] | None) -> str | None:
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
+
+def decode_cursor(cursor: str | None) -> tuple[float, str] | None:
+    if not cursor:
+        return None
+    try:
+        created_at, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(job_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/jobs", response_model=JobListResponse)
+def list_jobs(status: str | None = None, since: float | None = None, limit: int = 50, cursor: str | None = None, x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    if status is not None and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Unknown status {status!r}")
+    if not 1 <= limit <= settings.jobs_list_max_limit:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {settings.jobs_list_max_limit}")
+    rows, next_cursor = jobs.query(status=status, since=since, limit=limit, cursor=decode_cursor(cursor))
+    return JobListResponse(jobs=[JobSummary(**row.to_dict()) for row in rows], next_cursor=encode_cursor(next_cursor))
+
 @app.get("/status/{job_id}", response_model=StatusResponse)
-def status(job_id: str, wait_ms: int | None = 0, x_api_key: str | None = Header(None)):
+async def status(job_id: str, wait_ms: int | None = 0, x_api_key: str | None = Header(None)):
     auth(x_api_key)
-    deadline = time.time() + (wait_ms or 0)/1000.0
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (wait_ms or 0)/1000.0
     while True:
-        item = jobs.get(job_id)
-        if item and item.status in ("SUCCEEDED", "FAILED", "REJECTED"):
-            return StatusResponse(**item.to_dict())
-        if wait_ms and time.time() < deadline:
-            time.sleep(1)
-            continue
-        if item:
-            return StatusResponse(**item.to_dict())
-        raise HTTPException(status_code=404, detail="Job not found")
+        with notifier.subscribe(job_id) as updated:
+            item = await run_in_threadpool(jobs.get, job_id)
+            if item and item.status in TERMINAL_STATUSES:
+                return StatusResponse(**item.to_dict())
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Re-read the store now and then in case the webhook landed on a
+            # replica that is not wired to our pub/sub channel.
+            await wait_for(updated, min(remaining, settings.longpoll_recheck_seconds))
+    if item:
+        return StatusResponse(**item.to_dict())
+    raise HTTPException(status_code=404, detail="Job not found")
     
+def store_result(job_id: str, ok: bool, output: dict | None, job_metrics: dict | None, error: str | None):
+    """Write a worker result; a successful cacheable job also indexes the
+    output the worker copied to its cache_url."""
+    jobs.update_from_result(job_id, ok=ok, output=output, metrics=job_metrics, error=error)
+    if ok:
+        row = jobs.get(job_id)
+        if row and row.cache_key:
+            result_cache.record(row.cache_key, job_metrics)
+
+def store_batch_results(allowed: set[str], body: dict):
+    """store_result for each job of a batch; jobs the worker left out fail."""
+    seen = set()
+    for result in body.get("results") or []:
+        job_id = result.get("job_id")
+        if job_id not in allowed or job_id in seen:
+            continue
+        seen.add(job_id)
+        store_result(job_id, result.get("status") == "ok", result.get("info"), result.get("metrics"), result.get("error"))
+    for job_id in allowed - seen:
+        store_result(job_id, False, None, None, body.get("error") or "Missing from batch result")
+
 @app.post("/webhook/runpod")
-async def webhook_runpod(request: Request):
+async def webhook_runpod(request: Request, background_tasks: BackgroundTasks):
+    qs = dict(request.query_params)
+    job_id, sig = qs.get("job_id"), qs.get("sig")
+    if not job_id or not sig or sig != sign_hmac(settings.hmac_secret, job_id):
+        raise HTTPException(status_code=401, detail="Bad signature")
+    body = await request.json()
+    await run_in_threadpool(store_result, job_id, body.get("status") == "ok", body.get("output"), body.get("metrics"), body.get("error"))
+    notifier.publish(job_id)
+    scheduler.release(job_id)
+    # Dispatching the next jobs can take RunPod retries and backoff; answer
+    # the webhook first.
+    background_tasks.add_task(scheduler.pump)
+    return {"ok": True}
+
+@app.post("/webhook/moderation")
+async def webhook_moderation(request: Request):
+    """SNS subscription for Rekognition completion notifications. The
+    subscription URL carries sig=HMAC("moderation") since SNS cannot sign
+    per-job URLs."""
+    sig = request.query_params.get("sig")
+    if not sig or sig != sign_hmac(settings.hmac_secret, "moderation"):
+        raise HTTPException(status_code=401, detail="Bad signature")
+    envelope = json.loads(await request.body())
+    if envelope.get("Type") == "SubscriptionConfirmation":
+        await run_in_threadpool(httpx.get, envelope["SubscribeURL"], timeout=10)
+        return {"ok": True}
+    message = json.loads(envelope.get("Message") or "{}")
+    job_id, moderation_id = message.get("JobTag"), message.get("JobId")
+    row = await run_in_threadpool(jobs.get, job_id) if job_id else None
+    if row is None or (row.moderation or {}).get("id") != moderation_id:
+        return {"ok": False}
+    verdict = await run_in_threadpool(collect_moderation, moderation_id, settings.moderation_threshold)
+    if verdict is not None:
+        await finish_moderation(job_id, *verdict)
+    return {"ok": True}
+
+@app.post("/webhook/progress")
+async def webhook_progress(request: Request):
     qs = dict(request.query_params)
     job_id, sig = qs.get("job_id"), qs.get("sig")
     if not job_id or not sig or sig != sign_hmac(settings.hmac_secret, job_id):
         raise HTTPException(status_code=401, detail="Bad signature")
     body = await request.json()
-    status = body.get("status")
-    ok = status == "ok"
-    output = body.get("output")
-    metrics = body.get("metrics")
-    error = body.get("error")
-    jobs.update_from_result(job_id, ok=ok, output=output, metrics=metrics, error=error)
-    return {"ok": True}
\ No newline at end of file
+    progress = {k: body.get(k) for k in PROGRESS_FIELDS}
+    await run_in_threadpool(jobs.update, job_id, progress=progress)
+    notifier.publish(job_id)
+    return {"ok": True}
+
+@app.get("/events/{job_id}")
+async def events(job_id: str, x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    item = await run_in_threadpool(jobs.get, job_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        last = None
+        while True:
+            with notifier.subscribe(job_id) as updated:
+                item = await run_in_threadpool(jobs.get, job_id)
+                if item is None:
+                    return
+                state = (item.status, item.progress)
+                if state != last:
+                    last = state
+                    data = {"status": item.status, "progress": item.progress}
+                    yield f"event: progress\ndata: {json.dumps(data)}\n\n"
+                if item.status in TERMINAL_STATUSES:
+                    yield f"event: done\ndata: {json.dumps(StatusResponse(**item.to_dict()).model_dump())}\n\n"
+                    return
+                if not await wait_for(updated, settings.longpoll_recheck_seconds):
+                    yield ": keep-alive\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/webhook/runpod/batch")
+async def webhook_runpod_batch(request: Request, background_tasks: BackgroundTasks):
+    qs = dict(request.query_params)
+    job_ids, sig = qs.get("job_ids"), qs.get("sig")
+    if not job_ids or not sig or sig != sign_hmac(settings.hmac_secret, job_ids):
+        raise HTTPException(status_code=401, detail="Bad signature")
+    allowed = set(job_ids.split(","))
+    body = await request.json()
+    await run_in_threadpool(store_batch_results, allowed, body)
+    for job_id in allowed:
+        notifier.publish(job_id)
+        scheduler.release(job_id)
+    background_tasks.add_task(scheduler.pump)
+    return {"ok": True}
+
+@app.get("/queue/stats")
+def queue_stats(x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    return scheduler.stats()
+
+@app.get("/runpod/stats")
+def runpod_stats(x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    return runpod.stats()
+
+@app.get("/cache/stats")
+def cache_stats(x_api_key: str | None = Header(None)):
+    auth(x_api_key)
+    return dict(result_cache.stats(), moderation=moderation_cache.stats())
\ No newline at end of file
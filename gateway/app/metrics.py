@@ -0,0 +1,72 @@
+import time
+from functools import wraps
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from app.constants import ACTIVE_STATUSES
+
+request_seconds = Histogram(
+    "valence_gateway_request_seconds", "HTTP request latency by route",
+    ["method", "route", "status"]
+)
+runpod_seconds = Histogram(
+    "valence_gateway_runpod_request_seconds", "Latency of each RunPod /run attempt",
+    ["outcome"]
+)
+runpod_retries = Counter("valence_gateway_runpod_retries_total", "RunPod /run attempts that were retries")
+store_seconds = Histogram(
+    "valence_gateway_store_seconds", "Latency of Jobs store operations",
+    ["op"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+job_transitions = Counter("valence_gateway_job_transitions_total", "Job status changes written", ["status"])
+breaker_open = Gauge("valence_gateway_runpod_breaker_open", "1 while the RunPod circuit breaker is open")
+
+def timed(op: str):
+    """Record a Jobs store method's latency under `op`."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                store_seconds.labels(op).observe(time.perf_counter() - t0)
+        return wrapper
+    return decorator
+
+class GatewayCollector:
+    """Scrape-time gauges: jobs per active status, the dispatch queue and
+    cache hit counts. Bound to the app's objects by main; rebinding (as
+    tests do when reloading main) replaces the previous sources."""
+
+    def __init__(self):
+        self.jobs = None
+        self.scheduler = None
+        self.caches = {}
+
+    def bind(self, jobs, scheduler, **caches):
+        self.jobs = jobs
+        self.scheduler = scheduler
+        self.caches = caches
+
+    def collect(self):
+        if self.jobs is not None:
+            jobs = GaugeMetricFamily("valence_gateway_jobs", "Jobs currently in each active status", labels=["status"])
+            for status in ACTIVE_STATUSES:
+                jobs.add_metric([status], self.jobs.count(status))
+            yield jobs
+        if self.scheduler is not None:
+            stats = self.scheduler.stats()
+            yield GaugeMetricFamily("valence_gateway_queue_depth", "Jobs waiting for a RunPod slot", value=stats["queued"])
+            yield GaugeMetricFamily("valence_gateway_in_flight", "RunPod jobs dispatched and not yet finished", value=stats["in_flight"])
+        if self.caches:
+            hits = GaugeMetricFamily("valence_gateway_cache_hits", "Cache hits since start", labels=["cache"])
+            misses = GaugeMetricFamily("valence_gateway_cache_misses", "Cache misses since start", labels=["cache"])
+            for name, cache in self.caches.items():
+                stats = cache.stats()
+                hits.add_metric([name], stats["hits"])
+                misses.add_metric([name], stats["misses"])
+            yield hits
+            yield misses
+
+collector = GatewayCollector()
+REGISTRY.register(collector)
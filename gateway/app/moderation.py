@@ -1,55 +1,115 @@
+import json
 import time
 import boto3
+import hashlib
+from typing import Optional
 from app.config import settings
 from app.constants import BLOCKED_CATEGORIES
 
 rek_client = boto3.client("rekognition", region_name=settings.aws_region)
 
-def start_moderation(object_key: str) -> str:
-    response = rek_client.start_content_moderation(
-        Video={
+def start_moderation(object_key: str, job_tag: str | None = None) -> str:
+    kwargs = {
+        "Video": {
             "S3Object": {
                 "Bucket": settings.bucket,
                 "Name": object_key
             }
         }
-    )
+    }
+    if job_tag:
+        kwargs["JobTag"] = job_tag
+    if settings.moderation_sns_topic_arn and settings.moderation_sns_role_arn:
+        kwargs["NotificationChannel"] = {
+            "SNSTopicArn": settings.moderation_sns_topic_arn,
+            "RoleArn": settings.moderation_sns_role_arn
+        }
+    response = rek_client.start_content_moderation(**kwargs)
     return response["JobId"]
 
-def wait_for_moderation(job_id: str, threshold: int, max_wait: int = None, sleep: int = 5) -> tuple[bool, list[dict]]:
-    max_wait = max_wait or settings.moderation_timeout
-    waited = 0
+def collect_moderation(job_id: str, threshold: int) -> tuple[bool, list[dict]] | None:
+    """Read the verdict of a moderation job without waiting for it.
+
+    Returns None while Rekognition is still working, otherwise (ok, hits)
+    with the labels at or above `threshold` in BLOCKED_CATEGORIES. A job
+    that did not succeed counts as rejected.
+    """
     next_token = None
     hits: list[dict] = []
 
-    while waited < max_wait:
+    while True:
         if next_token:
             response = rek_client.get_content_moderation(JobId=job_id, NextToken=next_token)
         else:
             response = rek_client.get_content_moderation(JobId=job_id)
-        
+
         status = response["JobStatus"]
         if status == "IN_PROGRESS":
-            time.sleep(sleep)
-            waited += sleep
-            continue
+            return None
         if status != "SUCCEEDED":
             return False, [{"Name": status or "UNKNOWN", "Confidence": 100.0}]
-        
+
         for ev in response.get("ModerationLabels", []):
             label = ev.get("ModerationLabel", {})
             name = label.get("Name", "")
             confidence = float(label.get("Confidence", 0))
             if confidence >= threshold and name in BLOCKED_CATEGORIES:
                 hits.append(label)
-        
+
         next_token = response.get("NextToken")
         if not next_token:
             break
-    
+
     return (len(hits) == 0), hits
 
-def moderate_video(object_key: str) -> tuple[bool, list[dict]]:
-    job_id = start_moderation(object_key)
-    return wait_for_moderation(job_id, settings.moderation_threshold)
-    
+class ModerationCache:
+    """Moderation verdicts keyed by object content.
+
+    Keys hash the object's ETag with the threshold and blocked categories,
+    so a resubmit of unchanged content reuses the earlier verdict instead of
+    starting another Rekognition job. Entries share the Jobs store with the
+    result cache and expire after `moderation_cache_ttl_seconds`.
+    """
+
+    def __init__(self, jobs, ttl: int | None = None):
+        self.jobs = jobs
+        self.ttl = ttl or settings.moderation_cache_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(source: str, threshold: int) -> str:
+        blob = json.dumps({"moderation": source, "threshold": int(threshold), "categories": sorted(BLOCKED_CATEGORIES)}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def lookup(self, key: str) -> Optional[tuple[bool, list[dict]]]:
+        entry = self.jobs.get_cache_entry(key)
+        if not entry or entry["expires_at"] <= time.time():
+            if entry:
+                self.jobs.delete_cache_entry(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["ok"], entry["hits"]
+
+    def record(self, key: str, ok: bool, hits: list[dict]):
+        # Failed or timed-out Rekognition jobs report their status as the
+        # only hit; those are retried on the next submit rather than cached.
+        if not ok and not all(hit.get("Name") in BLOCKED_CATEGORIES for hit in hits):
+            return
+        now = int(time.time())
+        self.jobs.put_cache_entry({
+            "cache_key": key,
+            "ok": ok,
+            "hits": hits,
+            "created_at": now,
+            "expires_at": now + self.ttl
+        })
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0
+        }
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from typing import Callable
+from contextlib import contextmanager
+
+JOB_CHANNEL = "jobs"
+
+class LocalPubSub:
+    """In-process stand-in for a shared broadcast channel.
+
+    Every gateway replica subscribes its notifier to the channel and
+    publishes job updates to it; a production deployment swaps this for a
+    broker every replica can reach (Redis pub/sub, SNS fan-out) with the
+    same publish/subscribe shape.
+    """
+
+    def __init__(self):
+        self._subscribers: list[Callable[[str, str], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[str, str], None]):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def publish(self, channel: str, message: str):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(channel, message)
+
+class JobNotifier:
+    """Registry of asyncio waiters keyed by job id.
+
+    Waiters may live on different event loops (and threads), so they are
+    woken with call_soon_threadsafe. A waiter costs one future and a set
+    entry, so thousands of idle long-polls are cheap.
+    """
+
+    def __init__(self, pubsub: LocalPubSub):
+        self.pubsub = pubsub
+        self._waiters: dict[str, set[tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        self._lock = threading.Lock()
+        pubsub.subscribe(self._on_message)
+
+    def publish(self, job_id: str):
+        self.pubsub.publish(JOB_CHANNEL, job_id)
+
+    def _on_message(self, channel: str, job_id: str):
+        if channel != JOB_CHANNEL:
+            return
+        with self._lock:
+            waiters = self._waiters.pop(job_id, set())
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    @contextmanager
+    def subscribe(self, job_id: str):
+        """Register a waiter before reading the store so an update that lands
+        between the read and the wait is not missed."""
+        loop = asyncio.get_running_loop()
+        entry = (loop, loop.create_future())
+        with self._lock:
+            self._waiters.setdefault(job_id, set()).add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(job_id)
+                if waiters is not None:
+                    waiters.discard(entry)
+                    if not waiters:
+                        del self._waiters[job_id]
+
+    def waiting(self, job_id: str | None = None) -> int:
+        with self._lock:
+            if job_id is not None:
+                return len(self._waiters.get(job_id, ()))
+            return sum(len(w) for w in self._waiters.values())
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+async def wait_for(future: asyncio.Future, timeout: float) -> bool:
+    try:
+        await asyncio.wait_for(asyncio.shield(future), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
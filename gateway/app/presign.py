@@ -23,4 +23,50 @@ def presign_get(object_key: str, expire: int = 900) -> str:
             "Key": object_key
         },
         ExpiresIn=expire
-    )
\ No newline at end of file
+    )
+
+def create_multipart_upload(object_key: str) -> str:
+    response = s3_client.create_multipart_upload(
+        Bucket=settings.bucket,
+        Key=object_key,
+        ContentType=CONTENT_TYPE_MP4
+    )
+    return response["UploadId"]
+
+def presign_upload_part(object_key: str, upload_id: str, part_number: int, expire: int = 3600) -> str:
+    return s3_client.generate_presigned_url(
+        "upload_part",
+        Params={
+            "Bucket": settings.bucket,
+            "Key": object_key,
+            "UploadId": upload_id,
+            "PartNumber": part_number
+        },
+        ExpiresIn=expire
+    )
+
+def list_uploaded_parts(object_key: str, upload_id: str) -> list[dict]:
+    """Parts S3 already holds for an upload, so a client can resume."""
+    parts = []
+    kwargs = {"Bucket": settings.bucket, "Key": object_key, "UploadId": upload_id}
+    while True:
+        response = s3_client.list_parts(**kwargs)
+        for part in response.get("Parts", []):
+            parts.append({"part_number": part["PartNumber"], "etag": part["ETag"], "size": part["Size"]})
+        if not response.get("IsTruncated"):
+            return parts
+        kwargs["PartNumberMarker"] = response["NextPartNumberMarker"]
+
+def complete_multipart_upload(object_key: str, upload_id: str, parts: list[dict]) -> str:
+    response = s3_client.complete_multipart_upload(
+        Bucket=settings.bucket,
+        Key=object_key,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": [{"PartNumber": p["part_number"], "ETag": p["etag"]} for p in sorted(parts, key=lambda p: p["part_number"])]
+        }
+    )
+    return response["ETag"]
+
+def abort_multipart_upload(object_key: str, upload_id: str):
+    s3_client.abort_multipart_upload(Bucket=settings.bucket, Key=object_key, UploadId=upload_id)
@@ -0,0 +1,118 @@
+import json
+import time
+import hashlib
+import httpx
+from typing import Optional
+from botocore.exceptions import ClientError
+from app.config import settings
+from app.presign import s3_client, presign_get
+
+def remote_etag(url: str) -> Optional[str]:
+    """Strong ETag served for an external input, or None. Probed with a
+    one-byte ranged GET, since presigned GET URLs are not valid for HEAD."""
+    try:
+        with httpx.stream("GET", url, headers={"Range": "bytes=0-0"}, follow_redirects=True, timeout=settings.result_cache_probe_timeout_seconds) as response:
+            etag = response.headers.get("ETag") if response.status_code in (200, 206) else None
+    except httpx.HTTPError:
+        return None
+    if not etag or etag.startswith("W/"):
+        return None
+    return etag.strip('"')
+
+class ResultCache:
+    """Content-addressed index of finished VSR outputs.
+
+    Keys hash the input's identity (S3 ETag for our own objects, the URL
+    plus the ETag it serves for external inputs) together with every job
+    parameter that changes the output or its metrics. External inputs
+    without a strong ETag are not cached. Outputs live in S3 under
+    `result_cache_prefix`; the index rows live in the Jobs store and expire
+    after `result_cache_ttl_seconds`. An expired entry found by lookup()
+    has its object deleted, but entries that are never looked up again
+    expire silently in DynamoDB, so the bucket needs a lifecycle rule that
+    expires objects under the prefix a day after the TTL (8 days with the
+    defaults).
+    """
+
+    def __init__(self, jobs, ttl: int | None = None):
+        self.jobs = jobs
+        self.ttl = ttl or settings.result_cache_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(source: str, scale: int, num_inference_steps: int, guidance_scale: float, **extra) -> str:
+        params = {
+            "scale": int(scale),
+            "num_inference_steps": int(num_inference_steps),
+            "guidance_scale": float(guidance_scale),
+            **{k: v for k, v in extra.items() if v is not None}
+        }
+        blob = json.dumps({"source": source, "params": params}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    @staticmethod
+    def source_id(object_key: str | None, input_url: str | None) -> Optional[str]:
+        if object_key:
+            try:
+                head = s3_client.head_object(Bucket=settings.bucket, Key=object_key)
+            except ClientError:
+                return None
+            etag = head["ETag"].strip('"')
+            return f"etag:{etag}"
+        if input_url:
+            etag = remote_etag(input_url)
+            return f"url:{input_url}#etag:{etag}" if etag else None
+        return None
+
+    @staticmethod
+    def object_key(key: str) -> str:
+        return f"{settings.result_cache_prefix}{key}.mp4"
+
+    def object_url(self, key: str) -> str:
+        return f"s3://{settings.bucket}/{self.object_key(key)}"
+
+    def lookup(self, key: str) -> Optional[tuple[dict, Optional[dict]]]:
+        """(output, metrics) of a live cache entry, or None."""
+        entry = self.jobs.get_cache_entry(key)
+        if entry and entry["expires_at"] > time.time():
+            try:
+                s3_client.head_object(Bucket=settings.bucket, Key=entry["object_key"])
+            except ClientError:
+                entry = None
+        elif entry:
+            self._delete_object(entry["object_key"])
+            entry = None
+        if entry is None:
+            self.jobs.delete_cache_entry(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"presigned_url": presign_get(entry["object_key"]), "cache": "hit"}, entry.get("metrics")
+
+    def record(self, key: str, metrics: dict | None = None):
+        now = int(time.time())
+        entry = {
+            "cache_key": key,
+            "object_key": self.object_key(key),
+            "created_at": now,
+            "expires_at": now + self.ttl
+        }
+        if metrics:
+            entry["metrics"] = metrics
+        self.jobs.put_cache_entry(entry)
+
+    @staticmethod
+    def _delete_object(object_key: str):
+        try:
+            s3_client.delete_object(Bucket=settings.bucket, Key=object_key)
+        except ClientError:
+            pass
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0
+        }
@@ -0,0 +1,209 @@
+import math
+import time
+import asyncio
+import heapq
+import hashlib
+import threading
+from typing import Awaitable, Callable
+from dataclasses import dataclass, field
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.constants import ENGINE_COST_WEIGHTS
+from app.schemas import SubmitRequest
+
+class QueueFullError(Exception):
+    pass
+
+class RateLimitedError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+def tenant_id(api_key: str | None) -> str:
+    """Stable tenant name for an API key that does not store the key."""
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+def estimate_cost(request: SubmitRequest) -> float:
+    """Relative GPU cost of a job: output pixels grow with scale**2 and the
+    diffusion engine pays for every inference step."""
+    steps = request.num_inference_steps if request.engine == "stablevsr" else 1
+    return ENGINE_COST_WEIGHTS.get(request.engine, 1.0) * request.scale ** 2 * steps
+
+@dataclass(order=True)
+class QueueEntry:
+    key: float
+    seq: int
+    job_ids: list[str] = field(compare=False)
+    tenant: str = field(compare=False)
+    cost: float = field(compare=False)
+    batch: bool = field(default=False, compare=False)
+
+class RateLimiter:
+    """Token bucket per tenant; one token per submitted job."""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, tenant: str, tokens: int = 1):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            level, last = self._buckets.get(tenant, (self.burst, now))
+            level = min(self.burst, level + (now - last) * self.rate)
+            if level < tokens:
+                self._buckets[tenant] = (level, now)
+                raise RateLimitedError((tokens - level) / self.rate)
+            self._buckets[tenant] = (level - tokens, now)
+
+class Scheduler:
+    """Admission control and priority dispatch for accepted jobs.
+
+    Jobs wait QUEUED until a RunPod slot is free; at most `max_in_flight`
+    RunPod jobs are outstanding and a slot is released when the job's
+    webhook fires (or its lease runs out). Tenants take turns by least
+    estimated cost served so far, so one tenant's burst cannot starve the
+    others. Within a tenant an entry is due at its submit time plus
+    `dispatch_cost_seconds` per unit of estimated cost: cheap previews
+    overtake large 4x jobs, which still cannot wait forever. Queue entries
+    are mirrored onto the job rows (`queue`), so the queue survives
+    restarts through the Jobs store, DynamoDB included; see recover().
+    """
+
+    def __init__(self, jobs, dispatch: Callable[[list[str], bool], Awaitable[bool]], max_in_flight: int | None = None, max_queued: int | None = None):
+        self.jobs = jobs
+        self.dispatch = dispatch
+        self.max_in_flight = max_in_flight or settings.dispatch_max_in_flight
+        self.max_queued = max_queued or settings.dispatch_max_queued
+        self._tenants: dict[str, list[QueueEntry]] = {}
+        self._served: dict[str, float] = {}
+        self._seq = 0
+        self._slots: dict[str, float] = {}
+        self._slot_of: dict[str, str] = {}
+        self._queued: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _push(self, job_ids: list[str], tenant: str, cost: float, batch: bool, submitted_at: float) -> QueueEntry:
+        if tenant not in self._tenants:
+            # A tenant returning from idle starts level with the least-served
+            # active tenant instead of cashing in credit from its idle time.
+            active = [self._served.get(t, 0.0) for t in self._tenants]
+            if not active:
+                self._served.clear()
+            self._served[tenant] = max(self._served.get(tenant, 0.0), min(active, default=0.0))
+        self._seq += 1
+        entry = QueueEntry(key=submitted_at + cost * settings.dispatch_cost_seconds, seq=self._seq, job_ids=job_ids, tenant=tenant, cost=cost, batch=batch)
+        heapq.heappush(self._tenants.setdefault(tenant, []), entry)
+        self._queued.update(job_ids)
+        return entry
+
+    def has_room(self, count: int) -> bool:
+        with self._lock:
+            return len(self._queued) + count <= self.max_queued
+
+    def enqueue(self, job_ids: list[str], tenant: str, cost: float, batch: bool = False):
+        """Queue jobs that are dispatched together as one RunPod job;
+        `batch` entries use the multi-job worker input."""
+        with self._lock:
+            if len(self._queued) + len(job_ids) > self.max_queued:
+                raise QueueFullError(f"Dispatch queue is full ({self.max_queued} jobs)")
+            submitted_at = time.time()
+            self._push(job_ids, tenant, cost, batch, submitted_at)
+        queue = {"group": job_ids, "tenant": tenant, "cost": cost, "batch": batch, "submitted_at": submitted_at}
+        for job_id in job_ids:
+            self.jobs.update(job_id, queue=queue)
+
+    def recover(self):
+        """Rebuild the queue from QUEUED rows after a restart."""
+        seen = set()
+        cursor = None
+        while True:
+            rows, cursor = self.jobs.query(status="QUEUED", limit=100, cursor=cursor)
+            with self._lock:
+                for row in rows:
+                    queue = row.queue or {}
+                    group = tuple(queue.get("group") or [row.job_id])
+                    if group in seen:
+                        continue
+                    seen.add(group)
+                    self._push(list(group), queue.get("tenant", "anonymous"), queue.get("cost", 1.0), queue.get("batch", False), queue.get("submitted_at", row.created_at))
+            if cursor is None:
+                return
+
+    def is_queued(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._queued
+
+    def release(self, job_id: str):
+        with self._lock:
+            slot = self._slot_of.get(job_id)
+            if slot is not None:
+                self._free(slot)
+
+    def _free(self, slot: str):
+        self._slots.pop(slot, None)
+        for job_id in [j for j, s in self._slot_of.items() if s == slot]:
+            del self._slot_of[job_id]
+
+    def _take(self) -> QueueEntry | None:
+        with self._lock:
+            now = time.monotonic()
+            for slot, deadline in list(self._slots.items()):
+                if deadline < now:
+                    self._free(slot)
+            if len(self._slots) >= self.max_in_flight or not self._tenants:
+                return None
+            tenant = min(self._tenants, key=lambda t: (self._served[t], self._tenants[t][0]))
+            entry = heapq.heappop(self._tenants[tenant])
+            if not self._tenants[tenant]:
+                del self._tenants[tenant]
+            self._served[tenant] += entry.cost
+            self._queued.difference_update(entry.job_ids)
+            slot = entry.job_ids[0]
+            self._slots[slot] = now + settings.dispatch_slot_timeout_seconds
+            for job_id in entry.job_ids:
+                self._slot_of[job_id] = slot
+            return entry
+
+    async def _run(self, entry: QueueEntry):
+        claimed = [job_id for job_id in entry.job_ids if await run_in_threadpool(self.jobs.update, job_id, status="SUBMITTED")]
+        if not claimed or not await self.dispatch(claimed, entry.batch):
+            self.release(entry.job_ids[0])
+
+    async def pump(self):
+        """Dispatch queued entries, concurrently, while slots are free."""
+        entries = []
+        while (entry := self._take()) is not None:
+            entries.append(entry)
+        await asyncio.gather(*(self._run(entry) for entry in entries))
+
+    async def pump_every(self, interval: float):
+        """Pump on a timer as well as on webhooks: a slot whose webhook never
+        arrives is only reclaimed when its lease runs out, and nothing else
+        would dispatch the queue behind it."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.pump()
+            except Exception:
+                # A store hiccup must not stop the timer; the next tick retries.
+                continue
+
+    def stats(self) -> dict:
+        with self._lock:
+            tenants = {t: sum(len(e.job_ids) for e in entries) for t, entries in self._tenants.items()}
+            return {
+                "queued": len(self._queued),
+                "in_flight": len(self._slots),
+                "max_in_flight": self.max_in_flight,
+                "max_queued": self.max_queued,
+                "queued_by_tenant": tenants
+            }
+
+def retry_after_header(e: RateLimitedError) -> dict:
+    return {"Retry-After": str(math.ceil(e.retry_after))}
@@ -7,6 +7,43 @@ class PresignUploadOut(BaseModel):
 class PresignDownloadOut(BaseModel):
     download_url: AnyHttpUrl
 
+class MultipartCreateOut(BaseModel):
+    object_key: str
+    upload_id: str
+
+class MultipartPart(BaseModel):
+    part_number: int = Field(ge=1, le=10000)
+    etag: str
+    size: int | None = None
+
+class MultipartPartsRequest(BaseModel):
+    object_key: str
+    upload_id: str
+    part_numbers: list[int] = Field(min_length=1, max_length=1000)
+
+class MultipartPartUrl(BaseModel):
+    part_number: int
+    upload_url: AnyHttpUrl
+
+class MultipartPartsOut(BaseModel):
+    parts: list[MultipartPartUrl]
+
+class MultipartUploadedOut(BaseModel):
+    parts: list[MultipartPart]
+
+class MultipartCompleteRequest(BaseModel):
+    object_key: str
+    upload_id: str
+    parts: list[MultipartPart] = Field(min_length=1, max_length=10000)
+
+class MultipartCompleteOut(BaseModel):
+    object_key: str
+    etag: str
+
+class MultipartAbortRequest(BaseModel):
+    object_key: str
+    upload_id: str
+
 class VSRRequest(BaseModel):
     object_key: str | None = Field(default=None, description="Key inside our BUCKET, e.g. uploads/123.mp4")
     input_url: AnyHttpUrl | None = None
@@ -21,6 +58,8 @@ class VSRRequest(BaseModel):
     metrics_mode: str | None = Field(default="nr_fast", description="off|nr_fast|fr")
     reference_url: AnyHttpUrl | None = None
 
+    engine: str = Field(default="stablevsr", description="stablevsr|classic")
+
 class VSRResponse(BaseModel):
     status: str
     info: dict | None = None
@@ -35,14 +74,40 @@ class SubmitRequest(BaseModel):
     guidance_scale: int = 1
     metrics_mode: str | None = "nr_fast"
     reference_url: AnyHttpUrl | None = None
+    engine: str = "stablevsr"
+    dedup_threshold: float | None = Field(default=None, ge=0, description="Largest per-block change (0-255) still treated as a duplicate frame; off when unset")
 
 class SubmitResponse(BaseModel):
     job_id: str
     status: str = "SUBMITTED"
 
+class SubmitBatchRequest(BaseModel):
+    items: list[SubmitRequest]
+
+class SubmitBatchResponse(BaseModel):
+    jobs: list[SubmitResponse]
+
 class StatusResponse(BaseModel):
     job_id: str
     status: str
     output: dict | None = None
     metrics: dict | None = None
-    error: str | None = None
\ No newline at end of file
+    error: str | None = None
+    progress: dict | None = None
+    moderation: dict | None = None
+
+class StatusBatchRequest(BaseModel):
+    job_ids: list[str] = Field(max_length=100)
+
+class StatusBatchResponse(BaseModel):
+    jobs: list[StatusResponse]
+    missing: list[str] = []
+
+class JobSummary(StatusResponse):
+    runpod_id: str | None = None
+    created_at: float
+    updated_at: float
+
+class JobListResponse(BaseModel):
+    jobs: list[JobSummary]
+    next_cursor: str | None = None
@@ -1,19 +1,195 @@
-import requests
+import time
+import random
+import asyncio
+import httpx
+from bisect import bisect_left
 from app.config import settings
+from app import metrics
 
-RUNSYNC_URL = f"https://api.runpod.ai/v2/{settings.runpod_endpoint_id}/runsync"
-RUN_URL     = f"https://api.runpod.ai/v2/{settings.runpod_endpoint_id}/run"
+# Answers and errors that mean RunPod cannot have accepted the job. A 502/
+# 504 or a read timeout can arrive after the job was queued, so retrying
+# those could run it twice.
+RETRY_STATUSES = (429, 503)
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+TIMING_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
 
 class RunpodError(Exception):
     pass
 
-def run_vsr(video_url: str, webhook_url: str, output_url: str | None, scale_factor: int, fps: int, num_inference_steps: int, metrics_mode: str | None = None, reference_url: str | None = None) -> dict:
+class CircuitOpenError(RunpodError):
+    pass
+
+class Histogram:
+    """Cumulative-bucket request timings, Prometheus style."""
+
+    def __init__(self, buckets: tuple[float, ...] = TIMING_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = total
+        return {"buckets": cumulative, "sum": round(self.sum, 6), "count": self.count}
+
+class CircuitBreaker:
+    """Fails fast after `threshold` consecutive failures, then lets a single
+    trial call through once `cooldown` seconds have passed."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def end_trial(self):
+        self._trial = False
+
+    def record(self, ok: bool):
+        self._trial = False
+        if ok:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.failures >= self.threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+class RunpodClient:
+    """Async client for the RunPod serverless endpoint.
+
+    Keeps one pooled httpx.AsyncClient per event loop so jobs reuse TLS
+    connections. Connection failures and 429/503 answers are retried with
+    full-jitter exponential backoff; these are the cases where RunPod has
+    not accepted the job, so a retry cannot double-submit it. Read timeouts,
+    dropped connections and other 5xx answers may come after the job was
+    queued, so they fail the call without a retry. Repeated failures open a
+    circuit breaker so a RunPod outage fails /submit fast instead of piling
+    up retries.
+    """
+
+    def __init__(self, base_url: str | None = None, api_key: str | None = None, endpoint_id: str | None = None):
+        self.base_url = (base_url or settings.runpod_base_url).rstrip("/")
+        self.api_key = api_key or settings.runpod_api_key
+        self.endpoint_id = endpoint_id or settings.runpod_endpoint_id
+        self.retries = settings.runpod_retries
+        self.backoff = settings.runpod_backoff_seconds
+        self.breaker = CircuitBreaker(settings.runpod_breaker_threshold, settings.runpod_breaker_cooldown_seconds)
+        self.timings = Histogram()
+        self.attempts = 0
+        self.retried = 0
+        self._client = None
+        self._loop = None
+
+    @property
+    def run_url(self) -> str:
+        return f"{self.base_url}/{self.endpoint_id}/run"
+
+    def _http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=settings.runpod_timeout_seconds,
+                limits=httpx.Limits(max_connections=settings.runpod_max_connections, max_keepalive_connections=settings.runpod_max_connections),
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+            self._loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def run(self, payload: dict) -> dict:
+        if not self.breaker.allow():
+            raise CircuitOpenError("RunPod circuit breaker is open")
+        try:
+            return await self._run(payload)
+        finally:
+            # A half-open trial that ended in an unexpected error or a
+            # cancellation must not keep the breaker closed to everyone.
+            self.breaker.end_trial()
+
+    async def _run(self, payload: dict) -> dict:
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += 1
+                metrics.runpod_retries.inc()
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            self.attempts += 1
+            t0 = time.perf_counter()
+            outcome = "error"
+            try:
+                response = await self._http().post(self.run_url, json=payload)
+                outcome = str(response.status_code)
+            except RETRY_ERRORS as e:
+                error = RunpodError(f"RunPod request failed: {e!r}")
+                continue
+            except httpx.TransportError as e:
+                error = RunpodError(f"RunPod request failed: {e!r}")
+                break
+            finally:
+                elapsed = time.perf_counter() - t0
+                self.timings.observe(elapsed)
+                metrics.runpod_seconds.labels(outcome).observe(elapsed)
+            if response.status_code == 200:
+                self.breaker.record(True)
+                metrics.breaker_open.set(0)
+                return response.json()
+            error = RunpodError(response.text)
+            if response.status_code not in RETRY_STATUSES:
+                break
+        self.breaker.record(False)
+        metrics.breaker_open.set(1 if self.breaker.state == "open" else 0)
+        raise error
+
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker.state,
+            "attempts": self.attempts,
+            "retries": self.retried,
+            "request_seconds": self.timings.snapshot()
+        }
+
+runpod = RunpodClient()
+
+async def run_vsr(video_url: str, webhook_url: str, output_url: str | None, scale_factor: int, fps: int, num_inference_steps: int, metrics_mode: str | None = None, reference_url: str | None = None, cache_url: str | None = None, engine: str = "stablevsr", progress_url: str | None = None, dedup_threshold: float | None = None, guidance_scale: float = 1.0) -> dict:
     payload = {
         "input": {
             "video_url": video_url,
             "scale_factor": scale_factor,
             "num_inference_steps": num_inference_steps,
-            "fps": fps
+            "guidance_scale": guidance_scale,
+            "fps": fps,
+            "engine": engine
         },
         "webhook": webhook_url
     }
@@ -23,16 +199,26 @@ def run_vsr(video_url: str, webhook_url: str, output_url: str | None, scale_fact
         payload["input"]["metrics_mode"] = metrics_mode
     if reference_url:
         payload["input"]["reference_url"] = reference_url
-    
-    response = requests.post(
-        RUN_URL,
-        json=payload,
-        headers={
-            "Authorization": f"Bearer {settings.runpod_api_key}"
-        }, timeout=60
-    )
-
-    if response.status_code != 200:
-        raise RunpodError(response.text)
-
-    return response.json()
\ No newline at end of file
+    if cache_url:
+        payload["input"]["cache_url"] = cache_url
+    if progress_url:
+        payload["input"]["progress_url"] = progress_url
+    if dedup_threshold is not None:
+        payload["input"]["dedup_threshold"] = dedup_threshold
+
+    return await runpod.run(payload)
+
+async def run_vsr_batch(items: list[dict], webhook_url: str, scale_factor: int, fps: int, num_inference_steps: int, guidance_scale: float = 1.0, engine: str = "stablevsr") -> dict:
+    payload = {
+        "input": {
+            "jobs": items,
+            "scale_factor": scale_factor,
+            "num_inference_steps": num_inference_steps,
+            "guidance_scale": guidance_scale,
+            "fps": fps,
+            "engine": engine
+        },
+        "webhook": webhook_url
+    }
+
+    return await runpod.run(payload)
@@ -43,8 +43,11 @@ def s3_setup(moto_aws, env_defaults):
     return s3
 
 @pytest.fixture(scope="function")
-def app_client(s3_setup):
+def app_client(s3_setup, monkeypatch):
     """Return TestClient after env/mocks are ready."""
+    from app import result_cache
+    # Keep tests off the network: external inputs serve no ETag, so they are not cached.
+    monkeypatch.setattr(result_cache, "remote_etag", lambda url: None)
     import app.main as main
     importlib.reload(main)
     from fastapi.testclient import TestClient
@@ -54,6 +57,8 @@ def app_client(s3_setup):
 def app_client_moderation_on(monkeypatch, s3_setup):
     """Same as app_client, but with moderation enabled via env."""
     monkeypatch.setenv("MODERATION_ENABLED", "1")
+    from app import result_cache
+    monkeypatch.setattr(result_cache, "remote_etag", lambda url: None)
     import app.main as main
     importlib.reload(main)
     from fastapi.testclient import TestClient
@@ -63,7 +68,7 @@ def app_client_moderation_on(monkeypatch, s3_setup):
 def stub_runpod_async(monkeypatch):
     """Stub /run call to Runpod to return a fake run id."""
     from app import main
-    def mock_run_vsr(input_url, webhook_url, output_url, *args):
+    async def mock_run_vsr(input_url, webhook_url, output_url, *args, **kwargs):
         return {"status": "ok", "id": "123", "info": {}}
     monkeypatch.setattr(main, "run_vsr", mock_run_vsr)
     yield
@@ -86,7 +91,7 @@ def stub_rekognition(monkeypatch):
     stubber.add_response(
         "start_content_moderation",
         {"JobId": "job-123"},
-        {"Video": {"S3Object": {"Bucket": ANY, "Name": ANY}}}
+        {"Video": {"S3Object": {"Bucket": ANY, "Name": ANY}}, "JobTag": ANY}
     )
     # GetContentModeration → succeeds with no labels
     stubber.add_response(
@@ -100,3 +105,30 @@ def stub_rekognition(monkeypatch):
     monkeypatch.setattr(mod, "rek_client", client)
     yield
     stubber.deactivate()
+
+@pytest.fixture(scope="function")
+def ddb_jobs(moto_aws, env_defaults, monkeypatch):
+    """Jobs store backed by a moto DynamoDB table."""
+    from app.config import settings
+    from app.jobs import Jobs
+    ddb = boto3.resource("dynamodb", region_name="us-east-1")
+    ddb.create_table(
+        TableName="jobs",
+        KeySchema=[{"AttributeName": "job_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[
+            {"AttributeName": "job_id", "AttributeType": "S"},
+            {"AttributeName": "status", "AttributeType": "S"},
+            {"AttributeName": "created_at", "AttributeType": "N"}
+        ],
+        GlobalSecondaryIndexes=[{
+            "IndexName": "status-created_at-index",
+            "KeySchema": [
+                {"AttributeName": "status", "KeyType": "HASH"},
+                {"AttributeName": "created_at", "KeyType": "RANGE"}
+            ],
+            "Projection": {"ProjectionType": "ALL"}
+        }],
+        BillingMode="PAY_PER_REQUEST"
+    )
+    monkeypatch.setattr(settings, "ddb_table", "jobs")
+    return Jobs()
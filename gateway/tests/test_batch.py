@@ -0,0 +1,119 @@
+import os
+from app.jobs import sign_hmac
+
+APIH = {"X-API-Key": "secret"}
+
+def test_submit_batch_groups_compatible_jobs(app_client, put_input_video, monkeypatch):
+    import app.main as main
+    calls = []
+    async def mock_run_vsr_batch(items, webhook_url, *args):
+        calls.append((items, webhook_url, args))
+        return {"status": "ok", "id": f"b{len(calls)}"}
+    monkeypatch.setattr(main, "run_vsr_batch", mock_run_vsr_batch)
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+
+    items = [
+        {"input_url": "https://example.com/a.mp4", "scale": 2},
+        {"input_url": "https://example.com/b.mp4", "scale": 2},
+        {"input_url": "https://example.com/c.mp4", "scale": 4}
+    ]
+    r = app_client.post("/submit/batch", json={"items": items}, headers=APIH)
+    assert r.status_code == 200
+    job_ids = [j["job_id"] for j in r.json()["jobs"]]
+    assert len(set(job_ids)) == 3
+    assert sorted(len(c[0]) for c in calls) == [1, 2]
+    assert all(item["metrics_mode"] == "nr_fast" for c in calls for item in c[0])
+
+    pair = next(c for c in calls if len(c[0]) == 2)
+    pair_ids = [item["job_id"] for item in pair[0]]
+    ids = ",".join(pair_ids)
+    sig = sign_hmac(os.environ["HMAC_SECRET"], ids)
+    body = {"status": "ok", "results": [
+        {"job_id": pair_ids[0], "status": "ok", "info": {"presigned_url": "https://example.com/a_out.mp4"}},
+        {"job_id": pair_ids[1], "status": "error", "error": "boom"}
+    ]}
+    r_web = app_client.post(f"/webhook/runpod/batch?job_ids={ids}&sig={sig}", json=body)
+    assert r_web.status_code == 200
+    assert app_client.get(f"/status/{pair_ids[0]}", headers=APIH).json()["status"] == "SUCCEEDED"
+    failed = app_client.get(f"/status/{pair_ids[1]}", headers=APIH).json()
+    assert failed["status"] == "FAILED"
+    assert failed["error"] == "boom"
+
+    r_bad = app_client.post(f"/webhook/runpod/batch?job_ids={ids}&sig=deadbeef", json=body)
+    assert r_bad.status_code == 401
+
+def test_batch_results_are_recorded_in_result_cache(app_client, s3_setup, monkeypatch):
+    import app.main as main
+    from app import result_cache
+    calls = []
+    async def mock_run_vsr_batch(items, webhook_url, *args):
+        calls.append(items)
+        return {"status": "ok", "id": f"b{len(calls)}"}
+    monkeypatch.setattr(main, "run_vsr_batch", mock_run_vsr_batch)
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+    monkeypatch.setattr(result_cache, "remote_etag", lambda url: "v1")
+
+    items = [{"input_url": "https://example.com/a.mp4"}, {"input_url": "https://example.com/b.mp4"}]
+    r = app_client.post("/submit/batch", json={"items": items}, headers=APIH)
+    job_ids = [j["job_id"] for j in r.json()["jobs"]]
+    assert len(calls) == 1
+    cache_urls = [item["cache_url"] for item in calls[0]]
+    assert all(url.startswith(f"s3://{os.environ['S3_BUCKET']}/cache/") for url in cache_urls)
+
+    # the worker copies each output to its cache_url before firing the webhook
+    for url in cache_urls:
+        bucket, key = url[5:].split("/", 1)
+        s3_setup.put_object(Bucket=bucket, Key=key, Body=b"out", ContentType="video/mp4")
+    ids = ",".join(job_ids)
+    sig = sign_hmac(os.environ["HMAC_SECRET"], ids)
+    body = {"status": "ok", "results": [
+        {"job_id": job_ids[0], "status": "ok", "info": {"presigned_url": "https://example.com/a_out.mp4"}, "metrics": {"mode": "nr_fast", "sharp_mean": 12.0}},
+        {"job_id": job_ids[1], "status": "error", "error": "boom"}
+    ]}
+    assert app_client.post(f"/webhook/runpod/batch?job_ids={ids}&sig={sig}", json=body).status_code == 200
+
+    hit = app_client.post("/submit", json=items[0], headers=APIH).json()
+    assert hit["status"] == "SUCCEEDED"
+    assert app_client.get(f"/status/{hit['job_id']}", headers=APIH).json()["metrics"]["sharp_mean"] == 12.0
+    assert app_client.post("/submit/batch", json={"items": items[1:]}, headers=APIH).json()["jobs"][0]["status"] == "SUBMITTED"
+    assert len(calls) == 2
+
+def test_submit_batch_reports_failed_dispatch(app_client, monkeypatch):
+    import app.main as main
+    from app.vsr_client import RunpodError
+    async def failing_run_vsr_batch(items, webhook_url, *args):
+        raise RunpodError("RunPod unavailable")
+    monkeypatch.setattr(main, "run_vsr_batch", failing_run_vsr_batch)
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+
+    items = [{"input_url": "https://example.com/a.mp4"}, {"input_url": "https://example.com/b.mp4"}]
+    r = app_client.post("/submit/batch", json={"items": items}, headers=APIH)
+    assert r.status_code == 200
+    assert [j["status"] for j in r.json()["jobs"]] == ["FAILED", "FAILED"]
+
+def test_batch_items_carry_dedup_and_progress(app_client, monkeypatch):
+    import app.main as main
+    calls = []
+    async def mock_run_vsr_batch(items, webhook_url, *args):
+        calls.append(items)
+        return {"status": "ok", "id": f"b{len(calls)}"}
+    monkeypatch.setattr(main, "run_vsr_batch", mock_run_vsr_batch)
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+
+    items = [
+        {"input_url": "https://example.com/a.mp4", "dedup_threshold": 2.0},
+        {"input_url": "https://example.com/b.mp4", "dedup_threshold": 2.0},
+        {"input_url": "https://example.com/c.mp4"}
+    ]
+    app_client.post("/submit/batch", json={"items": items}, headers=APIH)
+    # Deduplicated and plain clips are not packed together.
+    assert sorted(len(c) for c in calls) == [1, 2]
+    deduped = next(c for c in calls if len(c) == 2)
+    plain = next(c for c in calls if len(c) == 1)
+    assert [item["dedup_threshold"] for item in deduped] == [2.0, 2.0]
+    assert "dedup_threshold" not in plain[0]
+
+    item = plain[0]
+    r = app_client.post(item["progress_url"].replace("http://testserver", ""), json={"stage": "processing", "frames_done": 3})
+    assert r.status_code == 200
+    assert app_client.get(f"/status/{item['job_id']}", headers=APIH).json()["progress"]["frames_done"] == 3
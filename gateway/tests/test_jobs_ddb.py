@@ -0,0 +1,70 @@
+import pytest
+
+def test_ddb_create_and_update_roundtrip(ddb_jobs):
+    job = ddb_jobs.create(input_url="https://example.com/in.mp4", output_url=None)
+    assert ddb_jobs.mark_running(job.job_id, "rp-1")
+    assert ddb_jobs.update(job.job_id, progress={"stage": "processing", "fps": 2.5})
+    assert ddb_jobs.update_from_result(job.job_id, ok=True, output={"presigned_url": "https://example.com/o.mp4"}, metrics={"sharp_mean": 40.5}, error=None)
+
+    row = ddb_jobs.get(job.job_id)
+    assert row.status == "SUCCEEDED"
+    assert row.runpod_id == "rp-1"
+    assert row.progress["fps"] == 2.5
+    assert row.metrics["sharp_mean"] == 40.5
+    assert row.updated_at >= row.created_at
+
+def test_ddb_update_is_single_write_without_read(ddb_jobs, monkeypatch):
+    job = ddb_jobs.create(input_url="https://example.com/in.mp4", output_url=None)
+    table = ddb_jobs._ddb_table
+    calls = []
+    real_update = table.update_item
+    monkeypatch.setattr(table, "get_item", lambda **kw: pytest.fail("update must not read"))
+    monkeypatch.setattr(table, "put_item", lambda **kw: pytest.fail("update must not put the row"))
+    monkeypatch.setattr(table, "update_item", lambda **kw: calls.append(kw) or real_update(**kw))
+    assert ddb_jobs.mark_running(job.job_id, "rp-1")
+    assert len(calls) == 1
+
+def test_ddb_refuses_backward_transitions(ddb_jobs):
+    job = ddb_jobs.create(input_url="https://example.com/in.mp4", output_url=None)
+    assert ddb_jobs.update_from_result(job.job_id, ok=True, output={"presigned_url": "x"}, metrics=None, error=None)
+    assert not ddb_jobs.mark_running(job.job_id, "late")
+    assert not ddb_jobs.mark_failed(job.job_id, "late")
+    row = ddb_jobs.get(job.job_id)
+    assert row.status == "SUCCEEDED"
+    assert row.runpod_id is None
+
+def test_ddb_update_missing_job_is_noop(ddb_jobs):
+    assert not ddb_jobs.mark_running("missing", "rp-1")
+    assert ddb_jobs.get("missing") is None
+
+def test_memory_store_refuses_backward_transitions(env_defaults):
+    from app.jobs import Jobs
+    jobs = Jobs()
+    job = jobs.create(input_url="https://example.com/in.mp4", output_url=None)
+    assert jobs.update_from_result(job.job_id, ok=False, output=None, metrics=None, error="boom")
+    assert not jobs.mark_running(job.job_id, "late")
+    assert jobs.get(job.job_id).status == "FAILED"
+
+def test_ddb_get_is_cached_and_invalidated_by_updates(ddb_jobs, monkeypatch):
+    job = ddb_jobs.create(input_url="https://example.com/in.mp4", output_url=None)
+    table = ddb_jobs._ddb_table
+    reads = []
+    real_get = table.get_item
+    monkeypatch.setattr(table, "get_item", lambda **kw: reads.append(kw) or real_get(**kw))
+
+    ddb_jobs.invalidate(job.job_id)
+    assert ddb_jobs.get(job.job_id).status == "SUBMITTED"
+    assert ddb_jobs.get(job.job_id).status == "SUBMITTED"
+    assert len(reads) == 1
+
+    ddb_jobs.update_from_result(job.job_id, ok=True, output=None, metrics=None, error=None)
+    assert ddb_jobs.get(job.job_id).status == "SUCCEEDED"
+    assert len(reads) == 2
+
+def test_ddb_get_many_uses_batch_get(ddb_jobs):
+    ids = [ddb_jobs.create(input_url=f"https://example.com/{i}.mp4", output_url=None).job_id for i in range(130)]
+    for job_id in ids:
+        ddb_jobs.invalidate(job_id)
+    rows = ddb_jobs.get_many(ids + ["missing"])
+    assert set(rows) == set(ids)
+    assert rows[ids[-1]].input_url == "https://example.com/129.mp4"
@@ -0,0 +1,63 @@
+import pytest
+from fastapi.testclient import TestClient
+
+def _seed(jobs, n=7):
+    created = []
+    for i in range(n):
+        job = jobs.create(input_url=f"https://example.com/{i}.mp4", output_url=None)
+        if i % 2:
+            jobs.mark_running(job.job_id, f"rp-{i}")
+        created.append(job.job_id)
+    return created
+
+def _pages(jobs, **kwargs):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = jobs.query(cursor=cursor, **kwargs)
+        seen.append([row.job_id for row in rows])
+        if cursor is None:
+            return seen
+
+@pytest.fixture(scope="function")
+def mem_jobs(env_defaults):
+    from app.jobs import Jobs
+    return Jobs()
+
+@pytest.mark.parametrize("store", ["mem_jobs", "ddb_jobs"])
+def test_list_by_status_pages_newest_first(store, request):
+    jobs = request.getfixturevalue(store)
+    created = _seed(jobs)
+    running = [job_id for i, job_id in enumerate(created) if i % 2][::-1]
+    pages = _pages(jobs, status="RUNNING", limit=2)
+    assert [len(p) for p in pages] == [2, 1]
+    assert sum(pages, []) == running
+
+@pytest.mark.parametrize("store", ["mem_jobs", "ddb_jobs"])
+def test_list_all_statuses_since(store, request):
+    jobs = request.getfixturevalue(store)
+    created = _seed(jobs)
+    since = jobs.get(created[3]).created_at
+    assert sum(_pages(jobs, since=since, limit=3), []) == created[3:][::-1]
+
+def test_list_does_not_scan(ddb_jobs, monkeypatch):
+    _seed(ddb_jobs, 3)
+    monkeypatch.setattr(ddb_jobs._ddb_table, "scan", lambda **kw: pytest.fail("listing must not scan"))
+    rows, cursor = ddb_jobs.query(status="SUBMITTED", limit=10)
+    assert len(rows) == 2 and cursor is None
+
+def test_jobs_endpoint_cursor_roundtrip(env_defaults):
+    from app import main
+    client = TestClient(main.app)
+    headers = {"x-api-key": "test"}
+    ids = [main.jobs.create(input_url="https://example.com/in.mp4", output_url=None).job_id for _ in range(3)]
+
+    r = client.get("/jobs", params={"status": "SUBMITTED", "limit": 2}, headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert len(body["jobs"]) == 2 and body["next_cursor"]
+    r = client.get("/jobs", params={"status": "SUBMITTED", "limit": 2, "cursor": body["next_cursor"]}, headers=headers)
+    listed = [j["job_id"] for j in body["jobs"] + r.json()["jobs"]]
+    assert [job_id for job_id in listed if job_id in ids] == ids[::-1]
+
+    assert client.get("/jobs", params={"status": "BOGUS"}, headers=headers).status_code == 400
+    assert client.get("/jobs", params={"cursor": "not-a-cursor"}, headers=headers).status_code == 400
@@ -0,0 +1,24 @@
+APIH = {"X-API-Key": "secret"}
+
+def _sample(text: str, name: str, **labels) -> float | None:
+    want = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    for line in text.splitlines():
+        if line.startswith(f"{name}{{{want}}}" if labels else f"{name} "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+def test_metrics_endpoint_reports_gateway_series(app_client, stub_runpod_async, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+    job_id = app_client.post("/submit", json={"input_url": "https://example.com/a.mp4"}, headers=APIH).json()["job_id"]
+    app_client.get(f"/status/{job_id}", headers=APIH)
+
+    r = app_client.get("/metrics")
+    assert r.status_code == 200
+    text = r.text
+    assert _sample(text, "valence_gateway_request_seconds_count", method="GET", route="/status/{job_id}", status="200") >= 1
+    assert job_id not in text
+    assert _sample(text, "valence_gateway_store_seconds_count", op="create") >= 1
+    assert _sample(text, "valence_gateway_jobs", status="RUNNING") == 1
+    assert _sample(text, "valence_gateway_queue_depth") == 0
+    assert _sample(text, "valence_gateway_cache_misses", cache="results") is not None
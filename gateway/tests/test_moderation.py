@@ -1,9 +1,103 @@
+import os
+import json
+from app.jobs import sign_hmac
+
 APIH = {"X-API-Key": "secret"}
+HITS = [{"Name": "Explicit Nudity", "Confidence": 99.0}]
 
 def test_submit_blocked_by_moderation(app_client_moderation_on, put_input_video, monkeypatch):
     import app.main as main
-    monkeypatch.setattr(main, "moderate_video", lambda key: (False, [{"Name":"Explicit Nudity","Confidence":99.0}]))
+    monkeypatch.setattr(main.settings, "moderation_enabled", True)
+    monkeypatch.setattr(main, "start_moderation", lambda key, job_tag=None: "rek-1")
+    monkeypatch.setattr(main, "collect_moderation", lambda moderation_id, threshold: (False, HITS))
 
     r = app_client_moderation_on.post("/submit", json={"object_key": put_input_video}, headers=APIH)
-    assert r.status_code == 415
-    assert r.json()["detail"]["message"] == "Content rejected"
\ No newline at end of file
+    assert r.status_code == 200
+    assert r.json()["status"] == "MODERATING"
+
+    js = app_client_moderation_on.get(f"/status/{r.json()['job_id']}", headers=APIH).json()
+    assert js["status"] == "REJECTED"
+    assert js["error"] == "Content rejected"
+    assert js["moderation"]["id"] == "rek-1"
+    assert js["moderation"]["hits"] == HITS
+
+def test_submit_returns_before_moderation_finishes(app_client_moderation_on, put_input_video, stub_runpod_async, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main.settings, "moderation_enabled", True)
+    monkeypatch.setattr(main.settings, "moderation_sns_topic_arn", "arn:aws:sns:us-east-1:1:moderation")
+    monkeypatch.setattr(main.settings, "moderation_sns_role_arn", "arn:aws:iam::1:role/rekognition")
+    monkeypatch.setattr(main, "start_moderation", lambda key, job_tag=None: "rek-2")
+    monkeypatch.setattr(main, "collect_moderation", lambda moderation_id, threshold: (True, []))
+    calls = []
+    async def mock_run_vsr(*args, **kwargs):
+        calls.append(args)
+        return {"id": "rp-1"}
+    monkeypatch.setattr(main, "run_vsr", mock_run_vsr)
+
+    job_id = app_client_moderation_on.post("/submit", json={"object_key": put_input_video}, headers=APIH).json()["job_id"]
+    assert app_client_moderation_on.get(f"/status/{job_id}", headers=APIH).json()["status"] == "MODERATING"
+    assert calls == []
+
+    sig = sign_hmac(os.environ["HMAC_SECRET"], "moderation")
+    notification = {"Type": "Notification", "Message": json.dumps({"JobId": "rek-2", "Status": "SUCCEEDED", "JobTag": job_id})}
+    assert app_client_moderation_on.post("/webhook/moderation?sig=bad", content=json.dumps(notification)).status_code == 401
+    for _ in range(2):
+        r = app_client_moderation_on.post(f"/webhook/moderation?sig={sig}", content=json.dumps(notification))
+        assert r.status_code == 200
+
+    assert len(calls) == 1
+    assert app_client_moderation_on.get(f"/status/{job_id}", headers=APIH).json()["status"] == "RUNNING"
+
+def test_moderation_verdict_cached_per_object_content(app_client_moderation_on, put_input_video, s3_setup, stub_runpod_async, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main.settings, "moderation_enabled", True)
+    monkeypatch.setattr(main.settings, "result_cache_enabled", False)
+    started = []
+    monkeypatch.setattr(main, "start_moderation", lambda key, job_tag=None: started.append(key) or f"rek-{len(started)}")
+    monkeypatch.setattr(main, "collect_moderation", lambda moderation_id, threshold: (True, []))
+
+    for _ in range(2):
+        job_id = app_client_moderation_on.post("/submit", json={"object_key": put_input_video}, headers=APIH).json()["job_id"]
+        assert app_client_moderation_on.get(f"/status/{job_id}", headers=APIH).json()["status"] == "RUNNING"
+    assert len(started) == 1
+
+    # New content under the same key gets a new ETag and is moderated again.
+    s3_setup.put_object(Bucket=os.environ["S3_BUCKET"], Key=put_input_video, Body=b"other", ContentType="video/mp4")
+    r = app_client_moderation_on.post("/submit", json={"object_key": put_input_video}, headers=APIH)
+    assert r.json()["status"] == "MODERATING"
+    assert len(started) == 2
+
+    stats = app_client_moderation_on.get("/cache/stats", headers=APIH).json()["moderation"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+def test_cached_rejection_and_uncached_timeout(app_client_moderation_on, put_input_video, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main.settings, "moderation_enabled", True)
+    started = []
+    monkeypatch.setattr(main, "start_moderation", lambda key, job_tag=None: started.append(key) or "rek")
+    verdicts = [(False, [{"Name": "TIMEOUT", "Confidence": 100.0}]), (False, HITS)]
+    monkeypatch.setattr(main, "collect_moderation", lambda moderation_id, threshold: verdicts.pop(0))
+
+    statuses = [app_client_moderation_on.post("/submit", json={"object_key": put_input_video}, headers=APIH).json()["status"] for _ in range(3)]
+    assert statuses == ["MODERATING", "MODERATING", "REJECTED"]
+    assert len(started) == 2
+
+def test_moderating_jobs_are_resumed_on_startup(app_client_moderation_on, stub_runpod_async, monkeypatch):
+    import time
+    import app.main as main
+    from fastapi.testclient import TestClient
+    monkeypatch.setattr(main, "collect_moderation", lambda moderation_id, threshold: (moderation_id == "rek-ok", []))
+    ok = main.jobs.create(input_url="https://example.com/a.mp4", output_url=None, status="MODERATING", request={"input_url": "https://example.com/a.mp4"})
+    bad = main.jobs.create(input_url="https://example.com/b.mp4", output_url=None, status="MODERATING", request={"input_url": "https://example.com/b.mp4"})
+    main.jobs.update(ok.job_id, moderation={"id": "rek-ok"})
+    main.jobs.update(bad.job_id, moderation={"id": "rek-bad"})
+
+    with TestClient(main.app) as client:
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            statuses = [client.get(f"/status/{job_id}", headers=APIH).json()["status"] for job_id in (ok.job_id, bad.job_id)]
+            if statuses == ["RUNNING", "REJECTED"]:
+                break
+            time.sleep(0.05)
+    assert statuses == ["RUNNING", "REJECTED"]
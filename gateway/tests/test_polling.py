@@ -27,8 +27,45 @@ def test_status_longpoll_returns_after_webhook(app_client, put_input_video, stub
     t = threading.Thread(target=_fire)
     t.start()
 
-    # long-poll up to ~1.5s; handler sleeps in 1s chunks
+    # long-poll up to ~1.5s; the webhook wakes the waiter
     r_status = app_client.get(f"/status/{job_id}?wait_ms=1500", headers=APIH)
     t.join()
     assert r_status.status_code == 200
-    assert r_status.json()["status"] == "SUCCEEDED"
\ No newline at end of file
+    assert r_status.json()["status"] == "SUCCEEDED"
+
+def test_status_longpoll_wakes_promptly(app_client, put_input_video, stub_runpod_async, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+    r = app_client.post("/submit", json={"object_key": put_input_video}, headers=APIH)
+    job_id = r.json()["job_id"]
+    sig = sign_hmac(os.environ["HMAC_SECRET"], job_id)
+
+    def _fire():
+        time.sleep(0.2)
+        app_client.post(f"/webhook/runpod?job_id={job_id}&sig={sig}", json={"status": "ok"})
+
+    t = threading.Thread(target=_fire)
+    start = time.monotonic()
+    t.start()
+    r_status = app_client.get(f"/status/{job_id}?wait_ms=5000", headers=APIH)
+    elapsed = time.monotonic() - start
+    t.join()
+    assert r_status.json()["status"] == "SUCCEEDED"
+    assert elapsed < 1.0
+    assert main.notifier.waiting() == 0
+
+
+def test_notifier_fans_out_across_replicas():
+    import asyncio
+    from app.notify import JobNotifier, LocalPubSub, wait_for
+
+    pubsub = LocalPubSub()
+    replica_a, replica_b = JobNotifier(pubsub), JobNotifier(pubsub)
+
+    async def _run():
+        with replica_a.subscribe("job-1") as updated:
+            asyncio.get_running_loop().call_later(0.05, replica_b.publish, "job-1")
+            return await wait_for(updated, 1.0)
+
+    assert asyncio.run(_run()) is True
+    assert replica_a.waiting() == 0
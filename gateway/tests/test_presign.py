@@ -8,3 +8,37 @@ def test_presign_upload_and_download(app_client, s3_setup):
     r2 = app_client.get("/presign/download?object_key=uploads/test.mp4", headers=APIH)
     assert r2.status_code == 200
     assert r2.json()["download_url"].startswith("http")
+
+def test_multipart_upload_resume_and_complete(app_client, s3_setup):
+    import os
+    import requests
+    key = "uploads/big.mp4"
+    r = app_client.post(f"/presign/multipart/create?object_key={key}", headers=APIH)
+    assert r.status_code == 200
+    upload_id = r.json()["upload_id"]
+
+    r = app_client.post("/presign/multipart/parts", json={"object_key": key, "upload_id": upload_id, "part_numbers": [1, 2]}, headers=APIH)
+    urls = {p["part_number"]: p["upload_url"] for p in r.json()["parts"]}
+    assert sorted(urls) == [1, 2]
+
+    chunks = {1: b"a" * (5 * 1024 * 1024), 2: b"tail"}
+    # Upload part 1 only, as if the connection dropped before part 2.
+    requests.put(urls[1], data=chunks[1]).raise_for_status()
+    uploaded = app_client.get("/presign/multipart/parts", params={"object_key": key, "upload_id": upload_id}, headers=APIH).json()["parts"]
+    assert [p["part_number"] for p in uploaded] == [1]
+
+    etag = requests.put(urls[2], data=chunks[2]).headers["ETag"]
+    parts = uploaded + [{"part_number": 2, "etag": etag}]
+    r = app_client.post("/presign/multipart/complete", json={"object_key": key, "upload_id": upload_id, "parts": parts}, headers=APIH)
+    assert r.status_code == 200
+    body = s3_setup.get_object(Bucket=os.environ["S3_BUCKET"], Key=key)["Body"].read()
+    assert body == chunks[1] + chunks[2]
+
+def test_multipart_abort_and_unknown_upload(app_client, s3_setup):
+    key = "uploads/aborted.mp4"
+    upload_id = app_client.post(f"/presign/multipart/create?object_key={key}", headers=APIH).json()["upload_id"]
+    assert app_client.post("/presign/multipart/abort", json={"object_key": key, "upload_id": upload_id}, headers=APIH).status_code == 200
+    r = app_client.get("/presign/multipart/parts", params={"object_key": key, "upload_id": upload_id}, headers=APIH)
+    assert r.status_code == 404
+    r = app_client.post("/presign/multipart/parts", json={"object_key": key, "upload_id": upload_id, "part_numbers": [0]}, headers=APIH)
+    assert r.status_code == 400
@@ -0,0 +1,43 @@
+import os
+import json
+import time
+import threading
+from app.jobs import sign_hmac
+
+APIH = {"X-API-Key": "secret"}
+
+def test_progress_webhook_streams_over_sse(app_client, put_input_video, stub_runpod_async, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+    job_id = app_client.post("/submit", json={"object_key": put_input_video}, headers=APIH).json()["job_id"]
+    sig = sign_hmac(os.environ["HMAC_SECRET"], job_id)
+
+    progress = {"stage": "processing", "frames_done": 10, "frames_total": 40, "fps": 2.5, "eta_s": 12.0}
+    r = app_client.post(f"/webhook/progress?job_id={job_id}&sig={sig}", json=progress)
+    assert r.status_code == 200
+    assert app_client.get(f"/status/{job_id}", headers=APIH).json()["progress"] == progress
+    assert app_client.post(f"/webhook/progress?job_id={job_id}&sig=bad", json=progress).status_code == 401
+
+    def _fire():
+        time.sleep(0.2)
+        app_client.post(f"/webhook/progress?job_id={job_id}&sig={sig}", json=dict(progress, frames_done=40))
+        time.sleep(0.1)
+        app_client.post(f"/webhook/runpod?job_id={job_id}&sig={sig}", json={"status": "ok"})
+
+    t = threading.Thread(target=_fire)
+    t.start()
+    events = []
+    with app_client.stream("GET", f"/events/{job_id}", headers=APIH) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        name = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                name = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((name, json.loads(line[len("data: "):])))
+    t.join()
+
+    assert events[0][1]["progress"]["frames_done"] == 10
+    assert any(data["progress"] and data["progress"]["frames_done"] == 40 for _, data in events)
+    assert events[-1][0] == "done"
+    assert events[-1][1]["status"] == "SUCCEEDED"
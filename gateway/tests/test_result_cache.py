@@ -0,0 +1,109 @@
+import os
+from app.jobs import sign_hmac
+
+APIH = {"X-API-Key": "secret"}
+
+def test_resubmit_hits_result_cache(app_client, put_input_video, s3_setup, monkeypatch):
+    import app.main as main
+    calls = []
+    async def mock_run_vsr(input_url, webhook_url, output_url, *args, **kwargs):
+        calls.append(kwargs)
+        return {"status": "ok", "id": "123", "info": {}}
+    monkeypatch.setattr(main, "run_vsr", mock_run_vsr)
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+
+    body = {"object_key": put_input_video, "scale": 2, "num_inference_steps": 20}
+    r = app_client.post("/submit", json=body, headers=APIH)
+    assert r.status_code == 200
+    job_id = r.json()["job_id"]
+    cache_url = calls[-1]["cache_url"]
+    assert cache_url.startswith(f"s3://{os.environ['S3_BUCKET']}/cache/")
+
+    # the worker copies its output to cache_url before firing the webhook
+    bucket, key = cache_url[5:].split("/", 1)
+    s3_setup.put_object(Bucket=bucket, Key=key, Body=b"out", ContentType="video/mp4")
+    sig = sign_hmac(os.environ["HMAC_SECRET"], job_id)
+    app_client.post(f"/webhook/runpod?job_id={job_id}&sig={sig}", json={"status": "ok", "output": {"presigned_url": "https://example.com/out.mp4"}})
+
+    r2 = app_client.post("/submit", json=body, headers=APIH)
+    assert r2.status_code == 200
+    assert r2.json()["status"] == "SUCCEEDED"
+    assert len(calls) == 1
+    js = app_client.get(f"/status/{r2.json()['job_id']}", headers=APIH).json()
+    assert js["status"] == "SUCCEEDED"
+    assert "cache/" in js["output"]["presigned_url"]
+
+    r3 = app_client.post("/submit", json=dict(body, scale=4), headers=APIH)
+    assert r3.json()["status"] == "SUBMITTED"
+    assert len(calls) == 2
+
+    stats = app_client.get("/cache/stats", headers=APIH).json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+def _finish(app_client, job_id, metrics=None):
+    sig = sign_hmac(os.environ["HMAC_SECRET"], job_id)
+    app_client.post(f"/webhook/runpod?job_id={job_id}&sig={sig}", json={"status": "ok", "output": {"presigned_url": "https://example.com/out.mp4"}, "metrics": metrics})
+
+def test_cache_key_covers_fps_metrics_and_remote_etag(app_client, s3_setup, monkeypatch):
+    import app.main as main
+    from app import result_cache
+    calls = []
+    async def mock_run_vsr(input_url, webhook_url, output_url, *args, **kwargs):
+        calls.append(kwargs)
+        return {"status": "ok", "id": "123", "info": {}}
+    monkeypatch.setattr(main, "run_vsr", mock_run_vsr)
+    etags = {"https://example.com/in.mp4": "v1"}
+    monkeypatch.setattr(result_cache, "remote_etag", lambda url: etags.get(url))
+
+    body = {"input_url": "https://example.com/in.mp4", "fps": 24, "metrics_mode": "nr_fast"}
+    job_id = app_client.post("/submit", json=body, headers=APIH).json()["job_id"]
+    bucket, key = calls[-1]["cache_url"][5:].split("/", 1)
+    s3_setup.put_object(Bucket=bucket, Key=key, Body=b"out", ContentType="video/mp4")
+    _finish(app_client, job_id, {"mode": "nr_fast", "sharp_mean": 40.0})
+
+    hit = app_client.post("/submit", json=body, headers=APIH).json()
+    assert hit["status"] == "SUCCEEDED"
+    assert app_client.get(f"/status/{hit['job_id']}", headers=APIH).json()["metrics"]["sharp_mean"] == 40.0
+
+    for changed in ({"fps": 60}, {"metrics_mode": "fr"}):
+        assert app_client.post("/submit", json=dict(body, **changed), headers=APIH).json()["status"] == "SUBMITTED"
+    # Same URL, new content.
+    etags["https://example.com/in.mp4"] = "v2"
+    assert app_client.post("/submit", json=body, headers=APIH).json()["status"] == "SUBMITTED"
+    # No ETag at all: the job runs uncached.
+    app_client.post("/submit", json=dict(body, input_url="https://example.com/other.mp4"), headers=APIH)
+    assert calls[-1]["cache_url"] is None
+    assert len(calls) == 5
+
+def test_expired_entry_deletes_cached_object(app_client, s3_setup, monkeypatch):
+    import app.main as main
+    bucket = os.environ["S3_BUCKET"]
+    object_key = main.result_cache.object_key("k")
+    s3_setup.put_object(Bucket=bucket, Key=object_key, Body=b"out")
+    main.jobs.put_cache_entry({"cache_key": "k", "object_key": object_key, "created_at": 0, "expires_at": 1})
+    assert main.result_cache.lookup("k") is None
+    assert s3_setup.list_objects_v2(Bucket=bucket, Prefix=object_key).get("KeyCount") == 0
+
+def test_hit_with_output_url_is_restored_by_worker(app_client, put_input_video, s3_setup, monkeypatch):
+    import app.main as main
+    calls = []
+    async def mock_run_vsr(input_url, webhook_url, output_url, *args, **kwargs):
+        calls.append((output_url, kwargs))
+        return {"status": "ok", "id": "123", "info": {}}
+    monkeypatch.setattr(main, "run_vsr", mock_run_vsr)
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+
+    body = {"object_key": put_input_video}
+    job_id = app_client.post("/submit", json=body, headers=APIH).json()["job_id"]
+    bucket, key = calls[-1][1]["cache_url"][5:].split("/", 1)
+    s3_setup.put_object(Bucket=bucket, Key=key, Body=b"out", ContentType="video/mp4")
+    _finish(app_client, job_id)
+    assert app_client.post("/submit", json=body, headers=APIH).json()["status"] == "SUCCEEDED"
+
+    # The gateway cannot write to the caller's output_url, so the job is
+    # dispatched and the worker copies the cached object there.
+    r = app_client.post("/submit", json=dict(body, output_url="https://example.com/mine.mp4"), headers=APIH)
+    assert r.json()["status"] == "SUBMITTED"
+    assert calls[-1][0] == "https://example.com/mine.mp4"
+    assert calls[-1][1]["cache_url"] == calls[0][1]["cache_url"]
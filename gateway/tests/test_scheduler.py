@@ -0,0 +1,115 @@
+import os
+import time
+import asyncio
+import pytest
+from app.jobs import sign_hmac
+
+APIH = {"X-API-Key": "secret"}
+
+@pytest.fixture(scope="function")
+def queue_jobs(env_defaults):
+    from app.jobs import Jobs
+    return Jobs()
+
+def _scheduler(jobs, max_in_flight):
+    from app.scheduler import Scheduler
+    dispatched = []
+    async def dispatch(job_ids, batch):
+        dispatched.append(job_ids)
+        return True
+    return Scheduler(jobs, dispatch, max_in_flight=max_in_flight, max_queued=100), dispatched
+
+def _queued(jobs, n):
+    return [jobs.create(input_url="https://example.com/in.mp4", output_url=None, status="QUEUED").job_id for _ in range(n)]
+
+def test_in_flight_limit_and_release(queue_jobs):
+    scheduler, dispatched = _scheduler(queue_jobs, max_in_flight=2)
+    ids = _queued(queue_jobs, 3)
+    for job_id in ids:
+        scheduler.enqueue([job_id], "t", 1.0)
+    asyncio.run(scheduler.pump())
+    assert dispatched == [[ids[0]], [ids[1]]]
+    assert scheduler.is_queued(ids[2])
+    assert queue_jobs.get(ids[0]).status == "SUBMITTED"
+
+    scheduler.release(ids[0])
+    asyncio.run(scheduler.pump())
+    assert dispatched[-1] == [ids[2]]
+    assert scheduler.stats()["in_flight"] == 2
+
+def test_cheap_jobs_and_other_tenants_go_first(queue_jobs):
+    scheduler, dispatched = _scheduler(queue_jobs, max_in_flight=1)
+    big = _queued(queue_jobs, 3)
+    for job_id in big:
+        scheduler.enqueue([job_id], "bulk", 400.0)
+    preview, other = _queued(queue_jobs, 2)
+    scheduler.enqueue([preview], "bulk", 4.0)
+    scheduler.enqueue([other], "interactive", 100.0)
+
+    order = []
+    for _ in range(5):
+        asyncio.run(scheduler.pump())
+        order.append(dispatched[-1][0])
+        scheduler.release(dispatched[-1][0])
+    assert order[:2] == [preview, other]
+    assert order[2:] == big
+
+def test_recover_rebuilds_queue_from_rows(queue_jobs):
+    scheduler, _ = _scheduler(queue_jobs, max_in_flight=1)
+    ids = _queued(queue_jobs, 3)
+    scheduler.enqueue(ids[:2], "t", 2.0, batch=True)
+    scheduler.enqueue(ids[2:], "t", 1.0)
+
+    restarted, dispatched = _scheduler(queue_jobs, max_in_flight=4)
+    restarted.recover()
+    assert restarted.stats()["queued"] == 3
+    asyncio.run(restarted.pump())
+    assert sorted(map(sorted, dispatched)) == sorted([sorted(ids[:2]), ids[2:]])
+
+def test_webhook_releases_slot_for_next_job(app_client, stub_runpod_async, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+    monkeypatch.setattr(main.scheduler, "max_in_flight", 1)
+
+    first = app_client.post("/submit", json={"input_url": "https://example.com/a.mp4"}, headers=APIH).json()
+    second = app_client.post("/submit", json={"input_url": "https://example.com/b.mp4"}, headers=APIH).json()
+    assert first["status"] == "SUBMITTED"
+    assert second["status"] == "QUEUED"
+    assert app_client.get("/queue/stats", headers=APIH).json()["queued"] == 1
+
+    sig = sign_hmac(os.environ["HMAC_SECRET"], first["job_id"])
+    app_client.post(f"/webhook/runpod?job_id={first['job_id']}&sig={sig}", json={"status": "ok", "output": {}})
+    assert app_client.get(f"/status/{second['job_id']}", headers=APIH).json()["status"] == "RUNNING"
+
+def test_rate_limit_per_api_key(app_client, stub_runpod_async, monkeypatch):
+    import app.main as main
+    from app.scheduler import RateLimiter
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+    monkeypatch.setattr(main, "rate_limiter", RateLimiter(per_minute=6, burst=2))
+    monkeypatch.setattr(main.settings, "api_keys", ["secret", "other"])
+
+    body = {"input_url": "https://example.com/a.mp4"}
+    codes = [app_client.post("/submit", json=body, headers=APIH).status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+    r = app_client.post("/submit", json=body, headers=APIH)
+    assert int(r.headers["Retry-After"]) >= 1
+    assert app_client.post("/submit", json=body, headers={"X-API-Key": "other"}).status_code == 200
+    assert app_client.post("/submit", json=body, headers={"X-API-Key": "unknown"}).status_code == 401
+
+def test_lost_webhook_slot_is_reclaimed_by_periodic_pump(app_client, stub_runpod_async, monkeypatch):
+    import app.main as main
+    from fastapi.testclient import TestClient
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+    monkeypatch.setattr(main.settings, "dispatch_slot_timeout_seconds", 0.2)
+    monkeypatch.setattr(main.settings, "dispatch_pump_seconds", 0.05)
+    monkeypatch.setattr(main.scheduler, "max_in_flight", 1)
+
+    with TestClient(main.app) as client:
+        client.post("/submit", json={"input_url": "https://example.com/a.mp4"}, headers=APIH)
+        second = client.post("/submit", json={"input_url": "https://example.com/b.mp4"}, headers=APIH).json()
+        assert second["status"] == "QUEUED"
+        # No webhook ever arrives for the first job.
+        deadline = time.monotonic() + 5
+        while client.get(f"/status/{second['job_id']}", headers=APIH).json()["status"] != "RUNNING":
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
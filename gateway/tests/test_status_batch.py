@@ -0,0 +1,18 @@
+APIH = {"X-API-Key": "secret"}
+
+def test_status_batch_resolves_known_and_missing_jobs(app_client, stub_runpod_async):
+    ids = []
+    for i in range(3):
+        r = app_client.post("/submit", json={"input_url": f"https://example.com/{i}.mp4"}, headers=APIH)
+        ids.append(r.json()["job_id"])
+
+    r = app_client.post("/status/batch", json={"job_ids": ids + ["missing"]}, headers=APIH)
+    assert r.status_code == 200
+    js = r.json()
+    assert [j["job_id"] for j in js["jobs"]] == ids
+    assert all(j["status"] == "RUNNING" for j in js["jobs"])
+    assert js["missing"] == ["missing"]
+
+def test_status_batch_rejects_more_than_100_ids(app_client):
+    r = app_client.post("/status/batch", json={"job_ids": [str(i) for i in range(101)]}, headers=APIH)
+    assert r.status_code == 422
@@ -0,0 +1,137 @@
+import json
+import time
+import asyncio
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+@pytest.fixture(scope="function")
+def runpod_standin():
+    """Local HTTP stand-in for the RunPod /run endpoint. Answers with the
+    queued status codes (then 200) and records the requests it saw."""
+    state = {"statuses": [], "requests": [], "peers": set(), "delay": 0.0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            state["requests"].append((self.path, self.headers.get("Authorization"), body))
+            state["peers"].add(self.client_address)
+            time.sleep(state["delay"])
+            code = state["statuses"].pop(0) if state["statuses"] else 200
+            data = json.dumps({"id": f"rp-{len(state['requests'])}", "status": "IN_QUEUE"} if code == 200 else {"error": code}).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{server.server_address[1]}/v2"
+    yield state
+    server.shutdown()
+
+def _client(standin, **overrides):
+    from app.vsr_client import RunpodClient
+    client = RunpodClient(base_url=standin["url"], api_key="rk", endpoint_id="ep")
+    client.backoff = 0.001
+    for k, v in overrides.items():
+        setattr(client, k, v)
+    return client
+
+def test_retries_transient_errors_on_pooled_connection(runpod_standin):
+    runpod_standin["statuses"] = [503, 429]
+    client = _client(runpod_standin)
+
+    async def go():
+        first = await client.run({"input": {"n": 1}})
+        second = await client.run({"input": {"n": 2}})
+        await client.aclose()
+        return first, second
+
+    first, second = asyncio.run(go())
+    assert first["id"] == "rp-3" and second["id"] == "rp-4"
+    assert all(path == "/v2/ep/run" and auth == "Bearer rk" for path, auth, _ in runpod_standin["requests"])
+    assert len(runpod_standin["peers"]) == 1
+    stats = client.stats()
+    assert stats["attempts"] == 4 and stats["retries"] == 2
+    assert stats["request_seconds"]["count"] == 4
+
+@pytest.mark.parametrize("status", [400, 502, 504])
+def test_errors_after_possible_acceptance_are_not_retried(runpod_standin, status):
+    from app.vsr_client import RunpodError
+    runpod_standin["statuses"] = [status]
+    client = _client(runpod_standin)
+    with pytest.raises(RunpodError):
+        asyncio.run(client.run({"input": {}}))
+    assert len(runpod_standin["requests"]) == 1
+
+def test_read_timeout_is_not_retried(runpod_standin, monkeypatch):
+    from app.vsr_client import RunpodError
+    monkeypatch.setattr("app.vsr_client.settings.runpod_timeout_seconds", 0.05)
+    runpod_standin["delay"] = 0.2
+    client = _client(runpod_standin)
+    with pytest.raises(RunpodError):
+        asyncio.run(client.run({"input": {}}))
+    assert len(runpod_standin["requests"]) == 1
+
+def test_cancelled_trial_call_does_not_wedge_breaker(runpod_standin):
+    from app.vsr_client import CircuitBreaker
+    client = _client(runpod_standin, breaker=CircuitBreaker(threshold=1, cooldown=0.0))
+    client.breaker.record(False)
+    runpod_standin["delay"] = 0.2
+
+    async def go():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.run({"input": {}}), 0.05)
+        runpod_standin["delay"] = 0.0
+        return await client.run({"input": {}})
+
+    assert asyncio.run(go())["status"] == "IN_QUEUE"
+    assert client.breaker.state == "closed"
+
+def test_circuit_breaker_fails_fast_then_recovers(runpod_standin):
+    from app.vsr_client import CircuitBreaker, CircuitOpenError, RunpodError
+    runpod_standin["statuses"] = [503] * 4
+    client = _client(runpod_standin, retries=1, breaker=CircuitBreaker(threshold=2, cooldown=0.05))
+
+    async def go():
+        for _ in range(2):
+            with pytest.raises(RunpodError):
+                await client.run({"input": {}})
+        with pytest.raises(CircuitOpenError):
+            await client.run({"input": {}})
+        seen = len(runpod_standin["requests"])
+        await asyncio.sleep(0.06)
+        result = await client.run({"input": {}})
+        return seen, result
+
+    seen, result = asyncio.run(go())
+    assert seen == 4
+    assert result["id"] == "rp-5"
+    assert client.breaker.state == "closed"
+
+def test_submit_batch_dispatches_groups_concurrently(app_client, monkeypatch):
+    import app.main as main
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+    monkeypatch.setattr(main.settings, "batch_max_jobs", 2)
+    in_flight, peak = [0], [0]
+
+    async def mock_run_vsr_batch(items, webhook_url, *args):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        return {"id": webhook_url[-8:]}
+    monkeypatch.setattr(main, "run_vsr_batch", mock_run_vsr_batch)
+
+    items = [{"input_url": f"https://example.com/{i}.mp4"} for i in range(10)]
+    r = app_client.post("/submit/batch", json={"items": items}, headers={"X-API-Key": "secret"})
+    assert r.status_code == 200
+    assert len(r.json()["jobs"]) == 10
+    assert peak[0] == 5
@@ -32,3 +32,42 @@ def test_async_submit_and_webhook(app_client, put_input_video, stub_runpod_async
     assert js["status"] == "SUCCEEDED"
     assert js["output"]["presigned_url"] == "https://example.com/out.mp4"
     assert js["metrics"]["mode"] == "nr_fast"
+
+
+def test_submit_engine_selection(app_client, put_input_video, monkeypatch):
+    import app.main as main
+    calls = []
+    async def mock_run_vsr(input_url, webhook_url, output_url, *args, **kwargs):
+        calls.append(kwargs)
+        return {"status": "ok", "id": "123", "info": {}}
+    monkeypatch.setattr(main, "run_vsr", mock_run_vsr)
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+
+    r = app_client.post("/submit", json={"object_key": put_input_video, "engine": "classic"}, headers=APIH)
+    assert r.status_code == 200
+    assert calls[-1]["engine"] == "classic"
+
+    app_client.post("/submit", json={"object_key": put_input_video, "guidance_scale": 3}, headers=APIH)
+    assert calls[-1]["guidance_scale"] == 3
+
+    r_bad = app_client.post("/submit", json={"object_key": put_input_video, "engine": "nope"}, headers=APIH)
+    assert r_bad.status_code == 400
+
+def test_uploads_are_presigned_at_dispatch(app_client, put_input_video, monkeypatch):
+    import app.main as main
+    urls = []
+    async def mock_run_vsr(input_url, webhook_url, output_url, *args, **kwargs):
+        urls.append(input_url)
+        return {"status": "ok", "id": "123", "info": {}}
+    monkeypatch.setattr(main, "run_vsr", mock_run_vsr)
+    monkeypatch.setattr(main.settings, "moderation_enabled", False)
+    presigned = []
+    monkeypatch.setattr(main, "presign_get", lambda key, expire=900: presigned.append((key, expire)) or f"https://signed.example.com/{key}")
+
+    r = app_client.post("/submit", json={"object_key": put_input_video}, headers=APIH)
+    assert r.status_code == 200
+    row = main.jobs.get(r.json()["job_id"])
+    assert row.object_key == put_input_video
+    assert row.input_url.startswith("s3://")
+    assert presigned == [(put_input_video, main.settings.dispatch_input_url_expire_seconds)]
+    assert urls == [f"https://signed.example.com/{put_input_video}"]
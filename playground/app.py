@@ -1,12 +1,18 @@
 import io
 import os
+import json
+import math
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 import streamlit as st
 
 gateway = os.environ.get("GATEWAY_URL", "http://localhost:8080")
 api_key = os.environ.get("API_KEY", None)
+part_size = int(os.environ.get("UPLOAD_PART_SIZE", str(16 * 1024 * 1024)))
+upload_workers = int(os.environ.get("UPLOAD_WORKERS", "8"))
 
 st.set_page_config(
     page_title="Valence Playground",
@@ -21,12 +27,126 @@ fps = st.selectbox("FPS", [30, 60], index=0)
 num_inference_steps = st.selectbox("Num Inference Steps", [25, 50], index=0)
 guidance_scale = st.selectbox("Guidance Scale", [1.0, 2.0], index=0)
 
+def put_part(url: str, data: bytes, attempts: int = 4) -> str:
+    for attempt in range(attempts):
+        try:
+            response = requests.put(url, data=data, timeout=600)
+            response.raise_for_status()
+            return response.headers["ETag"]
+        except requests.RequestException:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+def upload_multipart(data: bytes, upload: dict, progress_bar) -> str:
+    """Upload `data` in parallel parts. `upload` holds the object key and
+    upload id in session state, so pressing Submit again after a dropped
+    connection resumes with the parts S3 does not have yet."""
+    headers = {"X-API-Key": api_key}
+    if "upload_id" not in upload:
+        response = requests.post(f"{gateway}/presign/multipart/create", params={"object_key": upload["key"]}, headers=headers, timeout=30)
+        response.raise_for_status()
+        upload["upload_id"] = response.json()["upload_id"]
+        done = []
+    else:
+        response = requests.get(f"{gateway}/presign/multipart/parts", params={"object_key": upload["key"], "upload_id": upload["upload_id"]}, headers=headers, timeout=30)
+        response.raise_for_status()
+        done = response.json()["parts"]
+
+    total_parts = max(1, math.ceil(len(data) / part_size))
+    have = {p["part_number"] for p in done if p["size"] == len(data[(p["part_number"] - 1) * part_size:p["part_number"] * part_size])}
+    parts = [p for p in done if p["part_number"] in have]
+    missing = [n for n in range(1, total_parts + 1) if n not in have]
+    sent = sum(p["size"] for p in parts)
+
+    for i in range(0, len(missing), 1000):
+        response = requests.post(
+            f"{gateway}/presign/multipart/parts",
+            json={"object_key": upload["key"], "upload_id": upload["upload_id"], "part_numbers": missing[i:i + 1000]},
+            headers=headers,
+            timeout=30
+        )
+        response.raise_for_status()
+        urls = {p["part_number"]: p["upload_url"] for p in response.json()["parts"]}
+        with ThreadPoolExecutor(max_workers=upload_workers) as pool:
+            futures = {
+                pool.submit(put_part, urls[n], data[(n - 1) * part_size:n * part_size]): n
+                for n in urls
+            }
+            for future in as_completed(futures):
+                n = futures[future]
+                size = len(data[(n - 1) * part_size:n * part_size])
+                parts.append({"part_number": n, "etag": future.result()})
+                sent += size
+                progress_bar.progress(sent / len(data), text=f"Uploading · {sent / 2**20:.0f} / {len(data) / 2**20:.0f} MiB")
+
+    response = requests.post(
+        f"{gateway}/presign/multipart/complete",
+        json={"object_key": upload["key"], "upload_id": upload["upload_id"], "parts": parts},
+        headers=headers,
+        timeout=120
+    )
+    response.raise_for_status()
+    return upload["key"]
+
 if st.button("Submit", disabled=(uploaded_file is None)):
-    key = f"uploades/{uuid.uuid4().hex}.mp4"
+    data = uploaded_file.getvalue()
+    upload_progress = st.progress(0.0, text="Uploading")
+    file_id = (uploaded_file.name, len(data))
+    upload = st.session_state.get("upload")
+    if not upload or upload.get("file") != file_id:
+        upload = {"file": file_id, "key": f"uploads/{uuid.uuid4().hex}.mp4"}
+        st.session_state["upload"] = upload
+    key = upload_multipart(data, upload, upload_progress)
+    st.session_state.pop("upload", None)
+
     response = requests.post(
-        f"{gateway}/presign/upload",
-        params={"object_key": key},
+        f"{gateway}/submit",
+        json={
+            "object_key": key,
+            "scale": int(scale),
+            "fps": fps,
+            "num_inference_steps": num_inference_steps,
+            "guidance_scale": int(guidance_scale)
+        },
         headers={"X-API-Key": api_key},
-        timeout=30
+        timeout=60
     )
-    response.raise_for_status()
\ No newline at end of file
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    st.write(f"Job `{job_id}` submitted")
+
+    progress_bar = st.progress(0.0, text="Queued")
+    result = None
+    with requests.get(
+        f"{gateway}/events/{job_id}",
+        headers={"X-API-Key": api_key},
+        stream=True,
+        timeout=(10, None)
+    ) as events:
+        events.raise_for_status()
+        event = None
+        for line in events.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "done":
+                    result = data
+                    break
+                progress = data.get("progress") or {}
+                done, total = progress.get("frames_done") or 0, progress.get("frames_total")
+                text = progress.get("stage", data.get("status", "")).capitalize()
+                if progress.get("fps"):
+                    text += f" · {progress['fps']:.2f} fps"
+                if progress.get("eta_s") is not None:
+                    text += f" · ETA {progress['eta_s']:.0f}s"
+                progress_bar.progress(min(done / total, 1.0) if total else 0.0, text=text)
+
+    if result and result["status"] == "SUCCEEDED":
+        progress_bar.progress(1.0, text="Done")
+        st.video(result["output"]["presigned_url"])
+        if result.get("metrics"):
+            st.json(result["metrics"])
+    else:
+        st.error((result or {}).get("error") or "Job did not finish")
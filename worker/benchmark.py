@@ -0,0 +1,312 @@
+"""Reproducible CPU benchmark for the worker pipeline.
+
+Generates synthetic test videos with ffmpeg, swaps the StableVSR pipeline
+for a stub with a configurable per-frame cost, and runs the real handler
+end to end against a local moto S3 server: download, decode, windowed
+inference, stitching, encode and upload. Each case is repeated and the
+per-stage timings, window latency, throughput and peak RSS are written to
+JSON, optionally compared with a stored baseline.
+
+    pip install -r requirements.txt -r requirements-bench.txt
+    python benchmark.py --output bench.json --save-baseline benchmarks/baseline.json
+    python benchmark.py --baseline benchmarks/baseline.json
+
+Exits with status 1 when a compared timing regresses by more than
+--tolerance. Only the in-process pipeline is exercised: sharded CPU pools
+(VSR_PROCESSES > 1) would load the real model in their own processes.
+"""
+import os
+
+os.environ["PRELOAD_MODEL"] = "0"
+os.environ["VSR_PROCESSES"] = "1"
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("AWS_REGION", "us-east-1")
+
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from types import SimpleNamespace
+
+import cv2
+import boto3
+import numpy as np
+from moto.server import ThreadedMotoServer
+
+import vsr_handler
+from transfer import RangeDownloader
+
+BUCKET = "valence-bench"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+class StubPipe:
+    """Stands in for StableVSRPipeline: resizes each frame and spends
+    `cost_ms` per input frame per inference step, either sleeping (a GPU
+    that leaves the CPU free) or spinning (CPU inference). Every call's
+    latency is kept so window percentiles can be reported."""
+
+    def __init__(self, cost_ms: float = 2.0, spin: bool = False):
+        self.cost_ms = cost_ms
+        self.spin = spin
+        self.calls: list[float] = []
+
+    def __call__(self, frames: list, scale: float = 2.0, num_inference_steps: int = 25, guidance_scale: float = 1.0, **_):
+        t0 = time.perf_counter()
+        height, width = np.asarray(frames[0]).shape[:2]
+        size = (round(width * scale), round(height * scale))
+        out = [cv2.resize(np.asarray(f), size, interpolation=cv2.INTER_LINEAR) for f in frames]
+        deadline = t0 + self.cost_ms / 1000.0 * len(frames) * num_inference_steps
+        if self.spin:
+            while time.perf_counter() < deadline:
+                pass
+        else:
+            time.sleep(max(deadline - time.perf_counter(), 0.0))
+        self.calls.append(time.perf_counter() - t0)
+        return SimpleNamespace(frames=out)
+
+class StubLoader:
+    def __init__(self, pipe: StubPipe):
+        self.pipe = pipe
+        self.timings: dict[str, float] = {}
+
+    def get(self) -> StubPipe:
+        return self.pipe
+
+class PeakMemory:
+    """Samples this process's resident set size on a background thread."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss() -> int:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def __enter__(self):
+        self.start = self.peak = self.rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+
+def synth_video(path: str, width: int, height: int, frames: int, fps: int):
+    """Deterministic moving test pattern with noise, encoded as faststart
+    H.264 so it can also be streamed front to back."""
+    if os.path.exists(path):
+        return
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}",
+        "-vf", "noise=alls=12:allf=t+u:all_seed=7",
+        "-frames:v", str(frames),
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-threads", "1",
+        "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+        path
+    ], check=True)
+
+def percentiles(values: list[float]) -> dict:
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 6),
+        "p95": round(float(np.percentile(values, 95)), 6),
+        "mean": round(float(values.mean()), 6),
+        "min": round(float(values.min()), 6),
+        "max": round(float(values.max()), 6),
+        "n": int(values.size)
+    }
+
+def run_case(args, s3, pipe: StubPipe, workdir: str, width: int, height: int, frames: int) -> dict:
+    name = f"{width}x{height}_{frames}f"
+    path = os.path.join(workdir, f"{name}.mp4")
+    synth_video(path, width, height, frames, args.fps)
+    key = f"inputs/{name}.mp4"
+    s3.upload_file(path, BUCKET, key)
+    video_url = f"s3://{BUCKET}/{key}"
+    if args.stream_input:
+        video_url = s3.generate_presigned_url("get_object", Params={"Bucket": BUCKET, "Key": key}, ExpiresIn=3600)
+    body = {
+        "video_url": video_url,
+        "scale_factor": args.scale,
+        "num_inference_steps": args.steps,
+        "fps": args.fps,
+        "engine": args.engine,
+        "window": args.window,
+        "dedup_threshold": None,
+        "metrics_mode": args.metrics_mode,
+        "stream_input": args.stream_input,
+        "processes": 1
+    }
+
+    stages: dict[str, list[float]] = {}
+    totals, peaks, windows = [], [], []
+    for i in range(args.warmup + args.repeats):
+        body["output_url"] = f"s3://{BUCKET}/outputs/{name}_{i}.mp4"
+        pipe.calls.clear()
+        with PeakMemory() as memory:
+            t0 = time.perf_counter()
+            result = vsr_handler.handler({"input": dict(body)}, None)
+            total = time.perf_counter() - t0
+        if result.get("status") != "ok":
+            raise RuntimeError(f"{name}: handler returned {result}")
+        if i < args.warmup:
+            continue
+        totals.append(total)
+        peaks.append(memory.peak - memory.start)
+        windows += pipe.calls
+        timings = result["timings"]
+        for timing, value in timings.items():
+            if timing.endswith("_s"):
+                stages.setdefault(timing[:-2], []).append(value)
+        for stage, stats in timings["pipeline"]["stages"].items():
+            stages.setdefault(stage, []).append(stats["busy_s"])
+        stages.setdefault("pipeline", []).append(timings["pipeline"]["wall_s"])
+
+    report = {
+        "width": width,
+        "height": height,
+        "frames": frames,
+        "end_to_end_s": percentiles(totals),
+        "throughput_fps": round(frames / float(np.median(totals)), 3),
+        "stages_s": {stage: percentiles(values) for stage, values in stages.items()},
+        "peak_rss_delta_mb": round(max(peaks) / 2 ** 20, 1)
+    }
+    if windows:
+        report["window_s"] = percentiles(windows)
+
+    # Transfer classes on their own, outside the handler.
+    url = s3.generate_presigned_url("get_object", Params={"Bucket": BUCKET, "Key": key}, ExpiresIn=3600)
+    range_times, s3_times = [], []
+    for _ in range(args.repeats):
+        t0 = time.perf_counter()
+        RangeDownloader(url).download(os.path.join(workdir, "range.mp4"))
+        range_times.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        vsr_handler.VideoDownloader(f"s3://{BUCKET}/{key}", tempfile.mkdtemp(dir=workdir), client=s3).download()
+        s3_times.append(time.perf_counter() - t0)
+    size_mb = os.path.getsize(path) / 2 ** 20
+    report["transfer"] = {
+        "size_mb": round(size_mb, 3),
+        "range_download_s": percentiles(range_times),
+        "s3_download_s": percentiles(s3_times)
+    }
+    return report
+
+def compare(current: dict, baseline: dict, tolerance: float) -> dict:
+    """Ratio of current to baseline p50 for every timing both runs have."""
+    rows = {}
+    for name, case in current["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            continue
+        pairs = {"end_to_end": (case["end_to_end_s"], base["end_to_end_s"])}
+        for stage, stats in case["stages_s"].items():
+            if stage in base["stages_s"]:
+                pairs[stage] = (stats, base["stages_s"][stage])
+        for metric, (now, then) in pairs.items():
+            if then["p50"] <= 0:
+                continue
+            ratio = now["p50"] / then["p50"]
+            verdict = "regression" if ratio > 1 + tolerance else "improvement" if ratio < 1 - tolerance else "same"
+            rows[f"{name}.{metric}"] = {"baseline_p50": then["p50"], "p50": now["p50"], "ratio": round(ratio, 3), "verdict": verdict}
+    return rows
+
+def parse_sizes(value: str) -> list[tuple[int, int]]:
+    return [tuple(int(n) for n in size.split("x")) for size in value.split(",")]
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("320x180,640x360,1280x720"), help="comma-separated WxH input sizes")
+    parser.add_argument("--frames", type=lambda v: [int(n) for n in v.split(",")], default=[32, 128], help="comma-separated clip lengths")
+    parser.add_argument("--fps", type=int, default=24)
+    parser.add_argument("--scale", type=float, default=2.0)
+    parser.add_argument("--steps", type=int, default=2)
+    parser.add_argument("--window", type=int, default=16)
+    parser.add_argument("--engine", default="stablevsr", choices=["stablevsr", "classic"])
+    parser.add_argument("--metrics-mode", default="off", choices=["off", "nr_fast"])
+    parser.add_argument("--stream-input", action="store_true", help="stream the input over a presigned URL instead of downloading it first")
+    parser.add_argument("--cost-ms", type=float, default=2.0, help="stub cost per input frame per inference step")
+    parser.add_argument("--spin", action="store_true", help="burn CPU for the stub cost instead of sleeping")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--workdir", help="where synthetic videos are kept between runs (default: a temporary directory)")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="compare against this report")
+    parser.add_argument("--save-baseline", help="also write the report here as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed p50 slowdown before a timing counts as a regression")
+    args = parser.parse_args(argv)
+
+    pipe = StubPipe(args.cost_ms, args.spin)
+    vsr_handler.loader = StubLoader(pipe)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    try:
+        host, port = server.get_host_and_port()
+        s3 = boto3.client("s3", endpoint_url=f"http://{host}:{port}", region_name=os.environ["AWS_REGION"])
+        s3.create_bucket(Bucket=BUCKET)
+        vsr_handler.s3_client = s3
+        with tempfile.TemporaryDirectory() as tmp:
+            workdir = args.workdir or tmp
+            os.makedirs(workdir, exist_ok=True)
+            cases = {}
+            for width, height in args.sizes:
+                for frames in args.frames:
+                    name = f"{width}x{height}_{frames}f"
+                    print(f"running {name}", file=sys.stderr)
+                    cases[name] = run_case(args, s3, pipe, workdir, width, height, frames)
+    finally:
+        server.stop()
+
+    report = {
+        "env": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "device": vsr_handler.device
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "save_baseline", "workdir")},
+        "cases": cases
+    }
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+        for metric, row in report["comparison"].items():
+            print(f"{metric:40s} {row['baseline_p50']:10.4f} -> {row['p50']:10.4f}  x{row['ratio']:.3f}  {row['verdict']}", file=sys.stderr)
+        regressed = any(row["verdict"] == "regression" for row in report["comparison"].values())
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            f.write(text + "\n")
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
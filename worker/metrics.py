@@ -0,0 +1,64 @@
+import os
+import resource
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, push_to_gateway
+
+SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+registry = CollectorRegistry()
+
+stage_seconds = Histogram(
+    "valence_worker_stage_seconds", "Time spent per job in each stage",
+    ["stage", "engine"], buckets=SECONDS_BUCKETS, registry=registry
+)
+window_seconds = Histogram(
+    "valence_worker_window_inference_seconds", "Time to upscale one temporal window",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120), registry=registry
+)
+job_fps = Gauge("valence_worker_job_fps", "Output frames per second of the last job", ["engine"], registry=registry)
+frames_total = Counter("valence_worker_frames_total", "Frames written", ["engine"], registry=registry)
+jobs_total = Counter("valence_worker_jobs_total", "Jobs handled", ["engine", "status"], registry=registry)
+peak_rss = Gauge("valence_worker_peak_rss_bytes", "Peak resident set size of the worker process", registry=registry)
+device_peak = Gauge("valence_worker_device_peak_memory_bytes", "Peak device memory allocated during the last job", registry=registry)
+queue_depth = Gauge("valence_worker_queue_max_depth", "Deepest a pipeline queue got during the last job", ["queue"], registry=registry)
+
+_model_load_recorded = False
+
+def observe_job(engine: str, timings: dict, frames: int | None, device_peak_bytes: int | None = None):
+    """Record one finished job from the timings dict the handler returns:
+    `<stage>_s` entries (download, upload, ...), the pipeline's per-stage
+    busy time and queue depth (decode, infer, encode) and, once per process,
+    the model load."""
+    global _model_load_recorded
+    for key, value in timings.items():
+        if key.endswith("_s") and isinstance(value, (int, float)):
+            stage_seconds.labels(key[:-2], engine).observe(value)
+    pipeline = timings.get("pipeline") or {}
+    for name, stats in (pipeline.get("stages") or {}).items():
+        stage_seconds.labels(name, engine).observe(stats["busy_s"])
+        queue_depth.labels(name).set(stats.get("max_queue", 0))
+    model_load = timings.get("model_load") or {}
+    if "total_s" in model_load and not _model_load_recorded:
+        stage_seconds.labels("model_load", engine).observe(model_load["total_s"])
+        _model_load_recorded = True
+    if frames is None:
+        frames = ((pipeline.get("stages") or {}).get("infer") or {}).get("items")
+    if frames and pipeline.get("wall_s"):
+        job_fps.labels(engine).set(frames / pipeline["wall_s"])
+        frames_total.labels(engine).inc(frames)
+    # ru_maxrss is in KiB on Linux.
+    peak_rss.set(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+    if device_peak_bytes is not None:
+        device_peak.set(device_peak_bytes)
+
+def push():
+    """Push the worker's metrics to the Pushgateway, grouped per worker so
+    jobs on different pods do not overwrite each other. Best effort."""
+    url = os.environ.get("PUSHGATEWAY_URL")
+    if not url:
+        return
+    instance = os.environ.get("RUNPOD_POD_ID") or os.environ.get("HOSTNAME") or "local"
+    try:
+        push_to_gateway(url, job="valence_worker", grouping_key={"instance": instance}, registry=registry, timeout=5)
+    except Exception:
+        pass
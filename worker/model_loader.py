@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import threading
+
+import torch
+
+from huggingface_hub import login, snapshot_download
+
+MANIFEST = ".valence_manifest.json"
+WEIGHT_PATTERNS = ["*.json", "*.txt", "*.safetensors", "*.model"]
+
+class ModelLoader:
+    """Loads the StableVSR pipeline from a local, pre-materialized cache.
+
+    The first load on a host snapshots the safetensors weights from the hub
+    into `cache_dir` and writes a manifest of file sizes; later loads that
+    find a matching manifest skip the hub entirely and let safetensors
+    memory-map the weights. start() loads on a background thread so the
+    handler can fetch its input meanwhile; get() blocks until the pipeline
+    is ready.
+    """
+
+    def __init__(self, model_id: str, cache_dir: str, device: str, dtype: torch.dtype):
+        self.model_id = model_id
+        self.cache_dir = cache_dir
+        self.device = device
+        self.dtype = dtype
+        self.timings: dict[str, float] = {}
+        self._pipe = None
+        self._error = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def cache_valid(self) -> bool:
+        path = os.path.join(self.cache_dir, MANIFEST)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if manifest.get("model_id") != self.model_id:
+            return False
+        for name, size in manifest.get("files", {}).items():
+            file_path = os.path.join(self.cache_dir, name)
+            if not os.path.isfile(file_path) or os.path.getsize(file_path) != size:
+                return False
+        return bool(manifest.get("files"))
+
+    def materialize(self):
+        t0 = time.perf_counter()
+        hf_token = os.environ.get("HF_TOKEN")
+        if hf_token:
+            login(token=hf_token)
+        snapshot_download(self.model_id, local_dir=self.cache_dir, allow_patterns=WEIGHT_PATTERNS)
+        files = {}
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name == MANIFEST or ".cache" in root:
+                    continue
+                file_path = os.path.join(root, name)
+                files[os.path.relpath(file_path, self.cache_dir)] = os.path.getsize(file_path)
+        with open(os.path.join(self.cache_dir, MANIFEST), "w") as f:
+            json.dump({"model_id": self.model_id, "files": files}, f)
+        self.timings["fetch_s"] = time.perf_counter() - t0
+
+    def load(self):
+        # Only the worker image's diffusers build ships StableVSRPipeline;
+        # importing it here keeps this module importable for CPU-only tests.
+        from diffusers import StableVSRPipeline
+
+        t0 = time.perf_counter()
+        if not self.cache_valid():
+            self.materialize()
+        self.timings["cache_hit"] = "fetch_s" not in self.timings
+
+        t1 = time.perf_counter()
+        pipe = StableVSRPipeline.from_pretrained(
+            self.cache_dir,
+            torch_dtype=self.dtype,
+            use_safetensors=True,
+            local_files_only=True
+        )
+        self.timings["deserialize_s"] = time.perf_counter() - t1
+
+        t1 = time.perf_counter()
+        pipe = pipe.to(self.device)
+        pipe.enable_attention_slicing()
+        pipe.set_progress_bar_config(disable=True)
+        if self.device == "cuda":
+            torch.cuda.synchronize()
+        self.timings["to_device_s"] = time.perf_counter() - t1
+        self.timings["total_s"] = time.perf_counter() - t0
+        self._pipe = pipe
+        return pipe
+
+    def _load_background(self):
+        try:
+            self.load()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._ready.set()
+
+    def start(self) -> "ModelLoader":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load_background, name="model-loader", daemon=True)
+            self._thread.start()
+        return self
+
+    def get(self, timeout: float | None = None):
+        self.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"Model {self.model_id} not loaded after {timeout}s")
+        if self._error is not None:
+            raise self._error
+        return self._pipe
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+if __name__ == "__main__":
+    loader = ModelLoader(
+        os.environ.get("MODEL_ID", "claudiom4sir/StableVSR"),
+        os.environ.get("MODEL_CACHE_DIR", "/models/stablevsr"),
+        "cpu",
+        torch.float32
+    )
+    if not loader.cache_valid():
+        loader.materialize()
+    print(json.dumps(loader.timings))
@@ -0,0 +1,121 @@
+import time
+import queue
+import threading
+from dataclasses import dataclass, asdict
+from typing import Callable, Iterable, Iterator
+
+_DONE = object()
+_POLL = 0.1
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    busy_s: float = 0.0
+    wait_input_s: float = 0.0
+    wait_output_s: float = 0.0
+    total_s: float = 0.0
+    max_queue: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+class PipelineAborted(Exception):
+    pass
+
+class Pipeline:
+    """Runs generator stages on their own threads, linked by bounded queues.
+
+    A stage is a callable that takes an iterator of upstream items (None for
+    the first stage) and returns an iterable of downstream items. Time spent
+    blocked on an empty input queue is recorded as wait_input_s (the stage is
+    starved), time blocked on a full output queue as wait_output_s (the stage
+    is back-pressured); whatever remains is busy_s.
+    """
+
+    def __init__(self):
+        self._stages: list[tuple[str, Callable, int]] = []
+        self._stop = threading.Event()
+        self._errors: list[BaseException] = []
+        self.stats: dict[str, StageStats] = {}
+        self.wall_s = 0.0
+
+    def add_stage(self, name: str, fn: Callable[[Iterator | None], Iterable | None], maxsize: int = 2) -> "Pipeline":
+        self._stages.append((name, fn, maxsize))
+        self.stats[name] = StageStats(name)
+        return self
+
+    def _get(self, q: queue.Queue, stats: StageStats) -> Iterator:
+        while True:
+            t0 = time.perf_counter()
+            while True:
+                if self._stop.is_set():
+                    raise PipelineAborted()
+                try:
+                    item = q.get(timeout=_POLL)
+                    break
+                except queue.Empty:
+                    continue
+            stats.wait_input_s += time.perf_counter() - t0
+            if item is _DONE:
+                return
+            yield item
+
+    def _put(self, q: queue.Queue, item, stats: StageStats):
+        t0 = time.perf_counter()
+        while True:
+            if self._stop.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=_POLL)
+                break
+            except queue.Full:
+                continue
+        stats.wait_output_s += time.perf_counter() - t0
+        stats.max_queue = max(stats.max_queue, q.qsize())
+
+    def _run_stage(self, fn: Callable, inq: queue.Queue | None, outq: queue.Queue | None, stats: StageStats):
+        t0 = time.perf_counter()
+        try:
+            items = fn(self._get(inq, stats) if inq is not None else None)
+            for item in items or ():
+                stats.items += 1
+                if outq is not None:
+                    self._put(outq, item, stats)
+            if outq is not None:
+                self._put(outq, _DONE, stats)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            stats.total_s = time.perf_counter() - t0
+            stats.busy_s = max(stats.total_s - stats.wait_input_s - stats.wait_output_s, 0.0)
+
+    def run(self) -> dict[str, dict]:
+        t0 = time.perf_counter()
+        queues = [queue.Queue(maxsize=maxsize) for _, _, maxsize in self._stages[:-1]]
+        threads = []
+        for i, (name, fn, _) in enumerate(self._stages):
+            inq = queues[i - 1] if i > 0 else None
+            outq = queues[i] if i < len(queues) else None
+            thread = threading.Thread(
+                target=self._run_stage,
+                args=(fn, inq, outq, self.stats[name]),
+                name=f"pipeline-{name}",
+                daemon=True
+            )
+            threads.append(thread)
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_s = time.perf_counter() - t0
+        if self._errors:
+            raise self._errors[0]
+        return self.report()
+
+    def report(self) -> dict[str, dict]:
+        stages = {name: stats.to_dict() for name, stats in self.stats.items()}
+        bottleneck = max(self.stats.values(), key=lambda s: s.busy_s).name if self.stats else None
+        return {"wall_s": self.wall_s, "bottleneck": bottleneck, "stages": stages}
@@ -0,0 +1,92 @@
+import json
+import time
+import threading
+import urllib.request
+from typing import Iterable, Iterator
+
+import runpod
+
+class ProgressReporter:
+    """Sends best-effort progress events for a job.
+
+    Events go to the gateway's signed progress webhook when the job carries
+    a progress_url, otherwise through RunPod's progress_update. Sending
+    happens on a background thread that only keeps the latest event, so a
+    slow or failing endpoint never stalls the pipeline.
+    """
+
+    def __init__(self, url: str | None = None, job: dict | None = None, total_frames: int | None = None, interval: float = 1.0, timeout: float = 5.0):
+        self.url = url
+        self.job = job
+        self.total_frames = total_frames
+        self.interval = interval
+        self.timeout = timeout
+        self.stage_name = "queued"
+        self.frames_done = 0
+        self._started = None
+        self._last_sent = 0.0
+        self._pending = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._sender, name="progress", daemon=True)
+        self._thread.start()
+
+    def event(self) -> dict:
+        event = {"stage": self.stage_name, "frames_done": self.frames_done, "frames_total": self.total_frames, "fps": None, "eta_s": None}
+        if self._started is not None and self.frames_done:
+            fps = self.frames_done / max(time.perf_counter() - self._started, 1e-6)
+            event["fps"] = round(fps, 3)
+            if self.total_frames:
+                event["eta_s"] = round(max(self.total_frames - self.frames_done, 0) / fps, 1)
+        return event
+
+    def stage(self, name: str):
+        self.stage_name = name
+        self.send(force=True)
+
+    def track(self, frames: Iterable) -> Iterator:
+        self._started = time.perf_counter()
+        for frame in frames:
+            self.frames_done += 1
+            self.send()
+            yield frame
+
+    def send(self, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self._last_sent < self.interval:
+            return
+        self._last_sent = now
+        with self._cond:
+            self._pending = self.event()
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(self.timeout)
+
+    def _sender(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                event, self._pending = self._pending, None
+                if event is None:
+                    return
+            try:
+                self._deliver(event)
+            except Exception:
+                pass
+
+    def _deliver(self, event: dict):
+        if self.url:
+            request = urllib.request.Request(
+                self.url,
+                data=json.dumps(event).encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST"
+            )
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        elif self.job is not None and self.job.get("id"):
+            runpod.serverless.progress_update(self.job, event)
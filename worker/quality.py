@@ -0,0 +1,133 @@
+import time
+from typing import Iterable, Iterator
+
+import numpy as np
+import piq
+import torch
+import torch.nn.functional as F
+
+MODES = ("nr_fast", "fr")
+
+_LAPLACIAN = torch.tensor([[0.0, 1.0, 0.0], [1.0, -4.0, 1.0], [0.0, 1.0, 0.0]]).view(1, 1, 3, 3)
+_LUMA = torch.tensor([0.299, 0.587, 0.114]).view(1, 3, 1, 1)
+_lpips: dict[str, piq.LPIPS] = {}
+
+def _lpips_for(device: str) -> piq.LPIPS:
+    # The VGG weights are downloaded once and kept for warm workers.
+    if device not in _lpips:
+        _lpips[device] = piq.LPIPS(reduction="none").to(device).eval()
+    return _lpips[device]
+
+def to_tensor(frames: list[np.ndarray], device: str) -> torch.Tensor:
+    """Stack HWC frames (uint8, or float in [0, 1]) into an NCHW float batch in [0, 1]."""
+    batch = torch.from_numpy(np.stack(frames)).to(device)
+    if batch.dtype == torch.uint8:
+        batch = batch.float() / 255.0
+    else:
+        batch = batch.float().clamp_(0.0, 1.0)
+    return batch.permute(0, 3, 1, 2)
+
+def shrink(batch: torch.Tensor, max_side: int) -> torch.Tensor:
+    height, width = batch.shape[-2:]
+    if max(height, width) <= max_side:
+        return batch
+    scale = max_side / max(height, width)
+    return F.interpolate(batch, size=(round(height * scale), round(width * scale)), mode="area")
+
+def sharpness(batch: torch.Tensor) -> torch.Tensor:
+    """Variance of the Laplacian of each frame's luma, on the 0-255 scale."""
+    luma = (batch * _LUMA.to(batch)).sum(dim=1, keepdim=True) * 255.0
+    return F.conv2d(luma, _LAPLACIAN.to(batch)).flatten(1).var(dim=1)
+
+class QualityMeter:
+    """Scores upscaled frames on their way to the encoder.
+
+    Frames pass through observe() unchanged; every `sample_every`-th frame is
+    kept and scored once `batch_size` of them are collected, so the output is
+    never decoded a second time. `nr_fast` reports Laplacian sharpness and
+    BRISQUE, a NIQE-style no-reference score; `fr` adds PSNR, SSIM and LPIPS
+    against the matching frame of `reference`, an iterator over the ground
+    truth frames. BRISQUE and LPIPS look at frames shrunk to `max_side`.
+
+    If scoring takes more than `max_overhead` of the time frames have been
+    flowing, the sampling stride is doubled, so quality gating stays a
+    fraction of the job instead of doubling it.
+    """
+
+    def __init__(self, mode: str = "nr_fast", reference: Iterator[np.ndarray] | None = None, sample_every: int = 8, batch_size: int = 8, max_side: int = 512, max_overhead: float = 0.25, device: str = "cpu"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown metrics_mode {mode!r}, expected one of {MODES}")
+        self.mode = mode
+        self.reference = reference
+        self.sample_every = max(1, sample_every)
+        self.batch_size = max(1, batch_size)
+        self.max_side = max_side
+        self.max_overhead = max_overhead
+        self.device = device
+        self.scores: dict[str, list[float]] = {}
+        self.frames = 0
+        self.sampled = 0
+        self.busy_s = 0.0
+        self._batch: list[np.ndarray] = []
+        self._refs: list[np.ndarray] = []
+        self._started = None
+
+    def observe(self, frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        if self.mode == "fr":
+            _lpips_for(self.device)
+        self._started = time.perf_counter()
+        try:
+            for frame in frames:
+                ref = next(self.reference, None) if self.reference is not None else None
+                if self.frames % self.sample_every == 0:
+                    self._batch.append(np.asarray(frame))
+                    if ref is not None:
+                        # Decoders hand out reused buffers, so keep a copy.
+                        self._refs.append(np.array(ref))
+                    if len(self._batch) == self.batch_size:
+                        self._score()
+                self.frames += 1
+                yield frame
+            if self._batch:
+                self._score()
+        finally:
+            if hasattr(self.reference, "close"):
+                self.reference.close()
+
+    def _score(self):
+        t0 = time.perf_counter()
+        batch, refs = self._batch, self._refs
+        self._batch, self._refs = [], []
+        with torch.inference_mode():
+            x = to_tensor(batch, self.device)
+            self._add("sharp", sharpness(x))
+            small = shrink(x, self.max_side)
+            self._add("brisque", piq.brisque(small, data_range=1.0, reduction="none"))
+            # Reference frames that ran out before the output did are scored no-reference only.
+            if self.mode == "fr" and refs:
+                x = x[:len(refs)]
+                y = to_tensor(refs, self.device)
+                if y.shape[-2:] != x.shape[-2:]:
+                    y = F.interpolate(y, size=x.shape[-2:], mode="bicubic", align_corners=False).clamp_(0.0, 1.0)
+                self._add("psnr", piq.psnr(x, y, data_range=1.0, reduction="none"))
+                self._add("ssim", piq.ssim(x, y, data_range=1.0, reduction="none"))
+                self._add("lpips", _lpips_for(self.device)(shrink(x, self.max_side), shrink(y, self.max_side)))
+        self.sampled += len(batch)
+        self.busy_s += time.perf_counter() - t0
+        if self.busy_s > self.max_overhead * (time.perf_counter() - self._started):
+            self.sample_every *= 2
+
+    def _add(self, name: str, values: torch.Tensor):
+        self.scores.setdefault(name, []).extend(values.float().cpu().tolist())
+
+    def report(self) -> dict:
+        result = {"mode": self.mode, "frames": self.frames, "sampled": self.sampled, "sample_every": self.sample_every, "busy_s": round(self.busy_s, 3)}
+        # Worst case is the low end for psnr/ssim/sharpness and the high end for brisque/lpips.
+        worst = {"sharp": min, "brisque": max, "psnr": min, "ssim": min, "lpips": max}
+        for name, values in self.scores.items():
+            finite = [v for v in values if np.isfinite(v)]
+            if not finite:
+                continue
+            result[f"{name}_mean"] = round(float(np.mean(finite)), 4)
+            result[f"{name}_{worst[name].__name__}"] = round(float(worst[name](finite)), 4)
+        return result
@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+import vsr_handler
+
+LENGTHS = {"a": 3, "b": 40, "c": 2, "d": 4}
+
+class FakeDownloader:
+    def __init__(self, url, tmpdir, client=None):
+        self.url = url
+
+    def download(self):
+        return "Download successful", self.url
+
+class FakePreprocessor:
+    sizes = {}
+
+    def __init__(self, video_path, tmpdir):
+        self.video_path = video_path
+        self.height, self.width = self.sizes.get(video_path, (8, 8))
+        self.frame_count = None
+
+    def probe(self):
+        return self.width, self.height, 30.0
+
+    def stream_frames(self):
+        for i in range(LENGTHS[self.video_path]):
+            # Clip "d" is a still image; the others change every frame.
+            value = 0 if self.video_path == "d" else i * 40 % 256
+            yield np.full((1, self.height, self.width, 3), value, dtype=np.uint8)
+
+class FakeEncoder:
+    def __init__(self, frames, path, fps):
+        self.frames = frames
+        self.path = path
+
+    def encode_video(self):
+        self.frames = list(self.frames)
+        events.append(("encode", self.path.split("/")[-1], len(self.frames)))
+
+class FakeUploader:
+    def __init__(self, path, url, client=None):
+        self.url = url
+
+    def upload(self):
+        events.append(("upload", self.url))
+        return "Upload successful", {"presigned_url": self.url}
+
+class FakeCache:
+    def __init__(self, url, client=None):
+        self.url = url
+
+    def exists(self):
+        return self.url.endswith("hit")
+
+    def restore(self, output_url):
+        return "Restore successful", {"presigned_url": output_url, "cache": "hit"}
+
+    def save(self, output_url):
+        events.append(("save", output_url))
+
+events = []
+
+@pytest.fixture
+def fakes(monkeypatch):
+    events.clear()
+    FakePreprocessor.sizes = {}
+    planned = []
+    def plan(self, height, width, tile=None):
+        planned.append((height, width))
+        self.window, self.stride = 8, 6
+        return self.window, self.stride
+    def infer_window(self, chunk):
+        events.append(("infer", len(chunk)))
+        return list(chunk)
+    def run_job(body, progress, result_cache, video_path=None):
+        events.append(("stream", video_path, body.get("engine")))
+        return {"status": "ok", "info": {"presigned_url": body["output_url"]}}
+    monkeypatch.setattr(vsr_handler, "VideoDownloader", FakeDownloader)
+    monkeypatch.setattr(vsr_handler, "VideoPreprocessor", FakePreprocessor)
+    monkeypatch.setattr(vsr_handler, "VideoEncoder", FakeEncoder)
+    monkeypatch.setattr(vsr_handler, "VideoUploader", FakeUploader)
+    monkeypatch.setattr(vsr_handler, "ResultCache", FakeCache)
+    monkeypatch.setattr(vsr_handler.VSRWorker, "plan", plan)
+    monkeypatch.setattr(vsr_handler.VSRWorker, "infer_window", infer_window)
+    monkeypatch.setattr(vsr_handler, "_run_job", run_job)
+    return planned
+
+def _job(name, **extra):
+    return dict(job_id=name, video_url=name, output_url=f"s3://out/{name}.mp4", **extra)
+
+def test_short_clips_are_packed_and_long_clips_streamed(fakes):
+    result = vsr_handler.batch_handler({"jobs": [_job("a"), _job("b"), _job("c")]})
+    assert [r["status"] for r in result["results"]] == ["ok", "ok", "ok"]
+    # a and c share one window (3 + 2 guard + 2 frames); b is longer than a window.
+    assert ("infer", 7) in events
+    assert ("stream", "b", None) in events
+    assert result["timings"]["pipeline_calls"] == 2
+
+def test_each_pack_is_encoded_before_the_next_is_inferred(fakes):
+    vsr_handler.batch_handler({"jobs": [_job("a"), _job("d"), _job("c")]})
+    # Packs are [a] and [d, c]: a is encoded before d and c are inferred.
+    assert [e for e in events if e[0] in ("infer", "encode")] == [
+        ("infer", 3), ("encode", "a.mp4", 3), ("infer", 8), ("encode", "d.mp4", 4), ("encode", "c.mp4", 2)
+    ]
+
+def test_classic_engine_streams_every_clip(fakes):
+    result = vsr_handler.batch_handler({"engine": "classic", "jobs": [_job("a"), _job("c")]})
+    assert [r["job_id"] for r in result["results"]] == ["a", "c"]
+    assert [e for e in events if e[0] == "stream"] == [("stream", "a", "classic"), ("stream", "c", "classic")]
+    assert not [e for e in events if e[0] == "infer"]
+    assert fakes == []
+
+def test_windows_are_planned_for_the_largest_height_and_width(fakes):
+    FakePreprocessor.sizes = {"a": (720, 1920), "c": (1080, 1280)}
+    vsr_handler.batch_handler({"jobs": [_job("a"), _job("c")]})
+    assert fakes == [(1080, 1920)]
+
+def test_cache_hits_are_restored_and_misses_saved(fakes):
+    result = vsr_handler.batch_handler({"jobs": [_job("a", cache_url="s3://cache/hit"), _job("c", cache_url="s3://cache/c")]})
+    assert result["results"][0]["info"]["cache"] == "hit"
+    assert ("encode", "a.mp4", 3) not in events
+    assert ("save", "s3://out/c.mp4") in events
+
+def test_deduplicated_clip_is_expanded_after_packing(fakes):
+    result = vsr_handler.batch_handler({"jobs": [_job("d", dedup_threshold=2.0)]})
+    assert ("infer", 1) in events
+    assert ("encode", "d.mp4", 4) in events
+    assert result["results"][0]["frames"] == {"total": 4, "unique": 1, "skipped": 3}
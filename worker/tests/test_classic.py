@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+import pytest
+from vsr_handler import ClassicUpscaler
+
+def _noisy(n, height=32, width=48, seed=0):
+    rng = np.random.default_rng(seed)
+    base = np.full((height, width, 3), 128, dtype=np.int16)
+    return [np.clip(base + rng.integers(-6, 7, base.shape), 0, 255).astype(np.uint8) for _ in range(n)]
+
+@pytest.mark.parametrize("interpolation,flag", [("lanczos", cv2.INTER_LANCZOS4), ("bicubic", cv2.INTER_CUBIC)])
+def test_plain_resize_matches_opencv(interpolation, flag):
+    frame = _noisy(1)[0]
+    up = ClassicUpscaler(2.0, interpolation=interpolation, sharpen=0.0).upscale(frame)
+    np.testing.assert_array_equal(up, cv2.resize(frame, (96, 64), interpolation=flag))
+
+def test_fractional_scale_rounds_output_size():
+    assert ClassicUpscaler(1.5).upscale(np.zeros((33, 47, 3), dtype=np.uint8)).shape == (50, 70, 3)
+
+def test_sharpen_adds_contrast_at_edges():
+    frame = np.zeros((32, 32, 3), dtype=np.uint8)
+    frame[:, 16:] = 200
+    plain = ClassicUpscaler(2.0, sharpen=0.0).upscale(frame).astype(int)
+    sharp = ClassicUpscaler(2.0, sharpen=1.0).upscale(frame).astype(int)
+    assert np.abs(np.diff(sharp[32, :, 0])).max() > np.abs(np.diff(plain[32, :, 0])).max()
+
+def test_denoise_settles_static_noise_but_keeps_motion():
+    frames = _noisy(12)
+    upscaler = ClassicUpscaler(1.0, sharpen=0.0, denoise=0.8)
+    out = [upscaler.upscale(f) for f in frames]
+    assert np.std(out[-1].astype(float)) < np.std(frames[-1].astype(float)) * 0.6
+    moved = frames[-1].copy()
+    moved[:8, :8] = 255
+    assert (upscaler.upscale(moved)[:8, :8] == 255).all()
+
+def test_stream_upscales_every_frame_in_order():
+    frames = [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(40)]
+    upscaler = ClassicUpscaler(2.0, sharpen=0.0)
+    chunks = [(start, start + len(frames[start:start + 16]), frames[start:start + 16]) for start in range(0, 40, upscaler.stride)]
+    out = list(upscaler.stream(chunks))
+    assert [int(f[0, 0, 0]) for f in out] == list(range(40))
+    assert out[0].shape == (16, 16, 3)
@@ -0,0 +1,42 @@
+import numpy as np
+from vsr_handler import FrameDeduper
+
+def _frames(n, height=1080, width=1920, seed=0):
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return base, [base.copy() for _ in range(n)]
+
+def test_static_frames_collapse_and_expand_back():
+    _, frames = _frames(6, 64, 64)
+    deduper = FrameDeduper()
+    unique = list(deduper.filter(frames))
+    assert len(unique) == 1
+    assert deduper.report() == {"total": 6, "unique": 1, "skipped": 5}
+    assert len(list(deduper.expand(unique))) == 6
+
+def test_small_moving_region_is_kept():
+    base, frames = _frames(48)
+    for i, frame in enumerate(frames):
+        # A 120x60 region (a cursor, a caption, a mouth) changes every frame.
+        frame[500:560, 900:1020] = (i * 5) % 256
+    deduper = FrameDeduper()
+    assert len(list(deduper.filter(frames))) == 48
+    assert deduper.skipped == 0
+
+def test_encoder_noise_is_ignored():
+    base, frames = _frames(4, 256, 256)
+    rng = np.random.default_rng(1)
+    noisy = [np.clip(f.astype(np.int16) + rng.integers(-2, 3, f.shape), 0, 255).astype(np.uint8) for f in frames]
+    deduper = FrameDeduper()
+    assert len(list(deduper.filter(noisy))) == 1
+
+def test_expand_restores_order_and_run_lengths():
+    a = np.zeros((32, 32, 3), dtype=np.uint8)
+    b = np.full((32, 32, 3), 200, dtype=np.uint8)
+    frames = [a, a, b, b, b, a]
+    deduper = FrameDeduper()
+    unique = list(deduper.filter(frames))
+    assert deduper.counts == [2, 3, 1]
+    out = list(deduper.expand(unique))
+    assert len(out) == len(frames)
+    assert all(np.array_equal(x, y) for x, y in zip(out, frames))
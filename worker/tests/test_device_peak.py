@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import numpy as np
+import vsr_handler
+from vsr_handler import VSRWorker, WindowPlanner
+
+class FakeCuda:
+    """Peak counter that behaves like torch.cuda's across resets."""
+
+    def __init__(self):
+        self.allocated = 0
+        self.peak = 0
+
+    def reset_peak_memory_stats(self):
+        self.peak = self.allocated
+
+    def max_memory_allocated(self):
+        return self.peak
+
+    def memory_allocated(self):
+        return self.allocated
+
+def test_job_peak_survives_per_window_resets(monkeypatch):
+    cuda = FakeCuda()
+    monkeypatch.setattr(vsr_handler.torch, "cuda", cuda)
+    monkeypatch.setattr(vsr_handler, "device", "cuda")
+    monkeypatch.setattr(WindowPlanner, "bytes_per_pixel", WindowPlanner.bytes_per_pixel)
+    window_peaks = iter([500, 900, 300])
+    def pipe(frames, **kwargs):
+        cuda.peak = max(cuda.peak, next(window_peaks))
+        return SimpleNamespace(frames=frames)
+    monkeypatch.setattr(vsr_handler.loader, "get", lambda timeout=None: pipe)
+
+    vsr_handler.reset_device_peak(job=True)
+    worker = VSRWorker(None, planner=WindowPlanner(window=8))
+    for _ in range(3):
+        worker._infer([np.zeros((4, 4, 3), dtype=np.uint8)])
+    assert vsr_handler.device_peak_bytes() == 900
+
+    vsr_handler.reset_device_peak(job=True)
+    assert vsr_handler.device_peak_bytes() == 0
@@ -0,0 +1,47 @@
+import os
+import stat
+
+import numpy as np
+import pytest
+from vsr_handler import VideoEncoder
+
+def _fake_ffmpeg(tmp_path, monkeypatch, script: str):
+    path = tmp_path / "ffmpeg"
+    path.write_text(f"#!/bin/sh\n{script}\n")
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+def _frames(n, size=256):
+    # Larger than a pipe buffer, so writes to a dead ffmpeg fail.
+    return [np.zeros((size, size, 3), dtype=np.uint8) for _ in range(n)]
+
+def test_frames_are_piped_to_ffmpeg(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, f'cat > "{tmp_path}/raw"')
+    encoder = VideoEncoder(_frames(3, 16), str(tmp_path / "out.mp4"))
+    assert encoder.encode_video() == ("Encoding successful", str(tmp_path / "out.mp4"))
+    assert (tmp_path / "raw").stat().st_size == 3 * 16 * 16 * 3
+
+def test_failed_encode_reports_stderr(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, "cat > /dev/null\necho 'Invalid argument' >&2\nexit 1")
+    with pytest.raises(RuntimeError, match="status 1: Invalid argument"):
+        VideoEncoder(_frames(2, 16), str(tmp_path / "out.mp4")).encode_video()
+
+def test_dead_ffmpeg_raises_its_error_and_is_reaped(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, "echo 'Unknown encoder libx264' >&2\nexit 8")
+    encoder = VideoEncoder(_frames(20), str(tmp_path / "out.mp4"))
+    with pytest.raises(RuntimeError, match="status 8: Unknown encoder libx264"):
+        encoder.encode_video()
+    assert encoder._proc is None
+
+def test_abort_after_ffmpeg_died_does_not_mask_the_error(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, "exit 1")
+    with pytest.raises(ValueError, match="upstream"):
+        with VideoEncoder(None, str(tmp_path / "out.mp4")) as encoder:
+            encoder.open(16, 16)
+            proc = encoder._proc
+            proc.wait()
+            # Small enough to sit in the stdin buffer until close() flushes it.
+            encoder.write(_frames(1, 16)[0])
+            raise ValueError("upstream")
+    assert proc.returncode == 1
+    assert encoder._proc is None
@@ -0,0 +1,43 @@
+import itertools
+import time
+
+import pytest
+from pipeline import Pipeline
+
+def test_items_flow_through_stages_in_order():
+    out = []
+    report = (
+        Pipeline()
+        .add_stage("source", lambda _: iter(range(100)))
+        .add_stage("double", lambda items: (i * 2 for i in items))
+        .add_stage("sink", lambda items: out.extend(items))
+        .run()
+    )
+    assert out == [i * 2 for i in range(100)]
+    assert report["stages"]["double"]["items"] == 100
+
+def test_stage_error_is_raised_and_stops_the_other_stages():
+    def infer(items):
+        for i in items:
+            if i == 5:
+                raise ValueError("bad window")
+            yield i
+    t0 = time.perf_counter()
+    pipeline = (
+        Pipeline()
+        # An endless source only stops because the pipeline aborts it.
+        .add_stage("decode", lambda _: itertools.count())
+        .add_stage("infer", infer)
+        .add_stage("encode", lambda items: [None for _ in items])
+    )
+    with pytest.raises(ValueError, match="bad window"):
+        pipeline.run()
+    assert time.perf_counter() - t0 < 5
+
+def test_sink_error_is_raised():
+    def encode(items):
+        for _ in items:
+            raise OSError("disk full")
+    pipeline = Pipeline().add_stage("decode", lambda _: range(10)).add_stage("encode", encode)
+    with pytest.raises(OSError, match="disk full"):
+        pipeline.run()
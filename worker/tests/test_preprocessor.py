@@ -0,0 +1,56 @@
+import json
+import os
+import stat
+
+import pytest
+from vsr_handler import VideoPreprocessor
+
+def _fake_ffmpeg(tmp_path, monkeypatch, stream: dict, frames: int = 3, status: int = 0):
+    """Put ffprobe/ffmpeg stand-ins on PATH: ffprobe prints `stream`, ffmpeg
+    writes `frames` rgb24 frames of the displayed size and exits with `status`."""
+    width, height = stream["width"], stream["height"]
+    if VideoPreprocessor.rotation(stream) % 180 == 90:
+        width, height = height, width
+    scripts = {
+        "ffprobe": f"#!/bin/sh\ncat <<'EOF'\n{json.dumps({'streams': [stream]})}\nEOF\n",
+        "ffmpeg": f"#!/bin/sh\nhead -c {frames * width * height * 3} /dev/zero\necho 'corrupt packet' >&2\nexit {status}\n"
+    }
+    for name, body in scripts.items():
+        path = tmp_path / name
+        path.write_text(body)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+@pytest.mark.parametrize("stream", [
+    {"width": 64, "height": 32, "side_data_list": [{"side_data_type": "Display Matrix", "rotation": -90}]},
+    {"width": 64, "height": 32, "tags": {"rotate": "270"}}
+])
+def test_rotated_video_reports_display_size(tmp_path, monkeypatch, stream):
+    _fake_ffmpeg(tmp_path, monkeypatch, dict(stream, r_frame_rate="30/1", nb_frames="3"))
+    preprocessor = VideoPreprocessor("in.mp4", str(tmp_path))
+    assert preprocessor.probe() == (32, 64, 30.0)
+    frames = [chunk[0].copy() for chunk in preprocessor.stream_frames()]
+    assert [frame.shape for frame in frames] == [(64, 32, 3)] * 3
+
+def test_upside_down_video_keeps_its_size(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, {"width": 64, "height": 32, "r_frame_rate": "30/1", "tags": {"rotate": "180"}})
+    assert VideoPreprocessor("in.mp4", str(tmp_path)).probe() == (64, 32, 30.0)
+
+def test_failed_decode_raises(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, {"width": 16, "height": 16, "r_frame_rate": "30/1"}, status=1)
+    with pytest.raises(RuntimeError, match="corrupt packet"):
+        list(VideoPreprocessor("in.mp4", str(tmp_path)).stream_frames())
+
+def test_broken_byte_source_raises(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, {"width": 16, "height": 16, "r_frame_rate": "30/1"})
+    def source():
+        yield b"\0" * 1024
+        raise ConnectionResetError("peer went away")
+    with pytest.raises(RuntimeError, match="peer went away"):
+        list(VideoPreprocessor("in.mp4", str(tmp_path), byte_source=source()).stream_frames())
+
+def test_consumer_stopping_early_does_not_raise(tmp_path, monkeypatch):
+    _fake_ffmpeg(tmp_path, monkeypatch, {"width": 16, "height": 16, "r_frame_rate": "30/1"}, frames=10, status=1)
+    frames = VideoPreprocessor("in.mp4", str(tmp_path)).stream_frames()
+    next(frames)
+    frames.close()
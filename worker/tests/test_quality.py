@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+import quality
+from quality import QualityMeter
+
+def _frames(n, size=8):
+    """Frames whose every pixel holds the frame's index."""
+    return [np.full((size, size, 3), i, dtype=np.uint8) for i in range(n)]
+
+@pytest.fixture
+def scored(monkeypatch):
+    """Swaps the torch/piq scorers for numpy ones that score each frame by
+    its pixel value, so the tests see exactly which frames were sampled and
+    which reference frame each was compared against."""
+    pairs = []
+    def psnr(x, y, **kwargs):
+        pairs.extend(zip(x[:, 0, 0, 0].tolist(), y[:, 0, 0, 0].tolist()))
+        return x[:, 0, 0, 0]
+    monkeypatch.setattr(quality, "to_tensor", lambda frames, device: np.stack(frames).astype(np.float32))
+    monkeypatch.setattr(quality, "shrink", lambda batch, max_side: batch)
+    monkeypatch.setattr(quality, "sharpness", lambda batch: batch[:, 0, 0, 0])
+    monkeypatch.setattr(quality, "_lpips_for", lambda device: lambda x, y: np.abs(x - y)[:, 0, 0, 0])
+    monkeypatch.setattr(quality.piq, "brisque", lambda x, **kwargs: x[:, 0, 0, 0])
+    monkeypatch.setattr(quality.piq, "psnr", psnr)
+    monkeypatch.setattr(quality.piq, "ssim", lambda x, y, **kwargs: x[:, 0, 0, 0])
+    monkeypatch.setattr(QualityMeter, "_add", lambda self, name, values: self.scores.setdefault(name, []).extend(np.asarray(values).tolist()))
+    return pairs
+
+def test_frames_pass_through_and_every_nth_is_sampled(scored):
+    frames = _frames(20)
+    meter = QualityMeter(sample_every=3, batch_size=4, max_overhead=1.0)
+    out = list(meter.observe(iter(frames)))
+    assert all(a is b for a, b in zip(out, frames)) and len(out) == 20
+    assert meter.scores["sharp"] == [0, 3, 6, 9, 12, 15, 18]
+    assert (meter.frames, meter.sampled) == (20, 7)
+
+def test_reference_frames_line_up_with_the_sampled_output(scored):
+    buffer = np.zeros((8, 8, 3), dtype=np.uint8)
+    closed = []
+    def reference():
+        # Like a decoder, hand out one reused buffer; the meter must copy it.
+        try:
+            for i in range(12):
+                buffer[:] = i
+                yield buffer
+        finally:
+            closed.append(True)
+    meter = QualityMeter("fr", reference(), sample_every=2, batch_size=3, max_overhead=1.0)
+    list(meter.observe(iter(_frames(12))))
+    assert scored == [(i, i) for i in range(0, 12, 2)]
+    assert closed == [True]
+
+def test_short_reference_falls_back_to_no_reference_scores(scored):
+    meter = QualityMeter("fr", iter(_frames(3)), sample_every=1, batch_size=4, max_overhead=1.0)
+    list(meter.observe(iter(_frames(6))))
+    assert len(meter.scores["brisque"]) == 6
+    assert len(meter.scores["psnr"]) == 3
+
+def test_stride_doubles_when_scoring_exceeds_the_overhead_budget(scored):
+    meter = QualityMeter(sample_every=1, batch_size=2, max_overhead=0.0)
+    list(meter.observe(iter(_frames(16))))
+    # Each batch of two doubles the stride: 0-1 at 1, 2-4 at 2, 8-12 at 4.
+    assert meter.scores["sharp"] == [0, 1, 2, 4, 8, 12]
+    assert meter.sample_every == 8
+
+def test_report_summarises_each_metric_by_mean_and_worst_case(scored):
+    meter = QualityMeter("fr", iter(_frames(4)), sample_every=1, batch_size=4, max_overhead=1.0)
+    list(meter.observe(iter(_frames(4))))
+    report = meter.report()
+    assert {k: report[k] for k in ("mode", "frames", "sampled", "sample_every")} == {"mode": "fr", "frames": 4, "sampled": 4, "sample_every": 1}
+    assert (report["sharp_mean"], report["sharp_min"], report["brisque_max"], report["lpips_max"]) == (1.5, 0, 3, 0)
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        QualityMeter("vmaf")
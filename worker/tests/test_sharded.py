@@ -0,0 +1,71 @@
+import numpy as np
+import vsr_handler
+from vsr_handler import ShardedVSRWorker, VSRWorker
+
+def _frames(n):
+    return [np.full((4, 4, 3), i, dtype=np.uint8) for i in range(n)]
+
+class FakeResult:
+    def __init__(self, value, pool):
+        self.value = value
+        self.pool = pool
+
+    def get(self):
+        self.pool.pending -= 1
+        return self.value
+
+class FakePool:
+    """Runs each task inline but only hands it back on get(), so the test
+    sees how many windows the worker keeps in flight."""
+
+    def __init__(self):
+        self.pending = 0
+        self.peak = 0
+        self.configs = []
+
+    def apply_async(self, func, args):
+        config, chunk = args
+        self.configs.append(config)
+        self.pending += 1
+        self.peak = max(self.peak, self.pending)
+        return FakeResult(([f + 100 for f in chunk], 0.25), self)
+
+class FakeHistogram:
+    def __init__(self):
+        self.observed = []
+
+    def observe(self, value):
+        self.observed.append(value)
+
+def test_stream_stitches_pool_results_in_window_order(monkeypatch):
+    pool = FakePool()
+    histogram = FakeHistogram()
+    monkeypatch.setattr(ShardedVSRWorker, "_pool", lambda self: pool)
+    monkeypatch.setattr(vsr_handler.metrics, "window_seconds", histogram)
+    worker = ShardedVSRWorker(_frames(30), scale_factor=4.0, num_inference_steps=5, window=8, stride=6, processes=3)
+    out = list(worker.stream())
+    assert [int(f[0, 0, 0]) for f in out] == [100 + i for i in range(30)]
+    assert pool.peak == 3 and pool.pending == 0
+    assert histogram.observed == [0.25] * 5
+    assert set(pool.configs) == {(4.0, 5, 1.0, None)}
+
+def test_threads_default_to_an_even_split_of_the_cores(monkeypatch):
+    monkeypatch.setattr(vsr_handler.os, "cpu_count", lambda: 16)
+    assert ShardedVSRWorker(None, processes=4).threads == 4
+    assert ShardedVSRWorker(None, processes=32).threads == 1
+    assert ShardedVSRWorker(None, processes=4, threads=2).threads == 2
+
+def test_shard_infer_reuses_one_worker_per_config(monkeypatch):
+    built = []
+    def infer_window(self, chunk):
+        built.append(id(self))
+        return [f * 2 for f in chunk]
+    monkeypatch.setattr(VSRWorker, "infer_window", infer_window)
+    monkeypatch.setattr(vsr_handler, "_shard_workers", {})
+    chunk = np.stack(_frames(3))
+    out, seconds = vsr_handler._shard_infer((2.0, 25, 1.0, None), chunk)
+    vsr_handler._shard_infer((2.0, 25, 1.0, None), chunk)
+    vsr_handler._shard_infer((2.0, 25, 1.0, 128), chunk)
+    assert [int(f[0, 0, 0]) for f in out] == [0, 2, 4] and seconds >= 0
+    assert built[0] == built[1] != built[2]
+    assert vsr_handler._shard_workers[(2.0, 25, 1.0, 128)].tiler.tile == 128
@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+import pytest
+from vsr_handler import SpatialTiler
+
+def _upscale(chunk, scale=2):
+    # Any per-pixel operator gives the same output tiled or not.
+    return [cv2.resize(f, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST) for f in chunk]
+
+@pytest.mark.parametrize("height,width,tile,overlap", [(100, 150, 64, 16), (128, 128, 64, 32), (70, 300, 128, 32)])
+def test_tiled_output_matches_untiled(height, width, tile, overlap):
+    rng = np.random.default_rng(0)
+    chunk = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(3)]
+    calls = []
+    def infer(frames):
+        calls.append(frames[0].shape[:2])
+        return _upscale(frames)
+    tiled = SpatialTiler(tile, overlap).run(chunk, infer)
+    assert len(calls) > 1
+    assert all(h <= tile and w <= tile for h, w in calls)
+    for got, want in zip(tiled, _upscale(chunk), strict=True):
+        assert got.dtype == want.dtype
+        np.testing.assert_array_equal(got, want)
+
+def test_spans_cover_the_edge_with_full_tiles():
+    assert SpatialTiler(64, 16).spans(150) == [(0, 64), (48, 112), (86, 150)]
+    assert SpatialTiler(64, 16).spans(64) == [(0, 64)]
+
+def test_small_frames_are_not_tiled():
+    chunk = [np.zeros((32, 32, 3), dtype=np.uint8)]
+    calls = []
+    SpatialTiler(64).run(chunk, lambda frames: calls.append(len(frames)) or frames)
+    assert calls == [1]
@@ -0,0 +1,71 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from transfer import RangeDownloader, classify_url
+
+BODY = bytes(range(256)) * 1000 + b"tail"
+
+class Handler(BaseHTTPRequestHandler):
+    ranges = True
+    requests: list[str | None] = []
+
+    def do_GET(self):
+        header = self.headers.get("Range")
+        self.requests.append(header)
+        match = re.match(r"bytes=(\d+)-(\d+)", header or "")
+        if self.ranges and match:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(BODY) - 1)
+            data = BODY[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(BODY)}")
+        else:
+            data = BODY
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(params=[True, False], ids=["ranges", "no-ranges"])
+def server(request):
+    handler = type("TestHandler", (Handler,), {"ranges": request.param, "requests": []})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/clip.mp4", handler
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_download_writes_every_part_in_place(server, tmp_path):
+    url, handler = server
+    path = tmp_path / "clip.mp4"
+    RangeDownloader(url, part_size=10_000, concurrency=4).download(str(path))
+    assert path.read_bytes() == BODY
+    if handler.ranges:
+        # Probe, then 26 parts; the last one is short.
+        assert len(handler.requests) == 1 + 26
+        assert "bytes=250000-256003" in handler.requests
+    else:
+        assert handler.requests == ["bytes=0-0", None]
+
+def test_iter_bytes_yields_parts_in_order(server):
+    url, handler = server
+    assert b"".join(RangeDownloader(url, part_size=7_000, concurrency=3).iter_bytes()) == BODY
+
+def test_ranges_cover_the_object_without_gaps():
+    downloader = RangeDownloader("http://example.com/a.mp4", part_size=10)
+    downloader.size = 25
+    assert downloader._ranges() == [(0, 9), (10, 19), (20, 24)]
+
+@pytest.mark.parametrize("url,kind", [
+    ("s3://bucket/key.mp4", "s3"),
+    ("https://bucket.s3.amazonaws.com/key?X-Amz-Signature=abc", "http"),
+    ("https://cdn.example.com/video/clip.MOV", "http"),
+    ("https://www.youtube.com/watch?v=abc", "media"),
+    ("ftp://example.com/clip.mp4", "media")
+])
+def test_classify_url(url, kind):
+    assert classify_url(url) == kind
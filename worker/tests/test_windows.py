@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from vsr_handler import OverlapBlender, VSRWorker, WindowPacker, WindowPlanner
+
+def _frames(n, height=4, width=4, start=0):
+    """Frames whose every pixel holds the frame's index."""
+    return [np.full((height, width, 3), start + i, dtype=np.uint8) for i in range(n)]
+
+def _stitch(frames, window, stride, infer=lambda chunk: chunk):
+    worker = VSRWorker(None, window=window, stride=stride)
+    blender = OverlapBlender(window - stride)
+    out = []
+    for start, _, chunk in worker._chunk(frames):
+        out += blender.push(start, infer(chunk))
+    return out + blender.flush()
+
+@pytest.mark.parametrize("n,window,stride", [(1, 8, 6), (8, 8, 6), (9, 8, 6), (50, 8, 6), (50, 16, 12), (33, 32, 28), (20, 8, 8)])
+def test_blender_keeps_every_frame_in_order(n, window, stride):
+    out = _stitch(_frames(n), window, stride)
+    assert [int(f[0, 0, 0]) for f in out] == list(range(n))
+
+def test_blender_crossfades_the_shared_frames():
+    # Windows (0, 8) and (4, 12) come back offset by 0 and 90, so the four
+    # shared frames ramp from one to the other.
+    offsets = iter([0, 90])
+    def infer(chunk):
+        offset = next(offsets)
+        return [f + offset for f in chunk]
+    values = [int(f[0, 0, 0]) for f in _stitch([np.zeros((2, 2, 3), dtype=np.uint8)] * 12, 8, 4, infer)]
+    assert values == [0] * 4 + [18, 36, 54, 72] + [90] * 4
+
+def test_chunk_covers_the_sequence_with_the_planned_overlap():
+    worker = VSRWorker(None, window=8, stride=6)
+    spans = [(start, end) for start, end, _ in worker._chunk(list(range(20)))]
+    assert spans == [(0, 8), (6, 14), (12, 20)]
+
+def test_planner_keeps_an_explicit_window_and_caps_overlap():
+    assert WindowPlanner(overlap=4, window=16).plan(1080, 1920, 4) == (16, 12)
+    assert WindowPlanner(overlap=8, window=6).plan(64, 64, 2) == (6, 3)
+
+def test_planner_sizes_window_and_tiles_from_free_memory(monkeypatch):
+    planner = WindowPlanner(headroom=1.0)
+    frame = planner.frame_bytes(270, 480, 4)
+    monkeypatch.setattr(planner, "available_memory", lambda: int(frame * 20))
+    assert planner.plan(270, 480, 4) == (20, 16)
+    assert planner.plan_tile(270, 480, 4, 20) is None
+    monkeypatch.setattr(planner, "available_memory", lambda: int(frame * 2))
+    assert planner.plan(270, 480, 4)[0] == planner.min_window
+    tile = planner.plan_tile(270, 480, 4, planner.min_window)
+    assert tile is not None and tile % 64 == 0 and tile >= 128
+
+def test_packer_groups_by_shape_and_respects_the_window():
+    clips = {"a": _frames(3), "b": _frames(3), "c": _frames(4), "d": _frames(2, height=8)}
+    packs = WindowPacker(window=8, guard=1).pack(clips)
+    assert packs == [["a", "b"], ["c"], ["d"]]
+
+def test_packer_splits_outputs_back_per_clip():
+    clips = {"a": _frames(3, start=10), "b": _frames(2, start=20)}
+    seen = []
+    def infer(sequence):
+        seen.append([int(f[0, 0, 0]) for f in sequence])
+        return sequence
+    out = WindowPacker(window=8, guard=1).run(["a", "b"], clips, infer)
+    # One guard frame on each side of the boundary repeats the clip's own edge.
+    assert seen == [[10, 11, 12, 12, 20, 20, 21]]
+    assert {key: [int(f[0, 0, 0]) for f in frames] for key, frames in out.items()} == {"a": [10, 11, 12], "b": [20, 21]}
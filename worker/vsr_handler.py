@@ -1,8 +1,15 @@
 import os
 import json
+import time
 import uuid
 import tempfile
+import threading
 import subprocess
+import multiprocessing as mp
+import multiprocessing.pool
+from collections import deque
+from typing import Iterable, Iterator
+from urllib.parse import urlparse
 
 import cv2
 import boto3
@@ -10,21 +17,24 @@ import torch
 import runpod
 import numpy as np
 
-from diffusers import StableVSRPipeline
-from huggingface_hub import login
+from botocore.exceptions import ClientError
 
-hf_token = os.environ.get("HF_TOKEN")
-if hf_token is None:
-    raise ValueError("HF_TOKEN is not set")
+import metrics
+from pipeline import Pipeline
+from model_loader import ModelLoader
+from progress import ProgressReporter
+from quality import QualityMeter
+from transfer import S3_TRANSFER_CONFIG, RangeDownloader, classify_url
 
-login(token=hf_token)
-
-model = "claudiom4sir/StableVSR"
+model = os.environ.get("MODEL_ID", "claudiom4sir/StableVSR")
 device = "cuda" if torch.cuda.is_available() else "cpu"
 dtype = torch.float16 if device == "cuda" else torch.float32
-pipe = StableVSRPipeline.from_pretrained(model, torch_dtype=dtype).to(device)
-pipe.enable_attention_slicing()
-pipe.set_progress_bar_config(disable=True)
+loader = ModelLoader(model, os.environ.get("MODEL_CACHE_DIR", "/models/stablevsr"), device, dtype)
+# Sharded CPU hosts load the model in their pool processes, not here. Spawned
+# pool processes re-import this module, and a background load there would
+# start torch's thread pools before _shard_init gets to size them.
+if os.environ.get("PRELOAD_MODEL", "1") == "1" and int(os.environ.get("VSR_PROCESSES", "1")) <= 1 and mp.current_process().name == "MainProcess":
+    loader.start()
 
 s3_client = boto3.client("s3",
     aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
@@ -41,15 +51,19 @@ class VideoDownloader:
         self.key = None
 
     def download(self) -> str:
-        if self.url.startswith("s3://"):
+        kind = classify_url(self.url)
+        if kind == "s3":
             bucket, key = self.url[5:].split("/", 1)
             self.bucket = bucket
             self.key = key
-            local_path = os.path.join(self.tmpdir, key)
-            self.client.download_file(bucket, key, local_path)
+            local_path = os.path.join(self.tmpdir, os.path.basename(key))
+            self.client.download_file(bucket, key, local_path, Config=S3_TRANSFER_CONFIG)
+        elif kind == "http":
+            local_path = os.path.join(self.tmpdir, os.path.basename(urlparse(self.url).path) or "input.mp4")
+            RangeDownloader(self.url).download(local_path)
         else:
-            local_path = os.path.join(self.tmpdir, os.path.basename(self.url))
-            subprocess.run(["yt-dlp", self.url, "-o", local_path])
+            local_path = os.path.join(self.tmpdir, os.path.basename(urlparse(self.url).path) or "input.mp4")
+            subprocess.run(["yt-dlp", self.url, "-o", local_path], check=True)
 
         return "Download successful", local_path
     
@@ -65,7 +79,7 @@ class VideoUploader:
             bucket, key = self.url[5:].split("/", 1)
             self.bucket = bucket
             self.key = key
-        self.client.upload_file(self.path, self.bucket, self.key, ExtraArgs={"ContentType": "video/mp4"})
+        self.client.upload_file(self.path, self.bucket, self.key, ExtraArgs={"ContentType": "video/mp4"}, Config=S3_TRANSFER_CONFIG)
         presigned_url = self.client.generate_presigned_url(
             "get_object",
             Params={"Bucket": self.bucket, "Key": self.key},
@@ -73,56 +87,536 @@ class VideoUploader:
         )
         return "Upload successful", {"presigned_url": presigned_url}
 
+class ResultCache:
+    def __init__(self, url: str, client: boto3.client = None, expire: int = 3600):
+        self.bucket, self.key = url[5:].split("/", 1)
+        self.client = client
+        self.expire = expire
+
+    def exists(self) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key)
+        except ClientError:
+            return False
+        return True
+
+    def restore(self, output_url: str) -> tuple[str, dict]:
+        bucket, key = output_url[5:].split("/", 1)
+        self.client.copy_object(Bucket=bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": self.key})
+        presigned_url = self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": bucket, "Key": key},
+            ExpiresIn=self.expire
+        )
+        return "Restore successful", {"presigned_url": presigned_url, "cache": "hit"}
+
+    def save(self, output_url: str) -> str:
+        bucket, key = output_url[5:].split("/", 1)
+        self.client.copy_object(Bucket=self.bucket, Key=self.key, CopySource={"Bucket": bucket, "Key": key})
+        return "Save successful"
+
 class VideoPreprocessor:
-    def __init__(self, video_path: str, tmpdir: str):
+    def __init__(self, video_path: str, tmpdir: str, byte_source: Iterable[bytes] | None = None):
         self.tmpdir = tmpdir
         self.video_path = video_path
+        self.byte_source = byte_source
         self.frames = []
+        self.width = None
+        self.height = None
+        self.fps = None
+        self.frame_count = None
+
+    def probe(self) -> tuple[int, int, float]:
+        result = subprocess.run([
+            "ffprobe",
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "stream=width,height,r_frame_rate,nb_frames,duration:stream_tags=rotate:stream_side_data=rotation",
+            "-of", "json",
+            self.video_path
+        ], capture_output=True, text=True, check=True)
+        stream = json.loads(result.stdout)["streams"][0]
+        num, den = stream.get("r_frame_rate", "30/1").split("/")
+        self.width = int(stream["width"])
+        self.height = int(stream["height"])
+        # ffmpeg applies the display rotation while decoding, so frames of a
+        # portrait phone clip come out with width and height swapped.
+        if self.rotation(stream) % 180 == 90:
+            self.width, self.height = self.height, self.width
+        self.fps = float(num) / float(den) if float(den) else 30.0
+        if str(stream.get("nb_frames", "")).isdigit():
+            self.frame_count = int(stream["nb_frames"])
+        elif stream.get("duration") not in (None, "N/A"):
+            self.frame_count = round(float(stream["duration"]) * self.fps)
+        return self.width, self.height, self.fps
+
+    @staticmethod
+    def rotation(stream: dict) -> int:
+        """Display rotation in degrees, from the display matrix side data or the legacy rotate tag."""
+        for side_data in stream.get("side_data_list") or []:
+            if "rotation" in side_data:
+                return round(float(side_data["rotation"])) % 360
+        return round(float((stream.get("tags") or {}).get("rotate", 0))) % 360
+
+    def stream_frames(self, chunk_size: int = 1) -> Iterator[np.ndarray]:
+        """Yield (n, H, W, 3) RGB uint8 chunks decoded from an ffmpeg rawvideo pipe.
+
+        The yielded array is a view of a buffer that is reused for the next chunk;
+        copy it if it has to outlive the iteration. With a byte_source the
+        input is fed to ffmpeg on stdin as it arrives, which needs a container
+        that can be read front to back (e.g. faststart MP4); video_path is then
+        only used to probe the stream.
+
+        Raises RuntimeError if ffmpeg fails or the byte_source breaks off, so
+        a truncated decode is never mistaken for the whole video.
+        """
+        if self.width is None:
+            self.probe()
+        buffer = np.empty((chunk_size, self.height, self.width, 3), dtype=np.uint8)
+        flat = buffer.reshape(chunk_size, -1)
+        self._feed_error = None
+        stderr = tempfile.TemporaryFile(dir=self.tmpdir)
+        proc = subprocess.Popen([
+            "ffmpeg",
+            "-v", "error",
+            "-i", "pipe:0" if self.byte_source is not None else self.video_path,
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "pipe:1"
+        ], stdout=subprocess.PIPE, stdin=subprocess.PIPE if self.byte_source is not None else None, stderr=stderr, bufsize=flat.shape[1])
+        feeder = None
+        if self.byte_source is not None:
+            feeder = threading.Thread(target=self._feed, args=(proc.stdin,), daemon=True)
+            feeder.start()
+        try:
+            n = 0
+            while self._read_frame(proc.stdout, flat[n]):
+                n += 1
+                if n == chunk_size:
+                    yield buffer
+                    n = 0
+            # Only a decode that ran to the end is checked; a consumer that
+            # stops early kills ffmpeg in the finally below.
+            returncode = proc.wait()
+            if feeder is not None:
+                feeder.join()
+            if returncode != 0:
+                stderr.seek(0)
+                message = stderr.read().decode(errors="replace").strip()
+                raise RuntimeError(f"ffmpeg exited with status {returncode}: {message}")
+            if self._feed_error is not None:
+                raise RuntimeError(f"Input stream failed: {self._feed_error}") from self._feed_error
+            if n:
+                yield buffer[:n]
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            stderr.close()
+
+    def stream_windows(self, window: int = 32, stride: int = 28, deduper: "FrameDeduper | None" = None) -> Iterator[tuple[int, int, list[np.ndarray]]]:
+        """Yield (start, end, frames) windows laid out like VSRWorker._chunk.
+
+        At most `window` decoded frames are held at a time; the overlap between
+        consecutive windows is shifted to the front of the buffer instead of
+        being decoded twice. With a deduper, windows index the deduplicated
+        sequence.
+        """
+        buffer = None
+        start = 0
+        filled = 0
+        keep = max(window - stride, 0)
+        frames = (chunk[0] for chunk in self.stream_frames())
+        if deduper is not None:
+            frames = deduper.filter(frames)
+        for frame in frames:
+            if buffer is None:
+                buffer = np.empty((window, *frame.shape), dtype=np.uint8)
+            buffer[filled] = frame
+            filled += 1
+            if filled == window:
+                yield start, start + window, list(buffer)
+                buffer[:keep] = buffer[window - keep:]
+                start += stride
+                filled = keep
+        if buffer is not None and (filled > keep or start == 0):
+            yield start, start + filled, list(buffer[:filled])
+
+    def iter_window_copies(self, window: int = 32, stride: int = 28, deduper: "FrameDeduper | None" = None) -> Iterator[tuple[int, int, np.ndarray]]:
+        """Like stream_windows, but each window is an owned (n, H, W, 3) array
+        that is safe to hand to another thread."""
+        for start, end, frames in self.stream_windows(window, stride, deduper):
+            yield start, end, np.stack(frames)
+
+    def extract_frames(self) -> tuple[str, list[np.ndarray]]:
+        self.frames = [chunk[0].copy() for chunk in self.stream_frames()]
+        return "Extraction successful", self.frames
+
+    def _feed(self, stdin):
+        try:
+            for chunk in self.byte_source:
+                stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            pass
+        except Exception as e:
+            self._feed_error = e
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    @staticmethod
+    def _read_frame(stream, out: np.ndarray) -> bool:
+        view = memoryview(out)
+        got = 0
+        while got < len(view):
+            n = stream.readinto(view[got:])
+            if not n:
+                return False
+            got += n
+        return True
+
+class FrameDeduper:
+    """Collapses runs of identical or near-identical frames before inference.
+
+    Each frame is fingerprinted as a grayscale grid of `block`-pixel block
+    means and compared with the first frame of the current run; frames only
+    count as duplicates when no block moved by more than `threshold`
+    (0-255 scale). Taking the worst block rather than the frame average
+    keeps small changes such as a cursor, typing or a speaking mouth from
+    being frozen, while the block averaging absorbs encoder noise. Only the
+    first frame of a run is passed on; its run length is appended to
+    `counts` before it is yielded, so a consumer further down the pipeline
+    can expand the output back to the original frame count.
+    """
+
+    def __init__(self, threshold: float = 2.0, block: int = 16):
+        self.threshold = threshold
+        self.block = block
+        self.counts: list[int] = []
+        self.total = 0
+
+    @property
+    def skipped(self) -> int:
+        return self.total - len(self.counts)
+
+    def fingerprint(self, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        height, width = gray.shape
+        size = (max(1, width // self.block), max(1, height // self.block))
+        return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32)
 
-    def extract_frames(self) -> tuple[list[np.ndarray], list[str]]:
-        frames_dir = os.path.join(self.tmpdir, "frames")
-        os.makedirs(frames_dir, exist_ok=True)
-        subprocess.run(["ffmpeg", "-i", self.video_path, os.path.join(frames_dir, "%.08d.png")])
-        paths = sorted([os.path.join(frames_dir, f) for f in os.listdir(frames_dir) if f.endswith(".png")])
-        self.frames = [cv2.cvtColor(cv2.imread(p), cv2.COLOR_BGR2RGB) for p in paths]
-        return self.frames, paths
+    def filter(self, frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        rep = None
+        rep_print = None
+        run = 0
+        for frame in frames:
+            self.total += 1
+            fp = self.fingerprint(frame)
+            if rep is not None and np.abs(fp - rep_print).max() <= self.threshold:
+                run += 1
+                continue
+            if rep is not None:
+                self.counts.append(run)
+                yield rep
+            rep, rep_print, run = frame.copy(), fp, 1
+        if rep is not None:
+            self.counts.append(run)
+            yield rep
+
+    def expand(self, frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        for i, frame in enumerate(frames):
+            for _ in range(self.counts[i]):
+                yield frame
+
+    def report(self) -> dict:
+        return {"total": self.total, "unique": len(self.counts), "skipped": self.skipped}
 
 class VideoEncoder:
-    def __init__(self, frames: list[np.ndarray], out_path: str, fps: int = 30):  
+    def __init__(self, frames: list[np.ndarray] | None, out_path: str, fps: int = 30):  
         self.frames = frames
         self.out_path = out_path
         self.fps = fps
+        self.count = 0
+        self._proc = None
+        self._stderr = None
+        self._shape = None
 
-    def encode_video(self) -> str:
-        height, width, _ = self.frames[0].shape
-        tmpdir = os.path.dirname(self.out_path)
-        seqdir = os.path.join(tmpdir, "out_frames")
-        os.makedirs(seqdir, exist_ok=True)
-        for i, frame in enumerate(self.frames):
-            cv2.imwrite(os.path.join(seqdir, f"{i:08d}.png"), cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
-        
-        subprocess.run([
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def open(self, width: int, height: int):
+        self._shape = (height, width, 3)
+        self._stderr = tempfile.TemporaryFile(dir=os.path.dirname(self.out_path) or None)
+        self._proc = subprocess.Popen([
             "ffmpeg",
+            "-y",
+            "-v", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}",
             "-framerate", f"{self.fps}",
-            "-i", os.path.join(seqdir, "%08d.png"),
+            "-i", "pipe:0",
             "-pix_fmt", "yuv420p",
             "-c:v", "libx264",
             "-crf", "18",
             "-preset", "medium",
             self.out_path
-        ])
+        ], stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def write(self, frame: np.ndarray):
+        frame = np.asarray(frame)
+        if frame.dtype != np.uint8:
+            frame = (np.clip(frame, 0.0, 1.0) * 255.0).round().astype(np.uint8)
+        if self._proc is None:
+            self.open(frame.shape[1], frame.shape[0])
+        if frame.shape != self._shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match stream shape {self._shape}")
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            # ffmpeg is gone; its exit status and stderr say why.
+            raise RuntimeError(self._failure(self._proc.wait())) from None
+        self.count += 1
+
+    def close(self) -> tuple[str, str]:
+        if self._proc is None:
+            raise RuntimeError("No frames were written to the encoder")
+        self._close_stdin()
+        returncode = self._proc.wait()
+        message = self._failure(returncode) if returncode != 0 else None
+        self._release()
+        if message:
+            raise RuntimeError(message)
+        return "Encoding successful", self.out_path
+
+    def abort(self):
+        if self._proc is None:
+            return
+        # Kill first: closing stdin of a dead ffmpeg raises, and the process
+        # still has to be reaped.
+        self._proc.kill()
+        self._close_stdin()
+        self._proc.wait()
+        self._release()
+
+    def _close_stdin(self):
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def _failure(self, returncode: int) -> str:
+        self._stderr.seek(0)
+        message = self._stderr.read().decode(errors="replace").strip()
+        return f"ffmpeg exited with status {returncode}: {message}"
+
+    def _release(self):
+        self._proc = None
+        self._stderr.close()
+        self._stderr = None
+
+    def consume(self, frames: Iterable[np.ndarray]):
+        for frame in frames:
+            self.write(frame)
 
+    def encode_video(self) -> tuple[str, str]:
+        with self:
+            for frame in self.frames:
+                self.write(frame)
         return "Encoding successful", self.out_path
     
+class WindowPlanner:
+    # Peak inference bytes per output pixel per frame in the window. The
+    # starting value is a conservative guess; observe() replaces it with the
+    # measured figure after the first CUDA window and warm workers keep it.
+    bytes_per_pixel: float = 256.0
+
+    def __init__(self, overlap: int = 4, window: int | None = None, min_window: int = 8, max_window: int = 64, headroom: float = 0.7):
+        self.overlap = overlap
+        self.window = window
+        self.min_window = min_window
+        self.max_window = max_window
+        self.headroom = headroom
+
+    def available_memory(self) -> int:
+        if device == "cuda":
+            free, _ = torch.cuda.mem_get_info()
+            return free
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+    def frame_bytes(self, height: int, width: int, scale: float) -> float:
+        return height * width * scale * scale * WindowPlanner.bytes_per_pixel
+
+    def plan(self, height: int, width: int, scale: float) -> tuple[int, int]:
+        window = self.window
+        if window is None:
+            budget = self.available_memory() * self.headroom
+            window = int(budget // self.frame_bytes(height, width, scale))
+            window = max(self.min_window, min(self.max_window, window))
+        overlap = min(self.overlap, window // 2)
+        return window, window - overlap
+
+    def plan_tile(self, height: int, width: int, scale: float, window: int, multiple: int = 64, min_tile: int = 128) -> int | None:
+        budget = self.available_memory() * self.headroom
+        if window * self.frame_bytes(height, width, scale) <= budget:
+            return None
+        side = (budget / (window * scale * scale * WindowPlanner.bytes_per_pixel)) ** 0.5
+        return max(min_tile, int(side) // multiple * multiple)
+
+    def observe(self, peak_bytes: int, frames: int, height: int, width: int, scale: float):
+        if peak_bytes <= 0 or frames <= 0:
+            return
+        WindowPlanner.bytes_per_pixel = peak_bytes / (frames * height * width * scale * scale)
+
+class OverlapBlender:
+    """Stitches window outputs, cross-fading frames that two windows share.
+
+    The last `overlap` frames of each window are held back until the next
+    window arrives and are then blended with linearly ramped weights, so
+    every frame the pipeline produced contributes to the output.
+    """
+
+    def __init__(self, overlap: int):
+        self.overlap = overlap
+        self.end = 0
+        self.pending: list[np.ndarray] = []
+
+    def push(self, start: int, frames: list) -> list[np.ndarray]:
+        frames = [np.asarray(f) for f in frames]
+        shared = self.end - start
+        ready = []
+        if shared < len(self.pending):
+            ready += self.pending[:len(self.pending) - max(shared, 0)]
+            self.pending = self.pending[len(self.pending) - max(shared, 0):]
+        skip = max(shared - len(self.pending), 0)
+        frames = frames[skip:]
+        n = min(len(self.pending), len(frames))
+        for i in range(n):
+            w = (i + 1) / (n + 1)
+            ready.append(self._mix(self.pending[i], frames[i], w))
+        frames = frames[n:]
+        self.end = start + skip + n + len(frames)
+        hold = min(self.overlap, len(frames))
+        ready += frames[:len(frames) - hold]
+        self.pending = frames[len(frames) - hold:]
+        return ready
+
+    def flush(self) -> list[np.ndarray]:
+        ready, self.pending = self.pending, []
+        return ready
+
+    @staticmethod
+    def _mix(a: np.ndarray, b: np.ndarray, w: float) -> np.ndarray:
+        mixed = a.astype(np.float32) * (1.0 - w) + b.astype(np.float32) * w
+        if np.issubdtype(a.dtype, np.integer):
+            return np.clip(mixed.round(), 0, np.iinfo(a.dtype).max).astype(a.dtype)
+        return mixed.astype(a.dtype)
+
+class SpatialTiler:
+    """Runs a window through the pipeline as overlapping spatial tiles.
+
+    Each tile covers the whole window in time, so temporal context is kept;
+    tile outputs are feather-blended with weights that ramp across the
+    overlap on interior edges, which hides the seams.
+    """
+
+    def __init__(self, tile: int, overlap: int = 32):
+        self.tile = tile
+        self.overlap = overlap
+
+    def spans(self, size: int) -> list[tuple[int, int]]:
+        if size <= self.tile:
+            return [(0, size)]
+        step = self.tile - self.overlap
+        starts = list(range(0, size - self.tile, step)) + [size - self.tile]
+        return [(s, s + self.tile) for s in starts]
+
+    @staticmethod
+    def _ramp(length: int, ramp: int, lead: bool, trail: bool) -> np.ndarray:
+        w = np.ones(length, dtype=np.float32)
+        ramp = min(ramp, length // 2)
+        if ramp > 0:
+            edge = (np.arange(ramp, dtype=np.float32) + 1.0) / (ramp + 1.0)
+            if lead:
+                w[:ramp] = edge
+            if trail:
+                w[length - ramp:] = edge[::-1]
+        return w
+
+    def run(self, chunk, infer) -> list[np.ndarray]:
+        frames = [np.asarray(f) for f in chunk]
+        height, width = frames[0].shape[:2]
+        rows, cols = self.spans(height), self.spans(width)
+        if len(rows) == 1 and len(cols) == 1:
+            return infer(frames)
+
+        canvas = None
+        weight = None
+        for y0, y1 in rows:
+            for x0, x1 in cols:
+                out = [np.asarray(f) for f in infer([f[y0:y1, x0:x1] for f in frames])]
+                th, tw = out[0].shape[:2]
+                sy, sx = th / (y1 - y0), tw / (x1 - x0)
+                if canvas is None:
+                    canvas = np.zeros((len(out), round(height * sy), round(width * sx), out[0].shape[2]), dtype=np.float32)
+                    weight = np.zeros(canvas.shape[1:3] + (1,), dtype=np.float32)
+                    dtype = out[0].dtype
+                wy = self._ramp(th, round(self.overlap * sy), y0 > 0, y1 < height)
+                wx = self._ramp(tw, round(self.overlap * sx), x0 > 0, x1 < width)
+                mask = np.outer(wy, wx)[..., None]
+                oy, ox = round(y0 * sy), round(x0 * sx)
+                canvas[:, oy:oy + th, ox:ox + tw] += np.stack(out).astype(np.float32) * mask
+                weight[oy:oy + th, ox:ox + tw] += mask
+        canvas /= np.maximum(weight, 1e-6)
+        if np.issubdtype(dtype, np.integer):
+            canvas = np.clip(canvas.round(), 0, np.iinfo(dtype).max)
+        return list(canvas.astype(dtype))
+
+# The planner resets CUDA's peak counter before every window to measure it,
+# so the job-wide peak is carried across those resets here.
+_device_peak = 0
+
+def reset_device_peak(job: bool = False):
+    """Reset CUDA's peak memory counter; `job` also starts a new job-wide peak."""
+    global _device_peak
+    _device_peak = 0 if job else device_peak_bytes()
+    torch.cuda.reset_peak_memory_stats()
+
+def device_peak_bytes() -> int:
+    return max(_device_peak, torch.cuda.max_memory_allocated())
+
 class VSRWorker:
-    def __init__(self, frames, scale_factor: float = 2.0, num_inference_steps: int = 25, guidance_scale: float = 1.0, fps: int = 30):
+    def __init__(self, frames, scale_factor: float = 2.0, num_inference_steps: int = 25, guidance_scale: float = 1.0, fps: int = 30, window: int = 32, stride: int = 28, planner: WindowPlanner | None = None, tiler: SpatialTiler | None = None):
         self.frames = frames
         self.scale_factor = scale_factor
         self.num_inference_steps = num_inference_steps
         self.guidance_scale = guidance_scale
         self.fps = fps
+        self.window = window
+        self.stride = stride
+        self.planner = planner
+        self.tiler = tiler
+
+    def plan(self, height: int, width: int, tile: int | None = None):
+        if self.planner is not None:
+            self.window, self.stride = self.planner.plan(height, width, self.scale_factor)
+            tile = tile or self.planner.plan_tile(height, width, self.scale_factor, self.window)
+        if tile:
+            self.tiler = SpatialTiler(tile)
+        return self.window, self.stride
     
-    def _chunk(self, seq, window=32, stride=28):
+    def _chunk(self, seq, window=None, stride=None):
+        window = window or self.window
+        stride = stride or self.stride
         i = 0
         n = len(seq)
         while i < n:
@@ -132,48 +626,477 @@ class VSRWorker:
                 break
             i += stride
 
-    def run(self):
-        up_frames = []
+    def _infer(self, chunk, **pipe_kwargs):
+        measure = device == "cuda" and self.planner is not None
+        if measure:
+            reset_device_peak()
+            base = torch.cuda.memory_allocated()
+        with torch.inference_mode(), torch.autocast("cuda", enabled=(device == "cuda")):
+            out = loader.get()(list(chunk), **pipe_kwargs)
+        if measure:
+            height, width = np.asarray(chunk[0]).shape[:2]
+            peak = torch.cuda.max_memory_allocated() - base
+            self.planner.observe(peak, len(chunk), height, width, self.scale_factor)
+        return out.frames
+
+    def infer_window(self, chunk) -> list:
         pipe_kwargs = {
             "scale": self.scale_factor,
             "num_inference_steps": self.num_inference_steps,
             "guidance_scale": self.guidance_scale
         }
-        for start, end, chunk in self._chunk(self.frames):
-            with torch.inference_mode(), torch.autocast("cuda", enabled=(device == "cuda")):
-                out = pipe(chunk, **pipe_kwargs)
-            out_frames = out.frames
-            if start > 0:
-                overlap = start - (len(up_frames))
-                if overlap < 0:
-                    out_frames = out_frames[-(end - start - (len(up_frames) - start)):]
-            up_frames += out_frames
+        infer = lambda frames: self._infer(frames, **pipe_kwargs)
+        t0 = time.perf_counter()
+        out = self.tiler.run(chunk, infer) if self.tiler else infer(chunk)
+        metrics.window_seconds.observe(time.perf_counter() - t0)
+        return out
+
+    def stream(self, chunks=None) -> Iterator[np.ndarray]:
+        if chunks is None:
+            chunks = self._chunk(self.frames)
+        blender = OverlapBlender(self.window - self.stride)
+        for start, end, chunk in chunks:
+            yield from blender.push(start, self.infer_window(chunk))
+        yield from blender.flush()
+
+    def run(self, chunks=None, sink=None):
+        up_frames = []
+        for frame in self.stream(chunks):
+            if sink is None:
+                up_frames.append(frame)
+            else:
+                sink(frame)
         return up_frames
         
 
+_shard_pools: dict[tuple[int, int], mp.pool.Pool] = {}
+_shard_workers: dict[tuple, VSRWorker] = {}
+
+def _shard_init(threads: int):
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    loader.get()
+
+def _shard_infer(config: tuple, chunk: np.ndarray) -> tuple[list[np.ndarray], float]:
+    worker = _shard_workers.get(config)
+    if worker is None:
+        scale_factor, num_inference_steps, guidance_scale, tile = config
+        worker = VSRWorker(None, scale_factor, num_inference_steps, guidance_scale, tiler=SpatialTiler(tile) if tile else None)
+        _shard_workers[config] = worker
+    t0 = time.perf_counter()
+    out = [np.asarray(f) for f in worker.infer_window(list(chunk))]
+    return out, time.perf_counter() - t0
+
+class ShardedVSRWorker(VSRWorker):
+    """Runs windows on a pool of CPU processes, each with its own pipeline.
+
+    torch intra-op threading stops scaling after a few cores, so large CPU
+    hosts run several processes with a pinned thread count instead. Pools
+    are kept per (processes, threads) and reused across jobs so the model
+    is loaded once per process. Results come back in window order and are
+    stitched in the parent.
+    """
+
+    def __init__(self, *args, processes: int = 2, threads: int | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.processes = processes
+        self.threads = threads or max(1, (os.cpu_count() or 1) // processes)
+
+    def _pool(self) -> mp.pool.Pool:
+        key = (self.processes, self.threads)
+        if key not in _shard_pools:
+            ctx = mp.get_context("spawn")
+            _shard_pools[key] = ctx.Pool(self.processes, initializer=_shard_init, initargs=(self.threads,))
+        return _shard_pools[key]
+
+    def stream(self, chunks=None) -> Iterator[np.ndarray]:
+        if chunks is None:
+            chunks = self._chunk(self.frames)
+        pool = self._pool()
+        config = (self.scale_factor, self.num_inference_steps, self.guidance_scale, self.tiler.tile if self.tiler else None)
+        blender = OverlapBlender(self.window - self.stride)
+        inflight = deque()
+        for start, end, chunk in chunks:
+            inflight.append((start, pool.apply_async(_shard_infer, (config, np.asarray(chunk)))))
+            if len(inflight) >= self.processes:
+                start, result = inflight.popleft()
+                yield from blender.push(start, self._collect(result))
+        while inflight:
+            start, result = inflight.popleft()
+            yield from blender.push(start, self._collect(result))
+        yield from blender.flush()
+
+    @staticmethod
+    def _collect(result: mp.pool.AsyncResult) -> list[np.ndarray]:
+        out, seconds = result.get()
+        # Pool processes observe into their own registry, which is never pushed.
+        metrics.window_seconds.observe(seconds)
+        return out
+
+class ClassicUpscaler:
+    """Non-diffusion engine: Lanczos/bicubic resize, unsharp mask and an
+    optional motion-adaptive temporal denoise, vectorized with OpenCV.
+
+    It consumes the same (start, end, frames) windows as VSRWorker.stream,
+    without overlap, so it shares the decode and encode stages unchanged.
+    """
+
+    interpolations = {
+        "lanczos": cv2.INTER_LANCZOS4,
+        "bicubic": cv2.INTER_CUBIC
+    }
+
+    def __init__(self, scale_factor: float = 2.0, interpolation: str = "lanczos", sharpen: float = 0.5, denoise: float = 0.0, window: int = 16):
+        self.scale_factor = scale_factor
+        self.interpolation = self.interpolations[interpolation]
+        self.sharpen = sharpen
+        self.denoise = denoise
+        self.window = window
+        self.stride = window
+        self._prev = None
+
+    def _denoise(self, frame: np.ndarray) -> np.ndarray:
+        current = frame.astype(np.float32)
+        if self._prev is None:
+            self._prev = current
+            return frame
+        # Blend toward the previous output where the pixel barely moved;
+        # moving pixels keep the current value so motion does not ghost.
+        diff = np.abs(current - self._prev).max(axis=2, keepdims=True)
+        weight = self.denoise * np.clip(1.0 - diff / 24.0, 0.0, 1.0)
+        self._prev = current * (1.0 - weight) + self._prev * weight
+        return self._prev.round().astype(np.uint8)
+
+    def upscale(self, frame: np.ndarray) -> np.ndarray:
+        if self.denoise > 0:
+            frame = self._denoise(frame)
+        height, width = frame.shape[:2]
+        size = (round(width * self.scale_factor), round(height * self.scale_factor))
+        up = cv2.resize(frame, size, interpolation=self.interpolation)
+        if self.sharpen > 0:
+            blurred = cv2.GaussianBlur(up, (0, 0), sigmaX=self.scale_factor * 0.5)
+            up = cv2.addWeighted(up, 1.0 + self.sharpen, blurred, -self.sharpen, 0)
+        return up
+
+    def stream(self, chunks) -> Iterator[np.ndarray]:
+        for _, _, chunk in chunks:
+            for frame in chunk:
+                yield self.upscale(frame)
+
+class WindowPacker:
+    """Packs short clips that share a frame size into single pipeline calls.
+
+    Clips are laid end to end in one sequence of at most `window` frames.
+    Each clip boundary gets `guard` repeated edge frames on both sides, so a
+    clip's first and last frames see their own content as temporal
+    neighbours instead of the next clip; guard outputs are dropped when the
+    sequence is split back per clip.
+    """
+
+    def __init__(self, window: int, guard: int = 1):
+        self.window = window
+        self.guard = guard
+
+    def fits(self, frames: list) -> bool:
+        return len(frames) <= self.window
+
+    def pack(self, clips: dict) -> list[list]:
+        packs = []
+        by_shape: dict[tuple, list] = {}
+        for key, frames in clips.items():
+            by_shape.setdefault(np.asarray(frames[0]).shape, []).append(key)
+        for keys in by_shape.values():
+            current, size = [], 0
+            for key in keys:
+                need = len(clips[key]) + (2 * self.guard if current else 0)
+                if current and size + need > self.window:
+                    packs.append(current)
+                    current, size = [], 0
+                    need = len(clips[key])
+                current.append(key)
+                size += need
+            if current:
+                packs.append(current)
+        return packs
+
+    def run(self, keys: list, clips: dict, infer) -> dict:
+        sequence, spans = [], []
+        for i, key in enumerate(keys):
+            frames = list(clips[key])
+            if i > 0:
+                sequence += [clips[keys[i - 1]][-1]] * self.guard + [frames[0]] * self.guard
+            spans.append((len(sequence), len(sequence) + len(frames)))
+            sequence += frames
+        out = infer(sequence)
+        return {key: out[start:end] for key, (start, end) in zip(keys, spans)}
+
+def quality_meter(body: dict, tmpdir: str) -> QualityMeter | None:
+    """Build the QualityMeter a job asked for with `metrics_mode`; `fr`
+    downloads `reference_url` and streams its frames alongside the output."""
+    mode = body.get("metrics_mode") or "off"
+    if mode == "off":
+        return None
+    reference = None
+    if mode == "fr" and body.get("reference_url"):
+        refdir = os.path.join(tmpdir, "reference")
+        os.makedirs(refdir, exist_ok=True)
+        _, reference_path = VideoDownloader(body["reference_url"], refdir, client=s3_client).download()
+        reference = (chunk[0] for chunk in VideoPreprocessor(reference_path, refdir).stream_frames())
+    elif mode == "fr":
+        # Without ground truth there is nothing to compare against; still
+        # report the no-reference scores rather than failing the upscale.
+        mode = "nr_fast"
+    return QualityMeter(
+        mode,
+        reference,
+        sample_every=body.get("metrics_sample_every", 8),
+        batch_size=body.get("metrics_batch", 8),
+        device=device
+    )
+
+def batch_handler(body: dict) -> dict:
+    """Run several jobs sent as one RunPod job.
+
+    Clips that fit in one window are packed into shared pipeline calls, and
+    each pack is encoded and uploaded as soon as it is inferred. Longer
+    clips, and every clip on the classic engine, go through the streaming
+    single-job path one at a time, so decoded frames never pile up.
+    """
+    engine = body.get("engine", "stablevsr")
+    default_fps = body.get("fps", 30)
+    shared = {key: value for key, value in body.items() if key != "jobs"}
+    results = {}
+    paths = {}
+    caches = {}
+    timings = {}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        t0 = time.perf_counter()
+        for i, job in enumerate(body["jobs"]):
+            jobdir = os.path.join(tmpdir, str(i))
+            os.makedirs(jobdir)
+            try:
+                caches[i] = ResultCache(job["cache_url"], client=s3_client) if job.get("cache_url") else None
+                if caches[i] and caches[i].exists():
+                    _, info = caches[i].restore(job["output_url"])
+                    results[i] = {"job_id": job.get("job_id"), "status": "ok", "info": info}
+                    continue
+                _, paths[i] = VideoDownloader(job["video_url"], jobdir, client=s3_client).download()
+            except Exception as e:
+                results[i] = {"job_id": job.get("job_id"), "status": "error", "error": str(e)}
+        timings["download_s"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        short = {}
+        dedupers = {}
+        packs = []
+        if engine != "classic" and paths:
+            vsr_worker = VSRWorker(None, body.get("scale_factor", 2.0), body.get("num_inference_steps", 25), body.get("guidance_scale", 1.0), planner=WindowPlanner(window=body.get("window")))
+            probed = {}
+            for i, path in paths.items():
+                try:
+                    probed[i] = VideoPreprocessor(path, os.path.join(tmpdir, str(i)))
+                    probed[i].probe()
+                except Exception as e:
+                    probed.pop(i, None)
+                    results[i] = {"job_id": body["jobs"][i].get("job_id"), "status": "error", "error": str(e)}
+            if probed:
+                # Plan for the tallest and the widest clip, which may be different clips.
+                height = max(p.height for p in probed.values())
+                width = max(p.width for p in probed.values())
+                vsr_worker.plan(height, width, tile=body.get("tile"))
+            packer = WindowPacker(vsr_worker.window)
+            for i, preprocessor in probed.items():
+                # Container frame counts can be missing or wrong, so decode
+                # one frame past the window before trusting that a clip fits.
+                if preprocessor.frame_count and preprocessor.frame_count > packer.window:
+                    continue
+                try:
+                    frames = _decode_at_most(preprocessor, packer.window + 1)
+                except Exception as e:
+                    results[i] = {"job_id": body["jobs"][i].get("job_id"), "status": "error", "error": str(e)}
+                    continue
+                if not frames:
+                    results[i] = {"job_id": body["jobs"][i].get("job_id"), "status": "error", "error": "No frames decoded"}
+                elif packer.fits(frames):
+                    threshold = body["jobs"][i].get("dedup_threshold")
+                    if threshold is not None:
+                        dedupers[i] = FrameDeduper(threshold)
+                        frames = list(dedupers[i].filter(frames))
+                    short[i] = frames
+            packs = packer.pack(short)
+            for keys in packs:
+                outputs = packer.run(keys, short, vsr_worker.infer_window)
+                for i in keys:
+                    del short[i]
+                    results[i] = _finish_clip(body["jobs"][i], os.path.join(tmpdir, str(i)), outputs.pop(i), default_fps, caches[i], dedupers.get(i))
+
+        streamed = [i for i in paths if i not in results]
+        for i in streamed:
+            job = body["jobs"][i]
+            progress = ProgressReporter(job.get("progress_url"))
+            try:
+                result = _run_job(dict(shared, **job), progress, caches[i], video_path=paths[i])
+                results[i] = dict(result, job_id=job.get("job_id"))
+            except Exception as e:
+                results[i] = {"job_id": job.get("job_id"), "status": "error", "error": str(e)}
+            finally:
+                progress.close()
+        timings["process_s"] = time.perf_counter() - t0
+        timings["pipeline_calls"] = len(packs) + len(streamed)
+
+    return {"status": "ok", "results": [results[i] for i in sorted(results)], "timings": timings}
+
+def _decode_at_most(preprocessor: VideoPreprocessor, limit: int) -> list[np.ndarray]:
+    """Decode up to `limit` frames; a clip that reaches the limit is too long to pack."""
+    chunks = preprocessor.stream_frames()
+    try:
+        return [chunk[0].copy() for _, chunk in zip(range(limit), chunks)]
+    finally:
+        chunks.close()
+
+def _finish_clip(job: dict, jobdir: str, frames: list[np.ndarray], default_fps: int, result_cache: ResultCache | None, deduper: FrameDeduper | None = None) -> dict:
+    """Encode and upload one packed clip, expanding deduplicated frames back
+    and reporting progress the way a single job does."""
+    progress = ProgressReporter(job.get("progress_url"), total_frames=deduper.total if deduper else len(frames))
+    try:
+        meter = quality_meter(job, jobdir)
+        out_path = os.path.join(jobdir, os.path.basename(job["output_url"]))
+        if deduper is not None:
+            frames = deduper.expand(frames)
+        progress.stage("processing")
+        VideoEncoder(progress.track(meter.observe(frames) if meter else frames), out_path, job.get("fps", default_fps)).encode_video()
+        progress.stage("uploading")
+        _, info = VideoUploader(out_path, job["output_url"], client=s3_client).upload()
+        if result_cache:
+            result_cache.save(job["output_url"])
+        progress.stage("done")
+    except Exception as e:
+        return {"job_id": job.get("job_id"), "status": "error", "error": str(e)}
+    finally:
+        progress.close()
+    result = {"job_id": job.get("job_id"), "status": "ok", "info": info}
+    if deduper is not None:
+        result["frames"] = deduper.report()
+    if meter:
+        result["metrics"] = meter.report()
+    return result
+
 def handler(event, context):
     body = event["input"]
+    engine = "batch" if body.get("jobs") else body.get("engine", "stablevsr")
+    if device == "cuda":
+        reset_device_peak(job=True)
+    status = "error"
+    try:
+        result = _handle(event, body)
+        status = "cached" if "timings" not in result else "ok"
+        metrics.observe_job(
+            engine,
+            result.get("timings") or {},
+            frames=(result.get("frames") or {}).get("total"),
+            device_peak_bytes=device_peak_bytes() if device == "cuda" else None
+        )
+        return result
+    finally:
+        metrics.jobs_total.labels(engine, status).inc()
+        metrics.push()
+
+def _handle(event, body: dict) -> dict:
+    if body.get("jobs"):
+        return batch_handler(body)
+    output_url = body["output_url"]
+    cache_url = body.get("cache_url")
+
+    result_cache = ResultCache(cache_url, client=s3_client) if cache_url else None
+    if result_cache and result_cache.exists():
+        _, info = result_cache.restore(output_url)
+        return {"status": "ok", "info": info}
+
+    progress = ProgressReporter(body.get("progress_url"), job=event)
+    try:
+        result = _run_job(body, progress, result_cache)
+    finally:
+        progress.close()
+    return result
+
+def _run_job(body: dict, progress: ProgressReporter, result_cache: ResultCache | None, video_path: str | None = None) -> dict:
     video_url = body["video_url"]
     output_url = body["output_url"]
     fps = body.get("fps", 30)
     scale_factor = body.get("scale_factor", 2.0)
     num_inference_steps = body.get("num_inference_steps", 25)
     guidance_scale = body.get("guidance_scale", 1.0)
+    dedup_threshold = body.get("dedup_threshold")
+    engine = body.get("engine", "stablevsr")
+    processes = int(body.get("processes") or os.environ.get("VSR_PROCESSES", "1"))
 
+    timings = {}
     with tempfile.TemporaryDirectory() as tmpdir:
-        video_downloader = VideoDownloader(video_url, tmpdir, client=s3_client)
-        _, video_path = video_downloader.download()
-        video_preprocessor = VideoPreprocessor(video_path, tmpdir)
-        frames, _ = video_preprocessor.extract_frames()
-        vsr_worker = VSRWorker(frames, scale_factor, num_inference_steps, guidance_scale, fps)
-        frames = vsr_worker.run()
+        progress.stage("downloading")
+        t0 = time.perf_counter()
+        if video_path is not None:
+            video_preprocessor = VideoPreprocessor(video_path, tmpdir)
+        elif body.get("stream_input") and classify_url(video_url) == "http":
+            video_preprocessor = VideoPreprocessor(video_url, tmpdir, byte_source=RangeDownloader(video_url).iter_bytes())
+        else:
+            video_downloader = VideoDownloader(video_url, tmpdir, client=s3_client)
+            _, video_path = video_downloader.download()
+            video_preprocessor = VideoPreprocessor(video_path, tmpdir)
+        meter = quality_meter(body, tmpdir)
+        timings["download_s"] = time.perf_counter() - t0
+        width, height, _ = video_preprocessor.probe()
+        if engine == "classic":
+            vsr_worker = ClassicUpscaler(
+                scale_factor,
+                interpolation=body.get("interpolation", "lanczos"),
+                sharpen=body.get("sharpen", 0.5),
+                denoise=body.get("denoise", 0.0)
+            )
+        else:
+            sharded = device == "cpu" and processes > 1
+            planner = WindowPlanner(overlap=body.get("window_overlap", 4), window=body.get("window"), headroom=0.7 / (processes if sharded else 1))
+            if sharded:
+                vsr_worker = ShardedVSRWorker(None, scale_factor, num_inference_steps, guidance_scale, fps, planner=planner, processes=processes)
+            else:
+                vsr_worker = VSRWorker(None, scale_factor, num_inference_steps, guidance_scale, fps, planner=planner)
+            vsr_worker.plan(height, width, tile=body.get("tile"))
+        deduper = FrameDeduper(dedup_threshold) if dedup_threshold is not None else None
         out_path = os.path.join(tmpdir, os.path.basename(output_url))
-        encoder = VideoEncoder(frames, out_path, fps)
-        _ = encoder.encode_video()
+        progress.total_frames = video_preprocessor.frame_count
+        progress.stage("processing")
+        expand = deduper.expand if deduper else iter
+        with VideoEncoder(None, out_path, fps) as encoder:
+            pipeline = (
+                Pipeline()
+                .add_stage("decode", lambda _: video_preprocessor.iter_window_copies(vsr_worker.window, vsr_worker.stride, deduper), maxsize=2)
+                .add_stage("infer", vsr_worker.stream, maxsize=vsr_worker.window)
+            )
+            # Scoring gets its own stage so it overlaps the encoder instead of
+            # adding to it, and sees the frames exactly as they are encoded.
+            if meter is not None:
+                pipeline.add_stage("quality", lambda frames: meter.observe(expand(frames)), maxsize=vsr_worker.window)
+                pipeline.add_stage("encode", lambda frames: encoder.consume(progress.track(frames)))
+            else:
+                pipeline.add_stage("encode", lambda frames: encoder.consume(progress.track(expand(frames))))
+            timings["pipeline"] = pipeline.run()
+        progress.stage("uploading")
+        t0 = time.perf_counter()
         video_uploader = VideoUploader(out_path, output_url, client=s3_client)
         _, info = video_uploader.upload()
+        if result_cache:
+            result_cache.save(output_url)
+        timings["upload_s"] = time.perf_counter() - t0
 
-    return {"status": "ok", "info": info}
+    if engine != "classic":
+        timings["model_load"] = loader.timings
+    result = {"status": "ok", "info": info, "timings": timings}
+    if deduper is not None:
+        result["frames"] = deduper.report()
+    if meter is not None:
+        result["metrics"] = meter.report()
+    progress.stage("done")
+    return result
 
 if __name__ == "__main__":
     runpod.serverless.start({"handler": handler})
\ No newline at end of file